@@ -0,0 +1,216 @@
+########################################################################################################################
+# File name: Array_IO.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x (ArcGIS Pro)
+# Description:
+# Functions for moving data between feature classes and NumPy arrays in bulk.
+# These are used by the processing engines (Spatial_Engines.py) so that the parcels for a county are read once,
+# processed as whole arrays, and written back in a single update cursor pass rather than one CalculateField per value.
+# Requires shapely 2.x in the ArcGIS Pro python environment (clone the default environment and add it).
+########################################################################################################################
+
+import arcpy
+import numpy as np
+import shapely
+import Reprojection
+
+# Value used in place of <null> when reading SHORT requirement & exemption fields into NumPy arrays.
+null_value = -1
+
+
+def read_centroids(input_fc, where_clause=None, spatial_reference=None):
+    """ Returns the OBJECTIDs and an (n, 2) array with the centroid coordinates of each feature in the input. """
+
+    array = arcpy.da.FeatureClassToNumPyArray(input_fc, ["OID@", "SHAPE@XY"], where_clause=where_clause, spatial_reference=spatial_reference)
+
+    return array["OID@"], array["SHAPE@XY"]
+
+
+def search_cursor(input_table, fields, where_clause=None, spatial_reference=None, transformation=None):
+    """ Returns a search cursor. If a spatial reference is provided, the geometries are projected to it as they are read,
+        with the datum transformation if one is provided. The transformation is only set in the environment while the
+        cursor is created (the cursor keeps it), so it doesn't change how other cursors and tools project.
+    """
+
+    if not transformation:
+        return arcpy.da.SearchCursor(input_table, fields, where_clause, spatial_reference)
+
+    with arcpy.EnvManager(geographicTransformations=transformation):
+        return arcpy.da.SearchCursor(input_table, fields, where_clause, spatial_reference)
+
+
+def read_geometries(input_fc, where_clause=None, spatial_reference=None, transformation=None):
+    """ Returns the OBJECTIDs and an array of shapely geometries for each feature in the input.
+        If a spatial reference is provided, the geometries are projected to it as they are read (see search_cursor).
+        Features with an empty geometry are returned as None.
+    """
+
+    oids = []
+    wkbs = []
+    with search_cursor(input_fc, ["OID@", "SHAPE@WKB"], where_clause, spatial_reference, transformation) as sc:
+        for row in sc:
+            oids.append(row[0])
+            wkbs.append(bytes(row[1]) if row[1] else None)
+
+    return np.array(oids, dtype=np.int64), shapely.from_wkb(np.array(wkbs, dtype=object))
+
+
+def iter_geometries(input_fc, batch_size=100000, where_clause=None, spatial_reference=None, transformation=None):
+    """ Reads the input in a single cursor pass, yielding the OBJECTIDs and shapely geometries of batch_size features at
+        a time. Used when the geometries for a whole county don't need to be held in memory at once.
+        Features with an empty geometry are returned as None.
+    """
+
+    oids = []
+    wkbs = []
+    with search_cursor(input_fc, ["OID@", "SHAPE@WKB"], where_clause, spatial_reference, transformation) as sc:
+        for row in sc:
+            oids.append(row[0])
+            wkbs.append(bytes(row[1]) if row[1] else None)
+            if len(oids) == batch_size:
+                yield np.array(oids, dtype=np.int64), shapely.from_wkb(np.array(wkbs, dtype=object))
+                oids = []
+                wkbs = []
+
+    if oids:
+        yield np.array(oids, dtype=np.int64), shapely.from_wkb(np.array(wkbs, dtype=object))
+
+
+def projection_for_reading(input_fc, output_spatial_reference):
+    """ Returns how to project the input's geometries to the output spatial reference (Teale Albers):
+        (spatial reference to read the geometries in, Reprojection source to project them from after they're read,
+        datum transformation to read them with).
+        If Reprojection supports the input's coordinate system, the geometries are read as they are and projected with
+        Reprojection.project_geometries (the spatial reference and transformation are None). Otherwise arcpy projects
+        them as they're read (the source is None), with the datum transformation from Reprojection.datum_transformation
+        (pass it to search_cursor).
+    """
+
+    input_spatial_reference = arcpy.Describe(input_fc).spatialReference
+    source = Reprojection.source_crs(input_spatial_reference)
+    if source:
+        return None, source, None
+
+    return output_spatial_reference, None, Reprojection.datum_transformation(input_spatial_reference)
+
+
+def iter_projected_geometries(input_fc, output_spatial_reference, batch_size=100000, where_clause=None, pool=None):
+    """ Same as iter_geometries, with the geometries projected to the output spatial reference (Teale Albers) as they're
+        read (see projection_for_reading). If a process pool is provided, each batch is projected across the pool.
+    """
+
+    spatial_reference, source, transformation = projection_for_reading(input_fc, output_spatial_reference)
+    for oids, geometries in iter_geometries(input_fc, batch_size, where_clause, spatial_reference, transformation):
+        if source:
+            geometries = Reprojection.project_geometries(geometries, source, pool=pool)
+        yield oids, geometries
+
+
+def read_projected_geometries(input_fc, output_spatial_reference, where_clause=None):
+    """ Same as read_geometries, with the geometries projected to the output spatial reference (Teale Albers). """
+
+    spatial_reference, source, transformation = projection_for_reading(input_fc, output_spatial_reference)
+    oids, geometries = read_geometries(input_fc, where_clause, spatial_reference, transformation)
+    if source:
+        geometries = Reprojection.project_geometries(geometries, source)
+
+    return oids, geometries
+
+
+def iter_columns(input_table, fields, batch_size=1000000, where_clause=None, spatial_reference=None):
+    """ Reads the input in a single cursor pass, yielding a dictionary of field name: NumPy array for batch_size rows at
+        a time. Fields can include tokens (e.g., "OID@", or "SHAPE@XY", which is returned as an (n, 2) array).
+        <null> values are returned as None (in object arrays).
+    """
+
+    rows = []
+    with arcpy.da.SearchCursor(input_table, fields, where_clause, spatial_reference) as sc:
+        for row in sc:
+            rows.append(row)
+            if len(rows) == batch_size:
+                yield rows_to_columns(fields, rows)
+                rows = []
+
+    if rows:
+        yield rows_to_columns(fields, rows)
+
+
+def rows_to_columns(fields, rows):
+    """ Converts a list of cursor rows to a dictionary of field name: NumPy array. """
+
+    columns = {}
+    for i, field in enumerate(fields):
+        values = [row[i] for row in rows]
+        if field == "SHAPE@XY":
+            columns[field] = np.array([value if value else (np.nan, np.nan) for value in values], dtype=np.float64)
+        elif any(value is None for value in values):
+            columns[field] = np.array(values, dtype=object)
+        else:
+            columns[field] = np.array(values)
+
+    return columns
+
+
+def read_columns(input_table, fields, where_clause=None):
+    """ Returns the OBJECTIDs and a dictionary of field name: NumPy array for the fields requested.
+        <null> values in integer fields are read as null_value.
+    """
+
+    field_types = dict((field.name, field.type) for field in arcpy.ListFields(input_table))
+    null_values = dict((field, null_value) for field in fields if field_types.get(field) in ("SmallInteger", "Integer"))
+
+    array = arcpy.da.TableToNumPyArray(input_table, ["OID@"] + list(fields), where_clause=where_clause, null_value=null_values)
+
+    return array["OID@"], dict((field, array[field]) for field in fields)
+
+
+def write_columns(input_table, oids, columns, where_clause=None):
+    """ Writes a dictionary of field name: NumPy array back to the input table in a single update cursor pass.
+        Rows are matched on OBJECTID, so the arrays must be in the same order as oids.
+        null_value in an integer array and NaN in a float array are written as <null>. The fields must already exist.
+        If a where clause is provided (e.g., the range of oids), only the rows it selects are read by the update cursor.
+    """
+
+    fields = list(columns.keys())
+    position = dict(zip(oids.tolist(), range(len(oids))))
+
+    values = []
+    for field in fields:
+        column = columns[field]
+        if column.dtype.kind in ("i", "u"):
+            values.append([None if value == null_value else value for value in column.tolist()])
+        elif column.dtype.kind == "f":
+            values.append([None if value != value else value for value in column.tolist()])
+        else:
+            values.append(column.tolist())
+
+    with arcpy.da.UpdateCursor(input_table, ["OID@"] + fields, where_clause) as uc:
+        for row in uc:
+            i = position.get(row[0])
+            if i is not None:
+                uc.updateRow([row[0]] + [column[i] for column in values])
+
+
+def raster_window_reader(input_raster):
+    """ Returns a function that reads a window of a raster into a boolean NumPy array (True where the cell has data),
+        followed by the raster's grid: x origin (left), y origin (top), cell size, number of columns, number of rows,
+        and spatial reference. The read_window function takes the column and row of the top left cell of the window
+        (row 0 is the top of the raster) and the number of columns and rows to read.
+    """
+
+    raster = arcpy.Raster(input_raster)
+    x_origin = raster.extent.XMin
+    y_origin = raster.extent.YMax
+    cell_size = raster.meanCellWidth
+    no_data_value = raster.noDataValue
+
+    def read_window(column, row, columns, rows):
+        # The lower left corner is moved slightly inside the window so that it can't snap to a neighboring cell.
+        lower_left_corner = arcpy.Point(x_origin + (column + 0.01) * cell_size, y_origin - (row + rows - 0.01) * cell_size)
+        values = arcpy.RasterToNumPyArray(raster, lower_left_corner, columns, rows)
+        if no_data_value is None:
+            return np.ones(values.shape, dtype=bool)
+        return values != no_data_value
+
+    return read_window, x_origin, y_origin, cell_size, raster.width, raster.height, raster.spatialReference
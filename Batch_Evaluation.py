@@ -0,0 +1,153 @@
+########################################################################################################################
+# File name: Batch_Evaluation.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x
+# Description:
+# Screens a CSV of APNs, parcel ids, or coordinates against the parcel lookup index (see Parcel_Lookup_Service.py) and
+# writes a result CSV with the county, parcel id, fips_apn, and requirement & exemption values of the matching parcels.
+# Rows are read, looked up, and written chunk_size rows at a time, so memory use doesn't depend on the size of the CSV
+# or the counties (the index is memory-mapped).
+# Input columns (case insensitive, the first one found is used for each row):
+# - fips_apn
+# - cbi_parcel_id_fips_apn_oid (or parcel_id)
+# - longitude and latitude (or lon and lat) in decimal degrees (NAD83, or WGS84 with the datum option)
+# Each input row is written once per matching parcel (an APN can have more than one parcel), with the input columns
+# first, then match ("fips_apn", "parcel_id", "point", "not found", or "invalid") and the parcel columns (prefixed with
+# parcel_ if an input column has the same name).
+# Usage: python Batch_Evaluation.py <index folder> <input csv> <output csv> [datum (NAD83 or WGS84)]
+# Also available from the lookup server: POST /batch (CSV body, result CSV streamed back).
+########################################################################################################################
+
+import csv
+import sys
+import time
+import numpy as np
+import Reprojection
+
+# Number of input rows looked up at a time.
+chunk_size = 10000
+
+apn_columns = ["fips_apn"]
+parcel_id_columns = ["cbi_parcel_id_fips_apn_oid", "parcel_id"]
+longitude_columns = ["longitude", "lon"]
+latitude_columns = ["latitude", "lat"]
+
+
+def find_column(fieldnames, names):
+    """ Returns the input column with one of the names (case insensitive), or None. """
+
+    lower_fieldnames = dict((fieldname.strip().lower(), fieldname) for fieldname in fieldnames)
+    for name in names:
+        if name in lower_fieldnames:
+            return lower_fieldnames[name]
+
+    return None
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def evaluate_chunk(parcel_index, rows, fieldnames, columns, datum):
+    """ Returns the output rows (lists) for a chunk of input rows (dictionaries). """
+
+    apn_column, parcel_id_column, longitude_column, latitude_column = columns
+
+    # Project the coordinates for the whole chunk at once.
+    if longitude_column and latitude_column:
+        longitudes = np.array([to_float(row.get(longitude_column)) for row in rows])
+        latitudes = np.array([to_float(row.get(latitude_column)) for row in rows])
+        if datum.upper() == "WGS84":
+            longitudes, latitudes = Reprojection.wgs84_to_nad83(longitudes, latitudes)
+        xs, ys = Reprojection.geographic_to_teale_albers(longitudes, latitudes)
+
+    empty_parcel = [""] * (3 + len(parcel_index.value_fields))
+
+    output_rows = []
+    for i, row in enumerate(rows):
+        input_values = [row.get(fieldname, "") for fieldname in fieldnames]
+
+        if apn_column and row.get(apn_column):
+            match = "fips_apn"
+            parcel_rows = parcel_index.rows_for_key("fips_apn", row[apn_column].strip())
+        elif parcel_id_column and row.get(parcel_id_column):
+            match = "parcel_id"
+            parcel_rows = parcel_index.rows_for_key("parcel_id", row[parcel_id_column].strip())
+        elif longitude_column and latitude_column and np.isfinite(xs[i]) and np.isfinite(ys[i]):
+            match = "point"
+            parcel_rows = parcel_index.rows_at_point(float(xs[i]), float(ys[i]))
+        else:
+            output_rows.append(input_values + ["invalid"] + empty_parcel)
+            continue
+
+        if not parcel_rows:
+            output_rows.append(input_values + ["not found"] + empty_parcel)
+
+        for parcel_row in parcel_rows:
+            parcel = parcel_index.record(parcel_row)
+            output_rows.append(input_values + [match] + ["" if value is None else value for value in parcel.values()])
+
+    return output_rows
+
+
+def input_columns(fieldnames):
+    """ Returns the [fips_apn, parcel id, longitude, latitude] columns found in the input CSV's header (None where a
+        column isn't found). Raises a ValueError if there's nothing to look up.
+    """
+
+    columns = [find_column(fieldnames, apn_columns), find_column(fieldnames, parcel_id_columns), find_column(fieldnames, longitude_columns), find_column(fieldnames, latitude_columns)]
+    if not any(columns[:2]) and not all(columns[2:]):
+        raise ValueError("The input CSV needs a fips_apn, cbi_parcel_id_fips_apn_oid, or longitude and latitude column.")
+
+    return columns
+
+
+def evaluate(parcel_index, input_lines, output_file, datum="NAD83"):
+    """ Screens the rows of an input CSV (an iterable of lines, e.g., an open file) against the index and writes the
+        result CSV to output_file (an open text file). Returns the number of input rows.
+    """
+
+    reader = csv.DictReader(input_lines)
+    fieldnames = reader.fieldnames or []
+    columns = input_columns(fieldnames)
+
+    writer = csv.writer(output_file, lineterminator="\n")
+    # Parcel columns with the same name as an input column (e.g., fips_apn) are prefixed with parcel_.
+    parcel_fieldnames = ["county_name", "cbi_parcel_id_fips_apn_oid", "fips_apn"] + list(parcel_index.value_fields)
+    writer.writerow(fieldnames + ["match"] + [fieldname if fieldname not in fieldnames else "parcel_" + fieldname for fieldname in parcel_fieldnames])
+
+    number_of_rows = 0
+    chunk = []
+    for row in reader:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            writer.writerows(evaluate_chunk(parcel_index, chunk, fieldnames, columns, datum))
+            number_of_rows += len(chunk)
+            chunk = []
+
+    if chunk:
+        writer.writerows(evaluate_chunk(parcel_index, chunk, fieldnames, columns, datum))
+        number_of_rows += len(chunk)
+
+    return number_of_rows
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 4:
+        print("Usage: python Batch_Evaluation.py <index folder> <input csv> <output csv> [datum (NAD83 or WGS84)]")
+        sys.exit(1)
+
+    import Parcel_Lookup_Service
+
+    start = time.perf_counter()
+    index = Parcel_Lookup_Service.ParcelIndex(sys.argv[1])
+    with open(sys.argv[2], "r", newline="") as input_csv, open(sys.argv[3], "w", newline="") as output_csv:
+        rows_evaluated = evaluate(index, input_csv, output_csv, sys.argv[4] if len(sys.argv) > 4 else "NAD83")
+
+    seconds = time.perf_counter() - start
+    print(str(rows_evaluated) + " rows evaluated in " + "{:.1f}".format(seconds) + " seconds (" + "{:.0f}".format(rows_evaluated / seconds if seconds > 0 else 0) + " rows/sec)")
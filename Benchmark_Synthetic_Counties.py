@@ -0,0 +1,324 @@
+########################################################################################################################
+# File name: Benchmark_Synthetic_Counties.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x
+# Description:
+# Benchmarks the requirement and exemption engines on synthetic counties, so changes to the engines can be measured
+# without the real parcels (on the P: drive) or ArcGIS. Runs on any machine with numpy, shapely 2.x, and pyarrow.
+# For each county size, a synthetic parcel fabric is generated (irregular quadrilateral parcels on a jittered grid),
+# along with matching reference layers: city boundaries and other "center in" layers, hazard zones and other intersect
+# layers, a landslide hazard raster, and transit stops. The following are then run and timed:
+# - Centroid requirements (0.1, 2.1 - 2.5, 2.7): Spatial_Engines.points_in_polygon_layers
+# - Intersect requirements (8.5, 8.6, 9.3, 9.4, 9.6 - 9.8): Spatial_Engines.polygons_intersect_index
+# - Landslide requirement (9.5): Spatial_Engines.count_raster_cells_in_polygons, on the 10 m raster and on the same
+#   raster at 1 m cells (read window by window without creating it, like a statewide 1 m raster on the network). The
+#   number of windows read at 1 m is checked against the number of tiles the engine should need.
+# - Exemptions: Exemption_Engine (same exemptions dictionary structure as the main script)
+# - Dev team tables: Parquet_Export
+# Requirements calculated by the ArcGIS models and the file geodatabase writers require arcpy and aren't benchmarked.
+# Usage: python Benchmark_Synthetic_Counties.py [number of parcels ...] (default: 10000 100000 1000000)
+########################################################################################################################
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import shapely
+import Exemption_Engine
+import Parquet_Export
+import Profiling
+import Spatial_Engines
+
+# County sizes (number of parcels) to benchmark if none are given on the command line.
+default_county_sizes = [10000, 100000, 1000000]
+
+# Average parcel width (meters) and landslide raster cell size (meters).
+parcel_size = 40
+landslide_cell_size = 10
+# The landslide raster is also benchmarked at this cell size (meters, must divide landslide_cell_size).
+landslide_fine_cell_size = 1
+landslide_window_size = 4096
+
+# Random seed, so every run benchmarks the same counties.
+seed = 2026
+
+# If set, the timings are also recorded in a profiling history database (see Profiling.py), so a benchmark run can be
+# compared with previous ones: python Profiling.py report <profiling_db>
+profiling_db = None
+
+# Synthetic reference layers: name: [number of polygons per 10,000 parcels, min radius, max radius (in parcels)].
+centroid_layers = {
+    "0.1": [2, 10, 60],
+    "2.1": [2, 10, 60],
+    "2.2": [2, 10, 80],
+    "2.3": [4, 5, 40],
+    "2.4": [4, 5, 40],
+    "2.5": [1, 40, 120],
+    "2.7": [3, 10, 60],
+}
+intersect_layers = {
+    "8.5": [40, 1, 8],
+    "8.6": [20, 2, 15],
+    "9.3": [10, 5, 40],
+    "9.4": [15, 2, 20],
+    "9.6": [2, 5, 30],
+    "9.7": [1, 10, 50],
+    "9.8": [8, 3, 25],
+}
+landslide_area_percent_threshold = 20
+
+# Transit stops per 10,000 parcels.
+transit_stop_density = 30
+
+# Same structure as the exemptions dictionary in Calculate_CEQA_Requirements_and_Exemptions_Statewide.py.
+exemptions = {
+    "21159.24": ["2.1", "3.1", "8.1", "8.2", "8.3", "8.5", "9.2", "9.3", "9.4", "9.5", "9.6"],
+    "21155.1": ["2.5", ["3.2", "3.13", "3.14"], "8.1", "8.2", "8.3", "8.5", "9.2", "9.3", "9.4", "9.5"],
+    "21155.2": ["2.5", ["3.1", "3.4", "3.9", "3.12"]],
+    "21155.4": ["2.5", "2.6", "3.3"],
+    "21094.5": ["2.2", ["3.1", "3.5", "3.8", "3.10", "3.11"]],
+    "65457": ["2.6"],
+    "15332": ["2.3", "8.5"],
+    "21159.25": ["2.4", "2.7", "8.5"],
+    "21099": ["3.3"],
+    "21159.28": ["2.5"],
+    "15064.3": [["3.1", "3.5", "3.6"]],
+}
+
+
+def requirement_field_name(requirement_id):
+    """ Returns the name of the field for a synthetic requirement (e.g., 9.5 -> R_9_5). """
+
+    return "R_" + requirement_id.replace(".", "_")
+
+
+def generate_parcels(number_of_parcels, random):
+    """ Returns an array of synthetic parcel polygons (irregular quadrilaterals on a jittered grid) and the extent of
+        the county (xmin, ymin, xmax, ymax).
+    """
+
+    columns = int(np.ceil(np.sqrt(number_of_parcels)))
+    rows = int(np.ceil(number_of_parcels / float(columns)))
+
+    # Jitter the grid vertices so parcels are irregular but still share their edges (like a real parcel fabric).
+    x = np.arange(columns + 1) * parcel_size
+    y = np.arange(rows + 1) * parcel_size
+    vertex_x, vertex_y = np.meshgrid(x, y)
+    vertex_x = vertex_x + random.uniform(-0.3, 0.3, vertex_x.shape) * parcel_size
+    vertex_y = vertex_y + random.uniform(-0.3, 0.3, vertex_y.shape) * parcel_size
+
+    coordinates = np.empty((rows, columns, 5, 2))
+    for corner, (row_offset, column_offset) in enumerate([(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)]):
+        coordinates[:, :, corner, 0] = vertex_x[row_offset:row_offset + rows, column_offset:column_offset + columns]
+        coordinates[:, :, corner, 1] = vertex_y[row_offset:row_offset + rows, column_offset:column_offset + columns]
+
+    parcels = shapely.polygons(coordinates.reshape(-1, 5, 2)[:number_of_parcels])
+
+    return parcels, (0.0, 0.0, columns * parcel_size, rows * parcel_size)
+
+
+def generate_polygon_layer(number_of_parcels, extent, density, min_radius, max_radius, random):
+    """ Returns an array of irregular polygons (buffered, stretched points) scattered across the county extent. """
+
+    number_of_polygons = max(1, int(density * number_of_parcels / 10000.0))
+    x = random.uniform(extent[0], extent[2], number_of_polygons)
+    y = random.uniform(extent[1], extent[3], number_of_polygons)
+    radius = random.uniform(min_radius, max_radius, number_of_polygons) * parcel_size
+
+    polygons = shapely.buffer(shapely.points(x, y), radius, quad_segs=16)
+
+    # Stretch and rotate each polygon a little so they aren't all circles.
+    stretched = []
+    for polygon, angle, stretch in zip(polygons, random.uniform(0, np.pi, number_of_polygons), random.uniform(0.4, 1.0, number_of_polygons)):
+        coordinates = shapely.get_coordinates(polygon)
+        center = coordinates.mean(axis=0)
+        offset = coordinates - center
+        offset[:, 1] *= stretch
+        rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        stretched.append(shapely.polygons(offset.dot(rotation.T) + center))
+
+    return np.array(stretched, dtype=object)
+
+
+def generate_landslide_raster(extent, random):
+    """ Returns a boolean raster (True = landslide hazard cell) covering the county extent, with hazard cells in
+        clusters (a thresholded coarse random field, scaled up to the cell size), plus its x origin (left) and y origin
+        (top).
+    """
+
+    raster_columns = int(np.ceil((extent[2] - extent[0]) / landslide_cell_size)) + 1
+    raster_rows = int(np.ceil((extent[3] - extent[1]) / landslide_cell_size)) + 1
+
+    block = 16
+    coarse = random.uniform(0, 1, (raster_rows // block + 1, raster_columns // block + 1)) > 0.85
+    raster = np.kron(coarse, np.ones((block, block), dtype=bool))[:raster_rows, :raster_columns]
+
+    return raster, extent[0], extent[3] + landslide_cell_size
+
+
+def generate_transit_stops(number_of_parcels, extent, random):
+    """ Returns an (n, 2) array of transit stop coordinates, mostly along a few synthetic corridors. """
+
+    number_of_stops = max(1, int(transit_stop_density * number_of_parcels / 10000.0))
+    corridor_count = max(1, number_of_stops // 50)
+
+    corridor_y = random.uniform(extent[1], extent[3], corridor_count)
+    stop_corridors = random.randint(0, corridor_count, number_of_stops)
+    x = random.uniform(extent[0], extent[2], number_of_stops)
+    y = corridor_y[stop_corridors] + random.normal(0, 2 * parcel_size, number_of_stops)
+
+    return np.column_stack([x, y])
+
+
+def run_step(results, profiler, county, step, number_of_parcels, function, *args):
+    """ Runs and times a benchmark step. Returns the result of the function. """
+
+    print("Running " + step + "...")
+    start = time.perf_counter()
+    if profiler:
+        with profiler.step(county, step, number_of_parcels):
+            result = function(*args)
+    else:
+        result = function(*args)
+    seconds = time.perf_counter() - start
+
+    results.append([county, step, number_of_parcels, seconds])
+
+    return result
+
+
+def benchmark_county(number_of_parcels, results, profiler, output_folder):
+    """ Generates a synthetic county and benchmarks each engine on it. """
+
+    random = np.random.RandomState(seed + number_of_parcels)
+    county = "synthetic_" + str(number_of_parcels)
+
+    print("\nGenerating " + county + "...")
+    generate_start = time.perf_counter()
+    parcels, extent = generate_parcels(number_of_parcels, random)
+    centroid_polygon_layers = [generate_polygon_layer(number_of_parcels, extent, density, min_radius, max_radius, random) for density, min_radius, max_radius in centroid_layers.values()]
+    intersect_polygon_layers = [generate_polygon_layer(number_of_parcels, extent, density, min_radius, max_radius, random) for density, min_radius, max_radius in intersect_layers.values()]
+    landslide_raster, x_origin, y_origin = generate_landslide_raster(extent, random)
+    transit_stops = generate_transit_stops(number_of_parcels, extent, random)
+    print("Generated in " + "{:.1f}".format(time.perf_counter() - generate_start) + " seconds (" + str(len(transit_stops)) + " transit stops).")
+
+    columns = {}
+
+    # Centroid requirements.
+    def centroid_requirements():
+        centroids = shapely.get_coordinates(shapely.centroid(parcels))
+        return Spatial_Engines.points_in_polygon_layers(centroids, centroid_polygon_layers)
+
+    hits = run_step(results, profiler, county, "centroid_engine", number_of_parcels, centroid_requirements)
+    for layer_index, requirement_id in enumerate(centroid_layers):
+        columns[requirement_field_name(requirement_id)] = hits[layer_index].astype(np.int16)
+
+    # Intersect requirements.
+    def intersect_requirements():
+        polygon_index = Spatial_Engines.build_polygon_index(intersect_polygon_layers)
+        batch_hits = []
+        for start in range(0, len(parcels), 100000):
+            batch_hits.append(Spatial_Engines.polygons_intersect_index(parcels[start:start + 100000], polygon_index))
+        return np.concatenate(batch_hits, axis=1)
+
+    hits = run_step(results, profiler, county, "intersect_engine", number_of_parcels, intersect_requirements)
+    for layer_index, requirement_id in enumerate(intersect_layers):
+        columns[requirement_field_name(requirement_id)] = np.where(hits[layer_index], 0, 1).astype(np.int16)
+
+    # Landslide requirement.
+    def landslide_requirement():
+        def read_window(column, row, window_columns, window_rows):
+            return landslide_raster[row:row + window_rows, column:column + window_columns]
+
+        counts = Spatial_Engines.count_raster_cells_in_polygons(parcels, read_window, x_origin, y_origin, landslide_cell_size, landslide_raster.shape[1], landslide_raster.shape[0], landslide_window_size)
+        percent = counts * landslide_cell_size ** 2 / shapely.area(parcels) * 100
+
+        return np.where((counts > 0) & (percent >= landslide_area_percent_threshold), 0, 1).astype(np.int16)
+
+    columns[requirement_field_name("9.5")] = run_step(results, profiler, county, "landslide_zonal_engine", number_of_parcels, landslide_requirement)
+
+    # Landslide requirement on the raster at the fine cell size. Each window is scaled up from the 10 m raster as it's
+    # read, and the reads are counted.
+    scale = int(round(landslide_cell_size / landslide_fine_cell_size))
+    fine_columns = landslide_raster.shape[1] * scale
+    fine_rows = landslide_raster.shape[0] * scale
+    window_reads = []
+
+    def landslide_requirement_fine():
+        def read_window(column, row, window_columns, window_rows):
+            window_reads.append([window_columns, window_rows])
+            return landslide_raster[np.ix_(np.arange(row, row + window_rows) // scale, np.arange(column, column + window_columns) // scale)]
+
+        counts = Spatial_Engines.count_raster_cells_in_polygons(parcels, read_window, x_origin, y_origin, landslide_fine_cell_size, fine_columns, fine_rows, landslide_window_size)
+        percent = counts * landslide_fine_cell_size ** 2 / shapely.area(parcels) * 100
+
+        return np.where((counts > 0) & (percent >= landslide_area_percent_threshold), 0, 1).astype(np.int16)
+
+    run_step(results, profiler, county, "landslide_zonal_engine_" + str(landslide_fine_cell_size) + "m", number_of_parcels, landslide_requirement_fine)
+
+    # One read per tile (with a halo), plus block reads for the parcels larger than the halo (none at this parcel size).
+    halo_size = landslide_window_size // 8
+    tile_size = landslide_window_size - halo_size
+    parcel_cells = np.ceil((shapely.bounds(parcels)[:, 2:] - shapely.bounds(parcels)[:, :2]) / landslide_fine_cell_size) + 1
+    oversized_parcels = parcel_cells[(parcel_cells > halo_size).any(axis=1)]
+    max_window_reads = int(np.ceil(fine_columns / float(tile_size)) * np.ceil(fine_rows / float(tile_size)) + np.sum(np.ceil(oversized_parcels / landslide_window_size).prod(axis=1)))
+    print(str(len(window_reads)) + " windows read at " + str(landslide_fine_cell_size) + " m (at most " + str(max_window_reads) + " expected)")
+    assert len(window_reads) <= max_window_reads, "The landslide engine read " + str(len(window_reads)) + " windows at " + str(landslide_fine_cell_size) + " m (expected at most " + str(max_window_reads) + ")"
+    assert max(max(window_size) for window_size in window_reads) <= landslide_window_size
+
+    # Requirements calculated by the models get random values (1/0/<null>) so every exemption can be evaluated.
+    requirement_ids = []
+    for exemption_requirements in exemptions.values():
+        for requirement_id in exemption_requirements:
+            requirement_ids.extend(requirement_id if type(requirement_id) == list else [requirement_id])
+    for requirement_id in requirement_ids:
+        if requirement_field_name(requirement_id) not in columns:
+            columns[requirement_field_name(requirement_id)] = random.choice(np.array([1, 0, Exemption_Engine.null_value], dtype=np.int16), number_of_parcels)
+
+    # Exemptions.
+    requirements = dict((requirement_id, requirement_field_name(requirement_id)) for requirement_id in requirement_ids)
+
+    def calculate_exemptions():
+        plan = Exemption_Engine.compile_exemption_plan(exemptions, requirements)
+        return Exemption_Engine.evaluate_exemption_plan(plan, columns)
+
+    exemption_columns = run_step(results, profiler, county, "exemptions", number_of_parcels, calculate_exemptions)
+
+    # Dev team tables.
+    parcel_ids = np.array(["06000" + str(i).zfill(10) + "_" + str(i + 1) for i in range(number_of_parcels)])
+
+    def write_dev_tables():
+        requirement_table = Parquet_Export.county_table(county, parcel_ids, columns, list(columns.keys()))
+        Parquet_Export.write_county_table(os.path.join(output_folder, "requirements", "requirements_" + county + ".parquet"), requirement_table)
+        exemption_table = Parquet_Export.county_table(county, parcel_ids, exemption_columns, [field for field in exemption_columns if field != "exemptions_count"])
+        Parquet_Export.write_county_table(os.path.join(output_folder, "exemptions", "exemptions_" + county + ".parquet"), exemption_table)
+
+    run_step(results, profiler, county, "dev_tables_parquet", number_of_parcels, write_dev_tables)
+
+
+def print_results(results):
+    print("\n{:<22} {:<24} {:>10} {:>10} {:>14}".format("County", "Step", "Parcels", "Seconds", "Parcels/sec"))
+    for county, step, number_of_parcels, seconds in results:
+        print("{:<22} {:<24} {:>10} {:>10.2f} {:>14.0f}".format(county, step, number_of_parcels, seconds, number_of_parcels / seconds if seconds > 0 else 0))
+
+
+if __name__ == "__main__":
+
+    county_sizes = [int(size) for size in sys.argv[1:]] or default_county_sizes
+
+    profiler = Profiling.Profiler(profiling_db, time.strftime("%Y-%m-%d %H:%M:%S"), "Benchmark_Synthetic_Counties") if profiling_db else None
+    output_folder = tempfile.mkdtemp(prefix="ceqa_benchmark_")
+
+    results = []
+    try:
+        for county_size in county_sizes:
+            benchmark_county(county_size, results, profiler, output_folder)
+    finally:
+        shutil.rmtree(output_folder, ignore_errors=True)
+        if profiler:
+            profiler.close()
+
+    print_results(results)
@@ -30,14 +30,13 @@
 # ArcGIS Pro: 1 requirement (9.5) ~17 hours.
 # NOTE If running from ArcGIS Desktop, the script begins to slow down over time. To increase the speed, run 50% of
 # counties at a time, or kill the script after it has completed a county and restart it on the remaining counties.
+# If resume_interrupted_runs is True, a run that is killed (or crashes) can be restarted without changing the list of
+# counties. The restarted run skips every step (requirement, exemptions, dev team tables) that has already completed.
+# If task_queue_db is set, the run is split into tasks that worker processes on other machines can also run (see
+# task_queue_db below).
 
-# If processing all requirements for all counties (any number of requirements), manually delete the requirements table
-# first since all records in this table will be deleted. This will increase performance.
-
-# Similarly, if processing exemptions for all counties (any number of requirements), manually delete the exemptions
-# table first since all records in this table will be deleted. This will increase performance.
-
-# Don't delete the tables if running individual requirements for some or all counties
+# The dev team requirements and exemptions tables are partitioned by county (see dev_table_partition_suffix_new), so
+# there's no need to delete them before processing all counties. Rerunning a county only replaces its own partitions.
 
 # Indicating the parcel feature classes to process:
 # Use "*" to process all counties (currently 58), or create a list of counties to process. Examples:
@@ -50,15 +49,33 @@
 # requirements_to_process = "*"
 # requirements_to_process = ["3.10", "2.6"].
 # For one requirement, also use a list. For example, ["3.10"]
+# If incremental_recompute is True, "*" only recalculates the requirements with inputs that have changed since they were
+# last calculated, and the exemptions that depend on them.
 
 # NOTE: If parcels change, the geodatabases should be deleted as the county parcel feature classes can be recreated.
 # If this is not performed, the old county parcels data copies will be used and the tables will be incorrect.
+# (If incremental_recompute is True and requirements_to_process = "*", this is done automatically.)
 
 ########################################################################################################################
 
 import os
 import arcpy
+import contextlib
 import datetime
+import multiprocessing
+import sys
+import time
+import traceback
+import numpy as np
+import shapely
+import Array_IO
+import Exemption_Engine
+import Parquet_Export
+import Profiling
+import Reference_Cache
+import Run_State
+import Spatial_Engines
+import Task_Queue
 arcpy.env.overwriteOutput = True
 arcpy.CheckOutExtension("Spatial")
 
@@ -176,9 +193,95 @@ statewide_toolbox = r"\\loxodonta\GIS\Projects\CEQA_Site_Check_Version_2_0_2023\
 statewide_toolbox_alias = "Statewide"
 arcpy.ImportToolbox(statewide_toolbox, statewide_toolbox_alias)
 
+# Number of worker processes used to process counties in parallel. Use 1 to process the counties one at a time.
+# Counties are started largest first (by parcel count), and each worker process gets its own scratch geodatabase.
+# The dev team outputs (parcels copy, requirements and exemptions tables) are only ever written by the main process.
+# With the task queue (see task_queue_db), this is the number of worker processes that run tasks on this machine.
+county_worker_count = 1
+
+# Incremental recompute:
+# The fingerprint of the inputs to each (county, requirement) result is stored in the run state database (see the
+# requirement_inputs dictionary below). If incremental_recompute is True and requirements_to_process = "*", only the
+# requirements with inputs that have changed since they were last calculated (e.g., a new version of a reference dataset
+# or a new where clause) are recalculated, along with the exemptions that depend on them.
+# If the county parcels change, the output parcels are deleted and recreated automatically.
+# If requirements_to_process is a list, those requirements are always recalculated (and their fingerprints are updated).
+incremental_recompute = True
+# Run journal:
+# If resume_interrupted_runs is True, each step of a run (each requirement, the exemptions, and the dev team tables for
+# each county) is recorded in the run journal (in the run state database) when it starts and when it completes.
+# Restarting a run with the same counties and requirements skips the steps that completed and starts at the first one
+# that didn't. The field of a requirement that was interrupted part way through is deleted and recalculated.
+# Each completed step is stored with the fingerprint of its inputs (see county_fingerprints), and is only skipped if its
+# inputs are still the same. A step whose inputs have changed since it completed (e.g., a new version of a reference
+# dataset or of the county parcels) is run again, even if the journal of a failed run was left behind.
+# The journal for a run is deleted once every county has completed, so the next run starts from the beginning.
+resume_interrupted_runs = True
+
+run_state_db = r"P:\Projects3\CEQA_Site_Check_Version_2_0_2023_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Outputs\run_state.sqlite"
+
+# Task queue:
+# If task_queue_db is set (a SQLite database on a path shared by every machine that runs workers), the run is split into
+# tasks in the task queue (see Task_Queue.py): for each county, one task for each engine's requirements (centroid and
+# intersect) and one for each other requirement (short circuited requirements after the others), one for the
+# county's exemptions (after its requirements), and one for its dev team tables (after its exemptions), plus one for
+# the statewide tables (after every county's dev team tables). The tasks are run by county_worker_count worker
+# processes on this machine, plus any number of workers started on other machines (or on this one) with:
+# python Calculate_CEQA_Requirements_and_Exemptions_Statewide.py worker
+# Workers started this way use the configuration in their own copy of this script (workspaces, requirements, etc.), so
+# every machine should have the same copy and the same paths to the data. They run tasks from any run in the queue
+# until there are none left.
+# Only one task at a time writes to a county's Data Basin feature class, and only one at a time writes to the dev team
+# geodatabase. A task that fails is retried up to task_max_attempts times. A worker that dies loses its lease on its
+# task after task_lease_seconds, and the task is run again by another worker.
+# A run is identified by its counties and requirements and the fingerprint of their inputs. Restarting a run continues
+# its tasks only if the inputs haven't changed. Otherwise the earlier run is deleted from the queue and started over.
+# Use None to process the counties in this script's process (or pool, see county_worker_count) without a task queue.
+task_queue_db = None
+task_lease_seconds = 900
+task_max_attempts = 3
+# Seconds a worker waits before checking the queue again when no task is ready (e.g., waiting on another worker's task).
+task_poll_seconds = 30
+
+# Profiling:
+# If profile_steps is True, the wall time, CPU time, peak memory, and rows per second of each requirement, the exemptions,
+# and the dev team tables are recorded for each county in the profiling history database (see Profiling.py).
+# To compare the last run with previous runs: python Profiling.py report <profiling_db>
+profile_steps = True
+profiling_db = r"P:\Projects3\CEQA_Site_Check_Version_2_0_2023_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Outputs\profiling_history.sqlite"
+
+# Reference layer cache:
+# If use_reference_cache is True, the reference datasets are clipped to each county's extent (plus a margin), projected
+# to NAD_1983_California_Teale_Albers and stored in a cache on the local disk (see Reference_Cache.py). The cached
+# layers are rebuilt automatically when the source dataset changes. Least recently used layers are deleted when the
+# cache is larger than reference_cache_max_size_mb, except for the layers a worker process is still using for a county.
+use_reference_cache = True
+reference_cache_folder = r"C:\CEQA_Reference_Cache"
+reference_cache_max_size_mb = 20000
+reference_cache_margin_meters = 1000
+
 output_requirements_table_name = "requirements"
 output_exemptions_table_name = "exemptions"
 
+# Dev team tables:
+# The requirements and exemptions for each county are written to their own table (partition) in the dev team geodatabase
+# (e.g., requirements_alameda). Rerunning a county replaces its partition with a newly written one (swapped in with a
+# rename), so the other counties' rows are never touched. The statewide requirements and exemptions tables are built
+# from the partitions at the end of the run. In an enterprise (.sde) or mobile (.geodatabase) geodatabase they are
+# database views (UNION ALL of the partitions): creating them takes seconds and they're always up to date, so this is
+# the recommended output_gdb_dev_team for regular runs. A file geodatabase doesn't support views, so the statewide
+# tables have to be rebuilt by copying every row of all 58 partitions, even when only one county was rerun. This is
+# only done at the end of a run if merge_statewide_dev_tables is True. Otherwise the statewide tables in a file
+# geodatabase are left as they are (out of date if a county was rerun) and can be merged on demand when they're needed:
+# python Calculate_CEQA_Requirements_and_Exemptions_Statewide.py statewide_tables
+dev_table_partition_suffix_new = "_new"
+merge_statewide_dev_tables = False
+
+# Format of the dev team requirements and exemptions tables: "gdb" (tables in the dev team geodatabase), "parquet" (one
+# Parquet file per county in output_parquet_folder_dev_team, see Parquet_Export.py), or "both".
+dev_team_output_format = "gdb"
+output_parquet_folder_dev_team = r"P:\Projects3\CEQA_Site_Check_Version_2_0_2023_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Outputs\Outputs_for_DevTeam_Parquet"
+
 # External Join Table (Not used in version 1.0)
 join_requirements_table = r"\\loxodonta\GIS\Projects\CDT-CEQA_California_2019\Workspaces\CDT-CEQA_California_2019_kai_foster\Tasks\General_Tasks\Data\Inputs\Inputs.gdb\Sacramento_Pilot\Sacramento_Parcels_MG"
 
@@ -237,6 +340,7 @@ rare_threatened_or_endangered_fc = favorites_dir + r"\CBI Intermediate.sde\cbiin
 
 # 8.6
 prime_farmlands_fc = r"\\loxodonta\gis\Source_Data\farming\state\CA\FMMP\2018_2016_from_Data_Basin\California - Farmland Mapping and Monitoring Program (FMMP), 2018_2016\data\commondata\2018_in_progress_fmmp_shape_files\CA_FMMP_2018_state.shp"
+prime_farmlands_where_clause = "\"polygon_ty\" = 'P' or \"polygon_ty\" = 'S'"
 
 # 9.3
 #wildfire_hazard_fc = r"\\loxodonta\gis\Source_Data\environment\state\CA\Fire_Hazard_Severity_Zones_2017\fhszs06_3.shp"
@@ -244,12 +348,24 @@ prime_farmlands_fc = r"\\loxodonta\gis\Source_Data\farming\state\CA\FMMP\2018_20
 # wildfire_hazard_fc =  r"\\loxodonta\gis\Source_Data\environment\state\CA\CALFIRE_FireHazardSeverityZones\2024\FHSZSRA_23_3\FHSZSRA_23_3.gdb\FHSZSRA_23_3"
 # 06/18/2025 # Correction for older version above used by mistake. This is the version sent by Brianne on 04/23/2025.
 wildfire_hazard_fc = r"\\loxodonta\gis\Source_Data\environment\state\CA\CALFIRE_FireHazardSeverityZones\2025\FHSZALL_v25_1.gdb\FHSZALL_v25_1"
+#wildfire_hazard_where_clause = "\"HAZ_CLASS\" = 'High' or \"HAZ_CLASS\" = 'Very High'"
+# 05/12/2025 Update
+#wildfire_hazard_where_clause = "\"FHSZ_Description\" = 'High' or \"FHSZ_Description\" = 'Very High'"
+# 06/03/2025 Update (After consulting with Natalie, Brianne instructed us to include the "Moderate" category)
+wildfire_hazard_where_clause = "\"FHSZ_Description\" = 'High' or \"FHSZ_Description\" = 'Very High'  or \"FHSZ_Description\" = 'Moderate'"
 
 # 9.4
 flood_plain_fc = r"P:\Projects3\CDT-CEQA_California_2019_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Inputs\Inputs.gdb\CA_100_Year_FEMA_Floodplain"
 
 # 9.5
 landslide_area_percent_threshold = 20 # The percent of the parcel that must have a very high landslide susceptibility value.
+# If True, 9.5 is calculated by the zonal engine, which reads the raster in windows of at most
+# landslide_window_size x landslide_window_size cells and counts the hazard cells in each parcel directly (no zonal
+# statistics table or join). Each window covers a tile of parcels, so the number of reads depends on the area of the
+# county, not the number of parcels (only parcels wider or taller than 1/8 of the window are read on their own).
+# If False, ZonalStatisticsAsTable is used.
+use_landslide_zonal_engine = True
+landslide_window_size = 4096
 #landslide_hazard_raster = r"P:\Projects3\CDT-CEQA_California_2019_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Inputs\Inputs.gdb\CA_ms58_very_high_landslide_susceptibility_1s"
 #landslide_hazard_raster = r"\\loxodonta\gis\Projects\CEQA_Site_Check_Version_2_0_2023\Workspaces\CEQA_Site_Check_Version_2_0_2023_justin_heyerdahl\Data\Rasters\req9_5_LandslideHazard_20240118.tif"
 
@@ -280,6 +396,61 @@ local_coastal_zone_fc = r"P:\Projects3\CDT-CEQA_California_2019_mike_gough\Tasks
 # 9.8
 protected_area_mask_fc = r"P:\Projects3\CDT-CEQA_California_2019_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Inputs\Inputs.gdb\CA_protected_area_mask"
 
+# Centroid Requirements:
+# Requirements that select parcels that HAVE THEIR CENTERS IN a reference dataset. If use_centroid_engine is True, these
+# are calculated together in a single pass (parcel centroids are computed once and tested against every reference dataset
+# through one spatial index) instead of by their individual calc_requirement functions.
+# requirement: [reference dataset, where clause, value calculated for parcels that have their center in the reference dataset]
+use_centroid_engine = True
+centroid_requirements = {
+    "0.1": [urbanized_area_prc_21071_fc, "community_type = 'Unincorporated Island' AND urbanized_area_prc_21071 = 1", 1],
+    "2.1": [urbanized_area_prc_21071_fc, "urbanized_area_prc_21071 = 1", 1],
+    "2.2": [urban_area_prc_21094_5_fc, "urban_area_prc_21094_5 = 1", 1],
+    "2.3": [city_boundaries_fc, None, 1],
+    "2.4": [incorporated_place_fc, None, 0],
+    "2.5": [mpo_boundary_dissolve_fc, None, 1],
+    "2.7": [urbanized_area_urban_cluster_fc, None, 1],
+}
+
+# Intersect Requirements:
+# Requirements that select parcels that INTERSECT a reference dataset. If use_intersect_engine is True, these are
+# calculated together in a single pass (parcel geometries are read once, in batches, and tested against every reference
+# dataset through one spatial index of prepared reference polygons) instead of by their individual calc_requirement functions.
+# requirement: [reference dataset, where clause, value calculated for parcels that intersect the reference dataset]
+use_intersect_engine = True
+intersect_requirements = {
+    "8.5": [rare_threatened_or_endangered_fc, None, 0],
+    "8.6": [prime_farmlands_fc, prime_farmlands_where_clause, 0],
+    "9.3": [wildfire_hazard_fc, wildfire_hazard_where_clause, 0],
+    "9.4": [flood_plain_fc, None, 0],
+    "9.6": [state_conservancy_fc, None, 0],
+    "9.7": [local_coastal_zone_fc, None, 0],
+    "9.8": [protected_area_mask_fc, None, 0],
+}
+intersect_parcel_batch_size = 100000
+
+# Short circuit evaluation:
+# If short_circuit_requirements_enabled is True, the requirements are calculated from the cheapest to the most expensive
+# (see requirement_costs), and the requirements in short_circuit_requirements are calculated last, only for the parcels
+# where they could still change an exemption (e.g., 9.5 isn't calculated for a parcel when every exemption that depends
+# on 9.5 is already 0 because of 2.1 or 2.5). The other parcels get a value of -2 (not evaluated, see
+# Exemption_Engine.not_evaluated_value), which the exemptions treat like <null>.
+# The results of short circuited requirements are fingerprinted as partial (and depend on the requirements they were
+# short circuited by). Setting short_circuit_requirements_enabled back to False recalculates them for every parcel
+# (backfills the not evaluated values) the next time requirements_to_process = "*" is run with incremental_recompute.
+# Only requirements with a function that supports oids_to_calculate can be short circuited (9.5 with the zonal engine).
+short_circuit_requirements_enabled = False
+short_circuit_requirements = ["9.5"]
+# Relative cost of calculating each requirement for a county (e.g., from python Profiling.py report). Default: 10.
+# The transit requirements are calculated by their models (each buffers and selects), so they cost about as much as the
+# intersect requirements done one at a time.
+requirement_costs = {
+    "0.1": 1, "2.1": 1, "2.2": 1, "2.3": 1, "2.4": 1, "2.5": 1, "2.7": 1,
+    "3.1": 5, "3.2": 5, "3.3": 5, "3.4": 5, "3.5": 5, "3.9": 5, "3.10": 5, "3.11": 5, "3.12": 5, "3.13": 5, "3.14": 5,
+    "8.5": 2, "8.6": 2, "9.3": 2, "9.4": 2, "9.6": 2, "9.7": 2, "9.8": 2,
+    "9.5": 1000,
+}
+
 # Requirements that begin with 0 aren't applicable to any exemptions
 requirements = {
     "0.1": "urbanized_area_prc_21071_unincorporated_0_1",
@@ -446,11 +617,35 @@ exemptions = {
      "15064.3": [["3.1", "3.5", "3.6"]] # Add 3.6 back in. We have 3.6 for CEQA Site Check version 2.0
 }
 
+# The inputs to each requirement: [[datasets], [other parameters such as where clauses and thresholds]].
+# Used to fingerprint the requirement results for the incremental recompute. Datasets are versioned by path and the
+# modification time and size of their own files (see Run_State.dataset_version). Requirements calculated by a model are
+# versioned by the toolbox.
+requirement_inputs = {
+    "0.1": [[urbanized_area_prc_21071_fc], centroid_requirements["0.1"][1:]],
+    "2.1": [[urbanized_area_prc_21071_fc], centroid_requirements["2.1"][1:]],
+    "2.2": [[urban_area_prc_21094_5_fc], centroid_requirements["2.2"][1:]],
+    "2.3": [[city_boundaries_fc], centroid_requirements["2.3"][1:]],
+    "2.4": [[incorporated_place_fc], centroid_requirements["2.4"][1:]],
+    "2.5": [[mpo_boundary_dissolve_fc], centroid_requirements["2.5"][1:]],
+    "2.7": [[urbanized_area_urban_cluster_fc], centroid_requirements["2.7"][1:]],
+    "8.5": [[rare_threatened_or_endangered_fc], []],
+    "8.6": [[prime_farmlands_fc], [prime_farmlands_where_clause]],
+    "9.3": [[wildfire_hazard_fc], [wildfire_hazard_where_clause]],
+    "9.4": [[flood_plain_fc], []],
+    "9.5": [[landslide_hazard_raster], [landslide_area_percent_threshold]],
+    "9.6": [[state_conservancy_fc], []],
+    "9.7": [[local_coastal_zone_fc], []],
+    "9.8": [[protected_area_mask_fc], []],
+}
+for requirement_id in requirements:
+    if requirement_id not in requirement_inputs:
+        requirement_inputs[requirement_id] = [[statewide_toolbox], ["r" + requirement_id.replace(".", "")]]
+
 # DATA PROCESSING FUNCTIONS ############################################################################################
 
-if input_parcels_fc_list == "*":
-    input("All parcels will be processed. Depending on the number of requirements being run, deleting the requirements and exemptions tables may increase performance." +
-          " If running many requirements (unknown how many), it is recommended that you do that now (after backing up those tables to a new geodatabase in the Archive folder). " +
+if __name__ == "__main__" and input_parcels_fc_list == "*" and sys.argv[1:2] not in (["worker"], ["statewide_tables"]):
+    input("All parcels will be processed. Back up the dev team requirements and exemptions tables to a new geodatabase in the Archive folder if needed (each county's partition will be replaced)." +
           " No need to delete the county parcels, unless those data have changed. " +
           " When you're ready, push any key to continue...")
 
@@ -484,30 +679,74 @@ def copy_parcels_fc(input_parcels_fc, output_parcels_fc):
         config_keyword="")
 
 
-def delete_county_rows_from_dev_table(output_parcels_fc, table):
+def reference_dataset(reference_fc, where_clause=None):
+    """ Returns the reference dataset to use for the current county and the where clause that still needs to be applied
+        to it. If use_reference_cache is True, this is the cached copy of the dataset clipped to the county (the where
+        clause has already been applied). Otherwise it's the statewide dataset and the where clause passed in.
+    """
+
+    if not use_reference_cache:
+        return reference_fc, where_clause
+
+    county_name = os.path.basename(output_parcels_fc).split("_")[0].lower()
+    county_extent = arcpy.Describe(output_parcels_fc).extent
+
+    reference_cache = Reference_Cache.ReferenceCache(reference_cache_folder, reference_cache_max_size_mb, reference_cache_margin_meters)
+    cached_fc = reference_cache.get(reference_fc, county_name, county_extent, where_clause)
+    reference_cache.close()
+
+    return cached_fc, None
+
+
+def release_reference_layers():
+    """ Releases the cached reference layers leased by this process for the county it has finished, so they can be
+        evicted from the reference cache.
+    """
+
+    if use_reference_cache:
+        reference_cache = Reference_Cache.ReferenceCache(reference_cache_folder, reference_cache_max_size_mb, reference_cache_margin_meters)
+        reference_cache.release()
+        reference_cache.close()
+
+
+# Profiler for this process (see start_profiler) and the number of parcels in each county (rows processed by each step).
+profiler = None
+county_parcel_counts = {}
+
+
+def start_profiler(run_label):
+    """ Starts recording steps in the profiling history database for this process (if profile_steps is True). """
+
+    global profiler
+
+    if profile_steps:
+        profiler = Profiling.Profiler(profiling_db, run_label, "Calculate_CEQA_Requirements_and_Exemptions_Statewide")
+
+
+def profile_step(step):
+    """ Returns a context manager that records a step for the county being processed in the profiling history. """
+
+    if not profiler:
+        return contextlib.nullcontext()
+
+    county_name = os.path.basename(output_parcels_fc).split("_")[0].lower()
+    if output_parcels_fc not in county_parcel_counts:
+        county_parcel_counts[output_parcels_fc] = int(arcpy.GetCount_management(output_parcels_fc)[0])
+
+    return profiler.step(county_name, step, county_parcel_counts[output_parcels_fc])
 
-    # Get the name of the county that appears in the the attribute table.
-    output_parcels_fc_layer = arcpy.MakeFeatureLayer_management(output_parcels_fc)
-    arcpy.SelectLayerByAttribute_management(output_parcels_fc_layer, "NEW_SELECTION", "OBJECTID = 1")
 
-    with arcpy.da.SearchCursor(output_parcels_fc_layer, county_name_field) as sc:
-        for row in sc:
-            county_name_in_att_table = row[0]
+# [run state, run id, county name, step fingerprints] of the county being processed when the run is journaled (see
+# process_county and journal_fingerprints).
+run_journal = None
 
-    print("\nChecking to see if this county (%s) has rows in the dev table (%s)." % (county_name_in_att_table, table))
 
-    temp_table_view = "temp_table_view"
-    arcpy.MakeTableView_management(table, temp_table_view)
-    expression = county_name_field + " = '%s'" % county_name_in_att_table
-    # Execute SelectLayerByAttribute to see if there are any rows in the requirements table with this county name.
-    arcpy.SelectLayerByAttribute_management(temp_table_view, "NEW_SELECTION", expression)
+def journal_steps(steps, status):
+    """ Records the status ("started" or "completed") of steps for the county being processed in the run journal. """
 
-    if int(arcpy.GetCount_management(temp_table_view)[0]) > 0:
-        print("There were rows in the dev team table for this county (%s) from a previous run. Deleting..." % county_name_in_att_table)
-        with arcpy.da.UpdateCursor(table, county_name_field) as uc:
-            for row in uc:
-                if row[0] == county_name_in_att_table:
-                    uc.deleteRow()
+    if run_journal:
+        run_state, run_id, county_name, step_fingerprints = run_journal
+        run_state.set_journal(run_id, county_name, steps, status, step_fingerprints)
 
 
 def calculate_requirements(requirements_to_process=requirements.keys()):
@@ -532,9 +771,19 @@ def calculate_requirements(requirements_to_process=requirements.keys()):
     # Create an object that contains all the requirement processing functions.
     requirement_functions = RequirementFunctions()
 
+    # Short circuit evaluation: cheapest requirements first, and the short circuited requirements after all the others.
+    short_circuited_requirements = []
+    if short_circuit_requirements_enabled:
+        requirements_to_process = sorted(requirements_to_process, key=lambda requirement_id: requirement_costs.get(requirement_id, 10))
+        short_circuited_requirements = [requirement for requirement in requirements_to_process if requirement in short_circuit_requirements and requirement not in requirements_with_no_data_this_county]
+
     count = 1
     requirement_count = str(len(requirements_to_process))
 
+    # Centroid and intersect requirements that will be calculated together by the engines once the loop below has finished.
+    centroid_fields_to_calc = {}
+    intersect_fields_to_calc = {}
+
     # For each requirement passed in...
     for requirement in requirements_to_process:
         print("\nProcessing requirement (" + str(count) + "/" + requirement_count + "): " + requirement + "\n")
@@ -542,22 +791,152 @@ def calculate_requirements(requirements_to_process=requirements.keys()):
         if field_to_calc not in existing_output_fields:
             print("Adding field: " + field_to_calc)
             arcpy.AddField_management(output_parcels_fc, field_to_calc, "SHORT")
+            # The short circuited requirements use the values of the requirements calculated earlier in this run.
+            existing_output_fields.append(field_to_calc)
         if requirement not in requirements_with_no_data_this_county:
-            print("Calling function to calculate values for this requirement...")
-            requirement_functions.do_command(requirement, output_parcels_fc, field_to_calc)
+            if requirement in short_circuited_requirements:
+                print("This requirement will be calculated after the other requirements, only for the parcels where it could still change an exemption.")
+            elif use_centroid_engine and requirement in centroid_requirements:
+                print("This requirement will be calculated by the centroid engine along with the other centroid requirements.")
+                centroid_fields_to_calc[requirement] = field_to_calc
+            elif use_intersect_engine and requirement in intersect_requirements:
+                print("This requirement will be calculated by the intersect engine along with the other intersect requirements.")
+                intersect_fields_to_calc[requirement] = field_to_calc
+            else:
+                print("Calling function to calculate values for this requirement...")
+                journal_steps(["requirement:" + requirement], "started")
+                with profile_step("requirement:" + requirement):
+                    requirement_functions.do_command(requirement, output_parcels_fc, field_to_calc)
+                journal_steps(["requirement:" + requirement], "completed")
         else:
             print("No data for this requirement. A field has been added with <null> values.")
+            journal_steps(["requirement:" + requirement], "completed")
 
         count += 1
 
-    # Call function to delete rows in the requirements table for this county if this county is in that table.
-    output_requirements_table_dev_team = output_gdb_dev_team + os.sep + output_requirements_table_name
-    if arcpy.Exists(output_requirements_table_dev_team):
-        delete_county_rows_from_dev_table(output_parcels_fc, output_requirements_table_dev_team)
+    if centroid_fields_to_calc:
+        print("\nCalculating centroid requirements (" + ", ".join(centroid_fields_to_calc.keys()) + ") in a single pass...")
+        journal_steps(["requirement:" + requirement for requirement in centroid_fields_to_calc], "started")
+        with profile_step("centroid_engine:" + ",".join(centroid_fields_to_calc.keys())):
+            requirement_functions.calc_centroid_requirements(output_parcels_fc, centroid_fields_to_calc)
+        journal_steps(["requirement:" + requirement for requirement in centroid_fields_to_calc], "completed")
+
+    if intersect_fields_to_calc:
+        print("\nCalculating intersect requirements (" + ", ".join(intersect_fields_to_calc.keys()) + ") in a single pass...")
+        journal_steps(["requirement:" + requirement for requirement in intersect_fields_to_calc], "started")
+        with profile_step("intersect_engine:" + ",".join(intersect_fields_to_calc.keys())):
+            requirement_functions.calc_intersect_requirements(output_parcels_fc, intersect_fields_to_calc)
+        journal_steps(["requirement:" + requirement for requirement in intersect_fields_to_calc], "completed")
+
+    for requirement in short_circuited_requirements:
+        print("\nShort circuiting requirement " + requirement + "...")
+        journal_steps(["requirement:" + requirement], "started")
+        requirement_functions.oids_to_calculate = parcels_that_need_requirement(requirement, short_circuited_requirements)
+        with profile_step("requirement:" + requirement):
+            requirement_functions.do_command(requirement, output_parcels_fc, requirements[requirement])
+        requirement_functions.oids_to_calculate = None
+        journal_steps(["requirement:" + requirement], "completed")
+
+
+def parcels_that_need_requirement(requirement_id, short_circuited_requirements):
+    """ Returns the OBJECTIDs of the parcels where a requirement could still change an exemption, based on the values of
+        the requirements that have already been calculated (the short circuited requirements are treated as unknown).
+    """
+
+    known_fields = []
+    for exemption_requirements in exemptions.values():
+        for or_ids in exemption_requirements:
+            for or_id in (or_ids if type(or_ids) == list else [or_ids]):
+                field = requirements[or_id]
+                if or_id not in short_circuited_requirements and field in existing_output_fields and field not in known_fields:
+                    known_fields.append(field)
+
+    oids, columns = Array_IO.read_columns(output_parcels_fc, known_fields)
+    needed = Exemption_Engine.requirements_that_can_change_exemptions(exemptions, requirements, requirement_id, columns, len(oids))
+    print(str(int(needed.sum())) + " of " + str(len(oids)) + " parcels need requirement " + requirement_id + ".")
+
+    return oids[needed]
 
 
 class RequirementFunctions(object):
 
+    # OBJECTIDs of the parcels to calculate (None = all parcels). Set when a requirement is short circuited. Parcels that
+    # aren't calculated get Exemption_Engine.not_evaluated_value.
+    oids_to_calculate = None
+
+    # ENGINE FUNCTIONS
+
+    def calc_centroid_requirements(self, output_parcels_fc, fields_to_calc):
+        """
+            0.1, 2.1, 2.2, 2.3, 2.4, 2.5, 2.7
+            Description: Calculates all of the centroid requirements passed in (fields_to_calc is a dictionary of
+            requirement: field) in a single pass. The centroid of each parcel is computed once and tested against the
+            reference datasets in the centroid_requirements dictionary through one spatial index.
+            Values are the same as those calculated by the individual calc_requirement functions below.
+        """
+        parcels_spatial_reference = arcpy.Describe(output_parcels_fc).spatialReference
+
+        print("Reading parcel centroids...")
+        oids, centroids = Array_IO.read_centroids(output_parcels_fc)
+
+        requirement_ids = list(fields_to_calc.keys())
+        polygon_layers = []
+        for requirement_id in requirement_ids:
+            reference_fc, where_clause, value_if_center_in = centroid_requirements[requirement_id]
+            print("Reading reference dataset for requirement " + requirement_id + "...")
+            reference_fc, where_clause = reference_dataset(reference_fc, where_clause)
+            polygon_layers.append(Array_IO.read_geometries(reference_fc, where_clause, parcels_spatial_reference)[1])
+
+        print("Testing parcel centroids against the reference datasets...")
+        hits = Spatial_Engines.points_in_polygon_layers(centroids, polygon_layers)
+
+        columns = {}
+        for layer_index, requirement_id in enumerate(requirement_ids):
+            value_if_center_in = centroid_requirements[requirement_id][2]
+            columns[fields_to_calc[requirement_id]] = np.where(hits[layer_index], value_if_center_in, 1 - value_if_center_in).astype(np.int16)
+
+        print("Writing values...")
+        Array_IO.write_columns(output_parcels_fc, oids, columns)
+
+    def calc_intersect_requirements(self, output_parcels_fc, fields_to_calc):
+        """
+            8.5, 8.6, 9.3, 9.4, 9.6, 9.7, 9.8
+            Description: Calculates all of the intersect requirements passed in (fields_to_calc is a dictionary of
+            requirement: field) in a single pass. The reference datasets in the intersect_requirements dictionary (with
+            their where clauses applied, e.g., polygon_ty P/S for 8.6 and the FHSZ_Description classes for 9.3) are
+            loaded into one spatial index, and the parcels are read once in batches and tested against all of them.
+            Values are the same as those calculated by the individual calc_requirement functions below.
+        """
+        parcels_spatial_reference = arcpy.Describe(output_parcels_fc).spatialReference
+
+        requirement_ids = list(fields_to_calc.keys())
+        polygon_layers = []
+        for requirement_id in requirement_ids:
+            reference_fc, where_clause, value_if_intersect = intersect_requirements[requirement_id]
+            print("Reading reference dataset for requirement " + requirement_id + "...")
+            reference_fc, where_clause = reference_dataset(reference_fc, where_clause)
+            polygon_layers.append(Array_IO.read_geometries(reference_fc, where_clause, parcels_spatial_reference)[1])
+
+        print("Building spatial index...")
+        polygon_index = Spatial_Engines.build_polygon_index(polygon_layers)
+
+        print("Testing parcels against the reference datasets...")
+        oids = []
+        hits = []
+        for batch_oids, batch_parcels in Array_IO.iter_geometries(output_parcels_fc, intersect_parcel_batch_size):
+            oids.append(batch_oids)
+            hits.append(Spatial_Engines.polygons_intersect_index(batch_parcels, polygon_index))
+        oids = np.concatenate(oids) if oids else np.array([], dtype=np.int64)
+        hits = np.concatenate(hits, axis=1) if hits else np.zeros((len(requirement_ids), 0), dtype=bool)
+
+        columns = {}
+        for layer_index, requirement_id in enumerate(requirement_ids):
+            value_if_intersect = intersect_requirements[requirement_id][2]
+            columns[fields_to_calc[requirement_id]] = np.where(hits[layer_index], value_if_intersect, 1 - value_if_intersect).astype(np.int16)
+
+        print("Writing values...")
+        Array_IO.write_columns(output_parcels_fc, oids, columns)
+
     # ARCPY FUNCTIONS
 
     def calc_requirement_0_1(self, output_parcels_fc, field_to_calc):
@@ -689,7 +1068,8 @@ class RequirementFunctions(object):
             Description: Select parcels that intersect the Rare, Threatened, or Endangered Species Dataset. Yes = 0, No = 1
         """
         output_parcels_layer = arcpy.MakeFeatureLayer_management(output_parcels_fc)
-        arcpy.SelectLayerByLocation_management(output_parcels_layer, "INTERSECT", rare_threatened_or_endangered_fc)
+        reference_fc = reference_dataset(rare_threatened_or_endangered_fc)[0]
+        arcpy.SelectLayerByLocation_management(output_parcels_layer, "INTERSECT", reference_fc)
         arcpy.CalculateField_management(output_parcels_layer, field_to_calc, 0, "PYTHON")
         arcpy.SelectLayerByAttribute_management(output_parcels_layer, "SWITCH_SELECTION")
         arcpy.CalculateField_management(output_parcels_layer, field_to_calc, 1, "PYTHON")
@@ -702,9 +1082,8 @@ class RequirementFunctions(object):
             Description: Select parcels that intersect Prime farmlands or farmlands of statewide importance. Yes = 0, No = 1
         """
         output_parcels_layer = arcpy.MakeFeatureLayer_management(output_parcels_fc)
-        prime_farmlands_layer = arcpy.MakeFeatureLayer_management(prime_farmlands_fc)
-        expression = "\"polygon_ty\" = 'P' or \"polygon_ty\" = 'S'"
-        farmland_types_selected = arcpy.SelectLayerByAttribute_management(prime_farmlands_layer, "NEW_SELECTION", expression)
+        reference_fc, where_clause = reference_dataset(prime_farmlands_fc, prime_farmlands_where_clause)
+        farmland_types_selected = arcpy.MakeFeatureLayer_management(reference_fc, where_clause=where_clause)
 
         arcpy.SelectLayerByLocation_management(output_parcels_layer, "INTERSECT", farmland_types_selected)
         arcpy.CalculateField_management(output_parcels_layer, field_to_calc, 0, "PYTHON")
@@ -719,13 +1098,8 @@ class RequirementFunctions(object):
             For version 1.0, the wildfire hazard layer is vector, so the calculation was changed from zonal stats to SBL.
             """
         output_parcels_layer = arcpy.MakeFeatureLayer_management(output_parcels_fc)
-        wildfire_hazard_layer = arcpy.MakeFeatureLayer_management(wildfire_hazard_fc)
-        #expression = "\"HAZ_CLASS\" = 'High' or \"HAZ_CLASS\" = 'Very High'"
-        # 05/12/2025 Update
-        #expression = "\"FHSZ_Description\" = 'High' or \"FHSZ_Description\" = 'Very High'"
-        # 06/03/2025 Update (After consulting with Natalie, Brianne instructed us to include the "Moderate" category)
-        expression = "\"FHSZ_Description\" = 'High' or \"FHSZ_Description\" = 'Very High'  or \"FHSZ_Description\" = 'Moderate'"
-        wildfire_hazard_types_selected = arcpy.SelectLayerByAttribute_management(wildfire_hazard_layer, "NEW_SELECTION", expression)
+        reference_fc, where_clause = reference_dataset(wildfire_hazard_fc, wildfire_hazard_where_clause)
+        wildfire_hazard_types_selected = arcpy.MakeFeatureLayer_management(reference_fc, where_clause=where_clause)
 
         arcpy.SelectLayerByLocation_management(output_parcels_layer, "INTERSECT", wildfire_hazard_types_selected)
         arcpy.CalculateField_management(output_parcels_layer, field_to_calc, 0, "PYTHON")
@@ -740,7 +1114,8 @@ class RequirementFunctions(object):
             Field Values defining the floodplain come from here: https://waterresources.saccounty.net/stormready/PublishingImages/100-year-floodplain-map-small.jpg
         """
         output_parcels_layer = arcpy.MakeFeatureLayer_management(output_parcels_fc)
-        arcpy.SelectLayerByLocation_management(output_parcels_layer, "INTERSECT", flood_plain_fc)
+        reference_fc = reference_dataset(flood_plain_fc)[0]
+        arcpy.SelectLayerByLocation_management(output_parcels_layer, "INTERSECT", reference_fc)
         arcpy.CalculateField_management(output_parcels_layer, field_to_calc, 0, "PYTHON")
         arcpy.SelectLayerByAttribute_management(output_parcels_layer, "SWITCH_SELECTION")
         arcpy.CalculateField_management(output_parcels_layer, field_to_calc, 1, "PYTHON")
@@ -751,6 +1126,9 @@ class RequirementFunctions(object):
             Requirement Long Name: Landslide Hazard
             Description: Select parcels that intersect the Landslide Hazard dataset. Yes = 0, No = 1
         """
+        if use_landslide_zonal_engine:
+            return self.calc_requirement_9_5_zonal_engine(output_parcels_fc, field_to_calc)
+
         # Get the resolution of the landslide hazard raster
 
         #arcpy.env.parallelProcessingFactor = "50%"
@@ -799,6 +1177,41 @@ class RequirementFunctions(object):
 
         arcpy.DeleteField_management(output_parcels_fc, "COUNT")
 
+    def calc_requirement_9_5_zonal_engine(self, output_parcels_fc, field_to_calc):
+        """
+            9.5
+            Requirement Long Name: Landslide Hazard
+            Description: Same as calc_requirement_9_5, but the number of landslide hazard cells in each parcel is counted
+            by reading the raster in bounded windows aligned to groups of nearby parcels (see
+            Spatial_Engines.count_raster_cells_in_polygons). Parcels with >= landslide_area_percent_threshold percent of
+            their area in landslide hazard cells = 0, all other parcels = 1. Supports oids_to_calculate (short circuit).
+        """
+        read_window, x_origin, y_origin, cell_size, raster_columns, raster_rows, raster_spatial_reference = Array_IO.raster_window_reader(landslide_hazard_raster)
+        parcels_spatial_reference = arcpy.Describe(output_parcels_fc).spatialReference
+
+        print("Reading parcels...")
+        oids, parcels = Array_IO.read_geometries(output_parcels_fc, spatial_reference=raster_spatial_reference)
+
+        # The parcel area comes from the parcels coordinate system (same as the SHAPE_Area field).
+        if raster_spatial_reference.name == parcels_spatial_reference.name:
+            parcel_areas = shapely.area(parcels)
+        else:
+            parcel_areas = shapely.area(Array_IO.read_geometries(output_parcels_fc)[1])
+
+        to_calculate = np.ones(len(oids), dtype=bool) if self.oids_to_calculate is None else np.isin(oids, self.oids_to_calculate)
+
+        print("Counting landslide hazard cells in each parcel...")
+        counts = Spatial_Engines.count_raster_cells_in_polygons(parcels[to_calculate], read_window, x_origin, y_origin, cell_size, raster_columns, raster_rows, landslide_window_size)
+
+        # If the percent of the parcel with landslide hazard cells is >= the threshold, it's not eligible.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            percent_high_landslide = (counts * pow(cell_size, 2) / parcel_areas[to_calculate]) * 100
+        values = np.full(len(oids), Exemption_Engine.not_evaluated_value, dtype=np.int16)
+        values[to_calculate] = np.where((counts > 0) & (percent_high_landslide >= landslide_area_percent_threshold), 0, 1)
+
+        print("Writing values...")
+        Array_IO.write_columns(output_parcels_fc, oids, {field_to_calc: values})
+
     def calc_requirement_9_6(self, output_parcels_fc, field_to_calc):
         """
             9.6
@@ -806,7 +1219,8 @@ class RequirementFunctions(object):
             Description: Select parcels that intersect the State Conservancy Dataset. Yes = 0, No = 1
         """
         output_parcels_layer = arcpy.MakeFeatureLayer_management(output_parcels_fc)
-        arcpy.SelectLayerByLocation_management(output_parcels_layer, "INTERSECT", state_conservancy_fc)
+        reference_fc = reference_dataset(state_conservancy_fc)[0]
+        arcpy.SelectLayerByLocation_management(output_parcels_layer, "INTERSECT", reference_fc)
         arcpy.CalculateField_management(output_parcels_layer, field_to_calc, 0, "PYTHON")
         arcpy.SelectLayerByAttribute_management(output_parcels_layer, "SWITCH_SELECTION")
         arcpy.CalculateField_management(output_parcels_layer, field_to_calc, 1, "PYTHON")
@@ -818,7 +1232,8 @@ class RequirementFunctions(object):
             Description: Select parcels that intersect the Local Coastal Zone Dataset. Yes = 0, No = 1
         """
         output_parcels_layer = arcpy.MakeFeatureLayer_management(output_parcels_fc)
-        arcpy.SelectLayerByLocation_management(output_parcels_layer, "INTERSECT", local_coastal_zone_fc)
+        reference_fc = reference_dataset(local_coastal_zone_fc)[0]
+        arcpy.SelectLayerByLocation_management(output_parcels_layer, "INTERSECT", reference_fc)
         arcpy.CalculateField_management(output_parcels_layer, field_to_calc, 0, "PYTHON")
         arcpy.SelectLayerByAttribute_management(output_parcels_layer, "SWITCH_SELECTION")
         arcpy.CalculateField_management(output_parcels_layer, field_to_calc, 1, "PYTHON")
@@ -830,7 +1245,8 @@ class RequirementFunctions(object):
             Description: Select parcels that intersect the Protected Area Mask Dataset. Yes = 0, No = 1
         """
         output_parcels_layer = arcpy.MakeFeatureLayer_management(output_parcels_fc)
-        arcpy.SelectLayerByLocation_management(output_parcels_layer, "INTERSECT", protected_area_mask_fc)
+        reference_fc = reference_dataset(protected_area_mask_fc)[0]
+        arcpy.SelectLayerByLocation_management(output_parcels_layer, "INTERSECT", reference_fc)
         arcpy.CalculateField_management(output_parcels_layer, field_to_calc, 0, "PYTHON")
         arcpy.SelectLayerByAttribute_management(output_parcels_layer, "SWITCH_SELECTION")
         arcpy.CalculateField_management(output_parcels_layer, field_to_calc, 1, "PYTHON")
@@ -1075,114 +1491,65 @@ def calculate_exemptions(exemptions_to_calculate=exemptions.keys()):
         print("\nAdding exemptions_count field")
         arcpy.AddField_management(output_parcels_fc, "exemptions_count", "SHORT")
 
-    print("Calculating 0's in the 'exemptions_count' field.")
-    arcpy.CalculateField_management(output_parcels_fc, "exemptions_count", 0, "PYTHON")
-
     # Add a field for each exemption to calculate if it doesn't already exist.
     for exemption_to_calculate in exemptions_to_calculate:
         # Add a field for the exemption
-        exemption_field_name = "E_" + exemption_to_calculate.replace(".", "_")
+        exemption_field_name = Exemption_Engine.exemption_field_name(exemption_to_calculate)
         if not exemption_field_name in existing_output_fields:
             print("\nAdding exemption field " + exemption_field_name)
             arcpy.AddField_management(output_parcels_fc, exemption_field_name, "SHORT")
 
-    # Create an update cursor on the parcels feature class
-    with arcpy.da.UpdateCursor(output_parcels_fc, "*") as uc:
+    # Compile the exemptions dictionary into a plan that is evaluated over whole columns of requirement values.
+    exemption_plan = Exemption_Engine.compile_exemption_plan(exemptions, requirements, exemptions_to_calculate)
+    requirement_fields = Exemption_Engine.plan_requirement_fields(exemption_plan)
 
-        # For Every Row in the parcels table...
-        print("\nStarting update cursor loop to calculate exemptions...")
-        for row in uc:
-            exemptions_count = row[uc.fields.index("exemptions_count")]
-
-            # Do this for each exemption.
-            for exemption_to_calculate in exemptions_to_calculate:
-
-                exemption_field_name = "E_" + exemption_to_calculate.replace(".", "_")
-
-                # Get a list of the requirement ids for the exemption
-                requirement_ids = exemptions[exemption_to_calculate]
-
-                check_requirements = []
-
-                # For each Requirement, pull the values for these requirements out of the attribute table.
-                # Make one list for the ORs, and one list of the Ands
-                for requirement_id in requirement_ids:
-                    #ORs
-                    if type(requirement_id) == list:
-                        or_values = []
-                        for or_id in requirement_id:
-                            requirement_field_name = requirements[or_id]
-                            try:
-                                field_value = row[uc.fields.index(requirement_field_name)]
-                            except:
-                                print("Missing field for requirement " + requirement_field_name)
-                                print("Either add it to the requirements_with_no_data dictionary (if this county is missing data for this requirement), or run the calculate_requirements function on it.")
-                                exit()
-                            or_values.append(field_value)
-
-                        # If any of the OR requirements are met
-                        if any(or_values):
-                            check_requirements.append(1)
-                        # If there is a NULL value for one of the requirements, and no 1's, we can't be certain.
-                        elif None in or_values:
-                            check_requirements.append(None)
-                        # Otherwise all the OR requirements are zeros.
-                        else:
-                            check_requirements.append(0)
-
-                    #ANDs
-                    else:
-                        requirement_field_name = requirements[requirement_id]
-                        try:
-                            field_value = row[uc.fields.index(requirement_field_name)]
-                        except:
-                            print("Missing field for requirement " + requirement_field_name)
-                            print("Either add it to the requirements_with_no_data dictionary (if this county is missing data for this requirement), or run the calculate_requirements function on it.")
-                            exit()
-                        check_requirements.append(field_value)
-
-                # ALL 1's. All requirements met.
-                if all(check_requirements):
-                    exemptions_count += 1
-                    exemption_status = 1
-
-                # At least one 0. Requirements not met.
-                elif 0 in check_requirements:
-                    exemption_status = 0
-
-                # No 0's, but didn't meet ALL condition, so there's a None in there.
-                else:
-                    exemption_status = None
+    for requirement_field_name in requirement_fields:
+        if requirement_field_name not in existing_output_fields:
+            print("Missing field for requirement " + requirement_field_name)
+            print("Either add it to the requirements_with_no_data dictionary (if this county is missing data for this requirement), or run the calculate_requirements function on it.")
+            exit()
+
+    # Exemptions that aren't being recalculated still count towards the exemptions_count.
+    other_exemption_fields = []
+    for exemption in exemptions:
+        exemption_field_name = Exemption_Engine.exemption_field_name(exemption)
+        if exemption not in exemptions_to_calculate and exemption_field_name in existing_output_fields:
+            other_exemption_fields.append(exemption_field_name)
 
-                # Insert exemption status.
-                row[uc.fields.index(exemption_field_name)] = exemption_status
-                row[uc.fields.index("exemptions_count")] = exemptions_count
-                uc.updateRow(row)
+    print("\nReading requirement values...")
+    oids, requirement_columns = Array_IO.read_columns(output_parcels_fc, requirement_fields + other_exemption_fields)
 
-    # Call function to delete rows in the exemptions table for this county if this county is in that table.
-    output_exemptions_table_dev_team = output_gdb_dev_team + os.sep + output_exemptions_table_name
-    if arcpy.Exists(output_exemptions_table_dev_team):
-        delete_county_rows_from_dev_table(output_parcels_fc, output_exemptions_table_dev_team)
+    print("Evaluating exemptions...")
+    exemption_columns = Exemption_Engine.evaluate_exemption_plan(exemption_plan, requirement_columns)
+    for exemption_field_name in other_exemption_fields:
+        exemption_columns["exemptions_count"] += (requirement_columns[exemption_field_name] == 1)
+
+    print("Writing exemption values and the 'exemptions_count' field...")
+    Array_IO.write_columns(output_parcels_fc, oids, exemption_columns)
 
 
 # TABLES FOR DEV TEAM ##################################################################################################
 
 
-def create_requirements_table_dev_team():
-    """ Creates the requirements table """
+def dev_table_partition(table_name, county_name):
+    """ Returns the path to a county's partition of a dev team table (e.g., requirements_alameda). """
 
-    if arcpy.Exists(output_parcels_fc):
-        existing_output_fields = [field.name for field in arcpy.ListFields(output_parcels_fc)]
+    return output_gdb_dev_team + os.sep + table_name + "_" + county_name
 
-    # Keep PARCEL_ID field plus any requirement fields
-    fields_to_keep = [parcel_id_field, county_name_field]
-    for field in existing_output_fields:
-        if field in requirements.values():
-            fields_to_keep.append(field)
-            # Fix for issue where new requirements weren't being added to an existing requirements table because
-            # the schema's dont match when performing the append.
-            if arcpy.Exists(output_requirements_table) and field not in arcpy.ListFields(output_requirements_table):
-                arcpy.AddField_management(output_requirements_table, field, "SHORT")
+
+def swap_dev_table(new_table, table):
+    """ Replaces a table with a newly written one. The new table is written completely before the old table is deleted,
+        so a county's rows are never partially written. If a previous run stopped between the delete and the rename, the
+        new table is renamed here.
+    """
+
+    if arcpy.Exists(table):
+        arcpy.Delete_management(table)
+    arcpy.Rename_management(new_table, table)
+
+
+def write_dev_table_partition(table_name, county_name, fields_to_keep):
+    """ Writes the fields to keep from the output parcels to a county's partition of a dev team table. """
 
     # create an empty field mapping object
     mapS = arcpy.FieldMappings()
@@ -1192,31 +1559,59 @@ def create_requirements_table_dev_team():
         map.addInputField(output_parcels_fc, field)
         mapS.addFieldMap(map)
 
-    # If no requirements table exists, create it.
-    if not arcpy.Exists(output_requirements_table):
-        print("\nCreating Requirements table...")
-        arcpy.TableToTable_conversion(
-            in_rows=output_parcels_fc,
-            out_path=output_gdb_dev_team, out_name=output_requirements_table_name, where_clause="",
-            field_mapping=mapS,
-            config_keyword="")
+    partition = dev_table_partition(table_name, county_name)
+    new_partition = partition + dev_table_partition_suffix_new
+    if arcpy.Exists(new_partition):
+        arcpy.Delete_management(new_partition)
 
-    # Otherwise, append the rows
-    else:
-        print("\nAppending rows to the Requirements table...")
-        tmp_table = scratch_ws + os.sep + "tmp_table_requirements"
-        arcpy.CopyRows_management(output_parcels_fc, tmp_table)
-        #table_view = arcpy.MakeTableView_management(output_parcels_fc)
-        arcpy.Append_management(
-            inputs=tmp_table,
-            target=output_requirements_table,
-            schema_type="NO_TEST",
-            field_mapping=mapS,
-            subtype="")
+    arcpy.TableToTable_conversion(
+        in_rows=output_parcels_fc,
+        out_path=output_gdb_dev_team, out_name=os.path.basename(new_partition), where_clause="",
+        field_mapping=mapS,
+        config_keyword="")
+
+    swap_dev_table(new_partition, partition)
+
+
+def write_dev_table_parquet(table_name, county_name, fields_to_keep):
+    """ Writes the fields to keep from the output parcels to a county's Parquet file for a dev team table
+        (e.g., requirements/requirements_alameda.parquet). Values are read straight into arrays (no CopyRows/Append).
+    """
+
+    value_fields = [field for field in fields_to_keep if field not in (parcel_id_field, county_name_field)]
+    oids, columns = Array_IO.read_columns(output_parcels_fc, [parcel_id_field, county_name_field] + value_fields)
+    parcel_ids = columns.pop(parcel_id_field)
+    # Use the county name as it appears in the attribute table (the same value as in the geodatabase tables).
+    county_names = columns.pop(county_name_field)
+    county_name_in_att_table = str(county_names[0]) if len(county_names) else county_name
+
+    table = Parquet_Export.county_table(county_name_in_att_table, parcel_ids, columns, [field for field in value_fields if field != "exemptions_count"], parcel_id_field, county_name_field)
+
+    output_file = os.path.join(output_parquet_folder_dev_team, table_name, table_name + "_" + county_name + ".parquet")
+    Parquet_Export.write_county_table(output_file, table)
+
+
+def create_requirements_table_dev_team(county_name):
+    """ Creates the county's partition of the requirements table """
+
+    if arcpy.Exists(output_parcels_fc):
+        existing_output_fields = [field.name for field in arcpy.ListFields(output_parcels_fc)]
+
+    # Keep PARCEL_ID field plus any requirement fields
+    fields_to_keep = [parcel_id_field, county_name_field]
+    for field in existing_output_fields:
+        if field in requirements.values():
+            fields_to_keep.append(field)
 
+    print("\nWriting the Requirements table for this county...")
+    if dev_team_output_format in ("gdb", "both"):
+        write_dev_table_partition(output_requirements_table_name, county_name, fields_to_keep)
+    if dev_team_output_format in ("parquet", "both"):
+        write_dev_table_parquet(output_requirements_table_name, county_name, fields_to_keep)
 
-def create_exemptions_table_dev_team():
-    """ Creates the requirements table & adds the exemptions_count field"""
+
+def create_exemptions_table_dev_team(county_name):
+    """ Creates the county's partition of the exemptions table (with the exemptions_count field) """
 
     if arcpy.Exists(output_parcels_fc):
         existing_output_fields = [field.name for field in arcpy.ListFields(output_parcels_fc)]
@@ -1228,44 +1623,90 @@ def create_exemptions_table_dev_team():
         exemption_field_name = "E_" + exemption.replace(".", "_")
         exemption_fields.append(exemption_field_name)
 
-    # Keep PARCEL_ID field plus any requirement fields
+    # Keep PARCEL_ID field plus any exemption fields
     fields_to_keep = [parcel_id_field, county_name_field]
     for field in existing_output_fields:
         if field in exemption_fields:
             fields_to_keep.append(field)
-            if arcpy.Exists(output_exemptions_table) and field not in arcpy.ListFields(output_exemptions_table):
-                arcpy.AddField_management(output_exemptions_table, field, "SHORT")
 
     fields_to_keep.append("exemptions_count")
 
-    # create an empty field mapping object
-    mapS = arcpy.FieldMappings()
-    # for each field, create an individual field map, and add it to the field mapping object
-    for field in fields_to_keep:
-        map = arcpy.FieldMap()
-        map.addInputField(output_parcels_fc, field)
-        mapS.addFieldMap(map)
+    print("\nWriting the Exemptions table for this county...")
+    if dev_team_output_format in ("gdb", "both"):
+        write_dev_table_partition(output_exemptions_table_name, county_name, fields_to_keep)
+    if dev_team_output_format in ("parquet", "both"):
+        write_dev_table_parquet(output_exemptions_table_name, county_name, fields_to_keep)
+
+
+def list_dev_table_partitions(table_name):
+    """ Returns the paths to the county partitions of a dev team table. Finishes any swaps left incomplete by a
+        previous run.
+    """
+
+    arcpy.env.workspace = output_gdb_dev_team
+    partitions = []
+    for partition_name in arcpy.ListTables(table_name + "_*"):
+        partition = output_gdb_dev_team + os.sep + partition_name
+        if partition_name == table_name + dev_table_partition_suffix_new:
+            # An incomplete statewide table from a previous run (it's rebuilt from the partitions).
+            continue
+        if partition_name.endswith(dev_table_partition_suffix_new):
+            # The old partition was deleted but the new one wasn't renamed. Otherwise the new one is incomplete.
+            partition = partition[:-len(dev_table_partition_suffix_new)]
+            if arcpy.Exists(partition):
+                continue
+            swap_dev_table(partition + dev_table_partition_suffix_new, partition)
+        partitions.append(partition)
+
+    return sorted(set(partitions))
+
+
+def statewide_dev_tables_are_views():
+    """ Returns True if the dev team geodatabase supports database views (enterprise or mobile geodatabases). """
+
+    return output_gdb_dev_team.lower().endswith((".sde", ".geodatabase"))
+
+
+def create_statewide_dev_table(table_name):
+    """ Presents the county partitions of a dev team table as a single statewide table.
+        Enterprise (.sde) and mobile (.geodatabase) geodatabases support database views, so the statewide table is a
+        view (UNION ALL of the partitions) and is always up to date. File geodatabases don't, so the statewide table is
+        rebuilt by merging the partitions into a new table and swapping it in.
+    """
+
+    partitions = list_dev_table_partitions(table_name)
+    statewide_table = output_gdb_dev_team + os.sep + table_name
+
+    if not partitions:
+        print("No county partitions found for the " + table_name + " table.")
+        return
+
+    print("\nCreating the statewide " + table_name + " table from " + str(len(partitions)) + " county partitions...")
+
+    if statewide_dev_tables_are_views():
+        # The partitions may not all have the same fields (e.g., a requirement added after some counties were run).
+        partition_fields = []
+        all_fields = []
+        for partition in partitions:
+            fields = [field.name for field in arcpy.ListFields(partition) if field.type != "OID"]
+            partition_fields.append(fields)
+            all_fields.extend(field for field in fields if field not in all_fields)
 
-    # If no requirements table exists, create it.
-    if not arcpy.Exists(output_exemptions_table):
-        print("\nCreating Exemptions table...")
-        arcpy.TableToTable_conversion(
-            in_rows=output_parcels_fc,
-            out_path=output_gdb_dev_team, out_name=output_exemptions_table_name, where_clause="",
-            field_mapping=mapS,
-            config_keyword="")
+        selects = []
+        for partition, fields in zip(partitions, partition_fields):
+            columns = [field if field in fields else "NULL AS " + field for field in all_fields]
+            selects.append("SELECT " + ", ".join(columns) + " FROM " + os.path.basename(partition))
+
+        if arcpy.Exists(statewide_table):
+            arcpy.Delete_management(statewide_table)
+        arcpy.CreateDatabaseView_management(output_gdb_dev_team, table_name, " UNION ALL ".join(selects))
 
-    # Otherwise, append the rows
     else:
-        print("\nAppending rows to the Exemptions table...")
-        tmp_table = scratch_ws + os.sep + "tmp_table_exemptions"
-        arcpy.CopyRows_management(output_parcels_fc, tmp_table)
-        arcpy.Append_management(
-            inputs=tmp_table,
-            target=output_exemptions_table,
-            schema_type="NO_TEST",
-            field_mapping=mapS,
-            subtype="")
+        new_statewide_table = statewide_table + dev_table_partition_suffix_new
+        if arcpy.Exists(new_statewide_table):
+            arcpy.Delete_management(new_statewide_table)
+        arcpy.Merge_management(partitions, new_statewide_table)
+        swap_dev_table(new_statewide_table, statewide_table)
 
 
 # EXTRA FUNCTIONS ######################################################################################################
@@ -1286,60 +1727,169 @@ def list_fields():
         #print(str(field[0]) + ": " + field[1])
 
 
-# BEGIN PROCESSING #####################################################################################################
+# COUNTY PROCESSING ####################################################################################################
 
-start_time = datetime.datetime.now()
-print("\nStart Time: " + str(start_time))
+def set_county_parcels_fc_paths(input_parcels_fc_name):
+    """ Sets the paths to the input and output parcel feature classes for a county. """
 
-arcpy.env.workspace = input_parcels_gdb
+    global input_parcels_fc, output_parcels_fc, output_parcels_fc_dev_team
 
-if input_parcels_fc_list == "*":
-    input_parcels_fc_list = arcpy.ListFeatureClasses()
-    input_parcels_fc_list.sort()
-if requirements_to_process == "*":
-    requirements_to_process = requirements.keys()
+    # Get the path to the county parcels.
+    input_parcels_fc = input_parcels_gdb + os.sep + input_parcels_fc_name
 
-arcpy.env.workspace = output_gdb_dev_team
+    # Set the output Feature Class names.
+    output_parcels_fc = output_gdb_data_basin + os.sep + input_parcels_fc_name.lower() + "_" + "requirements_and_exemptions"
+    output_parcels_fc_dev_team = output_gdb_dev_team + os.sep + input_parcels_fc_name.lower()
 
-output_requirements_table = output_gdb_dev_team + os.sep + output_requirements_table_name
-output_exemptions_table = output_gdb_dev_team + os.sep + output_exemptions_table_name
 
-if input_parcels_fc_list == "*" and arcpy.Exists(output_requirements_table):
-    print("Note: If processing requirements for all counties, manually deleting the requirements table first is recommended since all records in this table will be deleted. This will increase performance")
+def county_fingerprints(county_name, parcels_fingerprint):
+    """ Returns a dictionary with the fingerprint of the current inputs to each requirement and exemption for a county.
+        Exemption fingerprints are based on the fingerprints of the requirements they depend on, so an exemption is only
+        out of date when one of its requirements has changed.
+    """
 
-if input_parcels_fc_list == "*" and arcpy.Exists(output_exemptions_table):
-    print("Note: If processing exemptions for all counties, manually deleting the exemptions table first is recommended since all records in this table will be deleted. This will increase performance")
+    requirements_with_no_data_this_county = requirements_with_no_data[county_name] + requirements_with_no_data["ALL_COUNTIES"]
 
-count = 1
-parcel_count = str(len(input_parcels_fc_list))
+    fingerprints = {}
+    for requirement_id in requirements:
+        datasets, parameters = requirement_inputs[requirement_id]
+        fingerprints[requirement_id] = Run_State.fingerprint([
+            parcels_fingerprint,
+            [Run_State.dataset_version(dataset) for dataset in datasets],
+            parameters,
+            requirement_id in requirements_with_no_data_this_county,
+        ])
+
+    # Short circuited results are partial: they depend on the requirements in the same exemptions (which decide the
+    # parcels they are calculated for), and they are out of date when short circuiting is turned off (backfill).
+    if short_circuit_requirements_enabled:
+        for requirement_id in short_circuit_requirements:
+            other_fingerprints = []
+            for exemption in exemptions:
+                requirement_ids = []
+                for or_ids in exemptions[exemption]:
+                    requirement_ids.extend(or_ids if type(or_ids) == list else [or_ids])
+                if requirement_id in requirement_ids:
+                    other_fingerprints.extend(fingerprints[other_id] for other_id in requirement_ids if other_id not in short_circuit_requirements)
+            fingerprints[requirement_id] = "partial:" + Run_State.fingerprint([fingerprints[requirement_id], sorted(set(other_fingerprints))])
+
+    for exemption in exemptions:
+        requirement_ids = []
+        for requirement_id in exemptions[exemption]:
+            requirement_ids.extend(requirement_id if type(requirement_id) == list else [requirement_id])
+        fingerprints["exemption:" + exemption] = Run_State.fingerprint([exemptions[exemption], [fingerprints[requirement_id] for requirement_id in requirement_ids]])
+
+    return fingerprints
+
+
+def county_parcels_fingerprint():
+    """ Returns the fingerprint of the county parcels (set by set_county_parcels_fc_paths) and the fields kept from them. """
+
+    return Run_State.fingerprint([Run_State.dataset_version(input_parcels_fc), original_fields_to_keep])
+
+
+def journal_fingerprints(current_fingerprints):
+    """ Returns the fingerprint of the inputs to each step in the run journal (step: fingerprint) from the current
+        fingerprints of a county (see county_fingerprints). The exemptions depend on every requirement, and the dev team
+        tables on every requirement and exemption.
+    """
 
-# For each parcel in the user defined list....
-for input_parcels_fc_name in input_parcels_fc_list:
+    step_fingerprints = dict(("requirement:" + requirement_id, current_fingerprints[requirement_id]) for requirement_id in requirements)
+    step_fingerprints["exemptions"] = Run_State.fingerprint(sorted([item, item_fingerprint] for item, item_fingerprint in current_fingerprints.items()))
+    step_fingerprints["dev_tables"] = step_fingerprints["exemptions"]
 
-    print("\nProcessing parcels (" + str(count) + "/" + parcel_count + "): " + input_parcels_fc_name + "\n")
-    # Get the path to the county parcels.
-    input_parcels_fc = input_parcels_gdb + os.sep + input_parcels_fc_name
+    return step_fingerprints
 
-    # Set the output Feature Class names.
-    output_parcels_fc = output_gdb_data_basin + os.sep + input_parcels_fc_name.lower() + "_" + "requirements_and_exemptions"
-    output_parcels_fc_dev_team = output_gdb_dev_team + os.sep + input_parcels_fc_name.lower()
 
-    # Create output Feature Class for Data Basin and for Dev Team if they don't already exist ##############
+def process_county(input_parcels_fc_name, requirements_to_process, stale_only=False, run_id=None, include_exemptions=True):
+    """ Calculates the requirements and exemptions for a county in the Data Basin output (the exemptions are skipped if
+        include_exemptions is False, e.g., for a requirement task from the task queue).
+        Does not write to the dev team geodatabase (see write_dev_team_outputs), so it is safe to run in a worker process.
+        If stale_only is True, only the requirements and exemptions with inputs that have changed since they were last
+        calculated are recalculated (see incremental_recompute).
+        If a run_id is given, the steps are recorded in the run journal, and steps that were completed by an earlier
+        attempt at the same run (with the same inputs) are skipped (see resume_interrupted_runs).
+    """
+
+    global existing_output_fields, run_journal
+
+    set_county_parcels_fc_paths(input_parcels_fc_name)
+    county_name = input_parcels_fc_name.split("_")[0].lower()
+
+    # Datasets may have changed since the last county (e.g., in a long running task queue worker).
+    Run_State.clear_dataset_versions()
+
+    if incremental_recompute or run_id:
+        parcels_fingerprint = county_parcels_fingerprint()
+        current_fingerprints = county_fingerprints(county_name, parcels_fingerprint)
+
+    # Steps completed by an earlier attempt at this run are only skipped if their inputs haven't changed since.
+    run_journal = None
+    if run_id:
+        journal_state = Run_State.RunState(run_state_db)
+        step_fingerprints = journal_fingerprints(current_fingerprints)
+        run_journal = [journal_state, run_id, county_name, step_fingerprints]
+        journal = journal_state.get_journal(run_id, county_name, step_fingerprints)
+
+    if incremental_recompute:
+        run_state = Run_State.RunState(run_state_db)
+        stored_fingerprints = run_state.get_fingerprints(county_name)
+
+        # If the county parcels have changed, the output parcels (and every result in them) are out of date.
+        if stale_only and arcpy.Exists(output_parcels_fc) and stored_fingerprints.get("parcels") != parcels_fingerprint:
+            print("The parcels for this county have changed since the output was created. Deleting the Data Basin output so it can be recreated...")
+            arcpy.Delete_management(output_parcels_fc)
+
+    # Create output Feature Class for Data Basin if it doesn't already exist ##############
     if not arcpy.Exists(output_parcels_fc):
         print("Copying to Data Basin GDB")
         copy_parcels_fc(input_parcels_fc, output_parcels_fc)
-    if not arcpy.Exists(output_parcels_fc_dev_team):
-        print("Copying to Dev Team GDB...")
-        copy_parcels_fc(input_parcels_fc, output_parcels_fc_dev_team)
+        if incremental_recompute:
+            run_state.delete_fingerprints(county_name)
+            stored_fingerprints = {"parcels": parcels_fingerprint}
+            run_state.set_fingerprints(county_name, stored_fingerprints)
+        # Nothing completed earlier in this run exists in the new output.
+        if run_journal:
+            journal_state.delete_journal(run_id, county_name)
+            journal = {}
 
     # Get a list of the fields that currently exist in the output feature class.
     existing_output_fields = [field.name for field in arcpy.ListFields(output_parcels_fc)]
 
+    exemptions_to_calculate = list(exemptions.keys()) if include_exemptions else []
+
+    if incremental_recompute:
+        if stale_only:
+            requirements_to_process = [requirement_id for requirement_id in requirements_to_process if stored_fingerprints.get(requirement_id) != current_fingerprints[requirement_id] or requirements[requirement_id] not in existing_output_fields]
+            exemptions_to_calculate = [exemption for exemption in exemptions_to_calculate if stored_fingerprints.get("exemption:" + exemption) != current_fingerprints["exemption:" + exemption] or Exemption_Engine.exemption_field_name(exemption) not in existing_output_fields]
+            print("Requirements that are out of date: " + str(requirements_to_process))
+            print("Exemptions that are out of date: " + str(exemptions_to_calculate))
+
+    # Resume: skip the steps completed by an earlier attempt at this run, and delete the fields of requirements that were
+    # interrupted part way through so they are recalculated from scratch.
+    requirements_calculated = requirements_to_process
+    if run_journal:
+        requirements_to_process = [requirement_id for requirement_id in requirements_to_process if journal.get("requirement:" + requirement_id) != "completed"]
+        for requirement_id in requirements_to_process:
+            if journal.get("requirement:" + requirement_id) == "started" and requirements[requirement_id] in existing_output_fields:
+                print("Requirement " + requirement_id + " was interrupted in an earlier attempt at this run. Deleting its field so it can be recalculated...")
+                arcpy.DeleteField_management(output_parcels_fc, requirements[requirement_id])
+                existing_output_fields.remove(requirements[requirement_id])
+        # Temporary field left behind by an interrupted calc_requirement_9_5.
+        if "COUNT" in existing_output_fields:
+            arcpy.DeleteField_management(output_parcels_fc, "COUNT")
+            existing_output_fields.remove("COUNT")
+        if journal.get("exemptions") == "completed":
+            exemptions_to_calculate = []
+        if journal:
+            print("Resuming this county. Requirements left to process: " + str(requirements_to_process))
+
     #################################### Choose Data Processing Functions ########################################
 
-    # Calling this function will delete any pre-existing rows in the requirements table for the counties being processed.
-    # If running on all counties with "*",  manually delete the requirements table first.
-    calculate_requirements(requirements_to_process)
+    if requirements_to_process:
+        calculate_requirements(requirements_to_process)
+    if requirements_calculated and incremental_recompute:
+        run_state.set_fingerprints(county_name, dict((requirement_id, current_fingerprints[requirement_id]) for requirement_id in requirements_calculated))
 
     # NOT NEEDED if all the additional requirements are processed by models called by this script.
     # Join Additional Requirement Fields (From Kai and other staff). Field names must have requirement ID at the end (e.g., 3_10)
@@ -1347,18 +1897,464 @@ for input_parcels_fc_name in input_parcels_fc_list:
     #join_additional_requirements(join_requirements_table, requirements_to_join)
     #rename_fields() # Only necessary if joining additional requirement fields.
 
-    # Calling this function will delete any pre-existing rows in the exemptions table for the counties being processed.
-    # If running on all counties with "*",  manually delete the exemptions table first.
-    calculate_exemptions()
+    if exemptions_to_calculate:
+        journal_steps(["exemptions"], "started")
+        with profile_step("exemptions"):
+            calculate_exemptions(exemptions_to_calculate)
+        if incremental_recompute:
+            run_state.set_fingerprints(county_name, dict(("exemption:" + exemption, current_fingerprints["exemption:" + exemption]) for exemption in exemptions_to_calculate))
+        journal_steps(["exemptions"], "completed")
+
+    if incremental_recompute:
+        run_state.close()
+    if run_journal:
+        journal_state.close()
+        run_journal = None
+
+    release_reference_layers()
+
+
+def write_dev_team_outputs(input_parcels_fc_name, stale_only=False, run_id=None):
+    """ Writes a county to the dev team geodatabase: copies the parcels (if they don't already exist) and replaces the
+        county's partitions of the requirements and exemptions tables. Only called from the main process (or from a
+        dev_tables task in the task queue, which only runs one at a time) so that the dev team geodatabase is never
+        written to by more than one process at a time.
+        If stale_only is True, the county is skipped if none of its results have changed since it was last written.
+        If a run_id is given, the county is skipped if its dev team outputs were completed by an earlier attempt at the
+        same run (with the same inputs). Returns True if the county's partitions were written.
+    """
+
+    set_county_parcels_fc_paths(input_parcels_fc_name)
+    county_name = input_parcels_fc_name.split("_")[0].lower()
+
+    step_fingerprints = None
+    if run_id:
+        Run_State.clear_dataset_versions()
+        step_fingerprints = journal_fingerprints(county_fingerprints(county_name, county_parcels_fingerprint()))
+        journal_state = Run_State.RunState(run_state_db)
+        dev_tables_status = journal_state.get_journal(run_id, county_name, step_fingerprints).get("dev_tables")
+        journal_state.close()
+        if dev_tables_status == "completed":
+            print("The dev team outputs for this county were completed by an earlier attempt at this run.")
+            return False
+
+    if incremental_recompute:
+        run_state = Run_State.RunState(run_state_db)
+        stored_fingerprints = run_state.get_fingerprints(county_name)
+        results_fingerprint = Run_State.fingerprint(sorted([item, item_fingerprint] for item, item_fingerprint in stored_fingerprints.items() if not item.startswith("dev_")))
+
+        if stale_only:
+            if stored_fingerprints.get("dev_parcels") != stored_fingerprints.get("parcels") and arcpy.Exists(output_parcels_fc_dev_team):
+                print("The parcels for this county have changed since the dev team parcels were created. Deleting them so they can be recreated...")
+                arcpy.Delete_management(output_parcels_fc_dev_team)
+            elif stored_fingerprints.get("dev_tables") == results_fingerprint:
+                print("The dev team outputs for this county are up to date.")
+                run_state.close()
+                set_dev_tables_journal(run_id, county_name, "completed", step_fingerprints)
+                return False
+
+    if not arcpy.Exists(output_parcels_fc_dev_team):
+        print("Copying to Dev Team GDB...")
+        copy_parcels_fc(input_parcels_fc, output_parcels_fc_dev_team)
+        if incremental_recompute:
+            run_state.set_fingerprints(county_name, {"dev_parcels": stored_fingerprints.get("parcels")})
+
+    # Replace this county's partitions of the requirements and exemptions tables.
+    set_dev_tables_journal(run_id, county_name, "started", step_fingerprints)
+    with profile_step("dev_table:requirements"):
+        create_requirements_table_dev_team(county_name)
+    with profile_step("dev_table:exemptions"):
+        create_exemptions_table_dev_team(county_name)
+
+    if incremental_recompute:
+        run_state.set_fingerprints(county_name, {"dev_tables": results_fingerprint})
+        run_state.close()
+    set_dev_tables_journal(run_id, county_name, "completed", step_fingerprints)
+
+    return True
+
+
+def set_dev_tables_journal(run_id, county_name, status, step_fingerprints=None):
+    """ Records the status of a county's dev team outputs in the run journal (if the run is journaled). """
+
+    if run_id:
+        journal_state = Run_State.RunState(run_state_db)
+        journal_state.set_journal(run_id, county_name, ["dev_tables"], status, step_fingerprints)
+        journal_state.close()
+
+
+def init_county_worker(profile_run_label=None):
+    """ Creates a scratch geodatabase for this worker process so temporary tables aren't shared between processes, and
+        starts the profiler for the worker process (its steps are recorded as part of the main process' run).
+    """
+
+    global scratch_ws
+
+    start_profiler(profile_run_label)
+
+    scratch_folder = os.path.dirname(scratch_ws)
+    worker_scratch_gdb_name = "Scratch_" + str(os.getpid()) + ".gdb"
+    worker_scratch_ws = scratch_folder + os.sep + worker_scratch_gdb_name
+
+    if not arcpy.Exists(worker_scratch_ws):
+        arcpy.CreateFileGDB_management(scratch_folder, worker_scratch_gdb_name)
+
+    scratch_ws = worker_scratch_ws
+    arcpy.env.scratchWorkspace = scratch_ws
+
+
+def process_county_worker(args):
+    """ Worker process wrapper around process_county. Returns the county and the error message (None if successful). """
+
+    input_parcels_fc_name, requirements_to_process, stale_only, run_id = args
+
+    try:
+        process_county(input_parcels_fc_name, requirements_to_process, stale_only, run_id)
+        return input_parcels_fc_name, None
+    except Exception:
+        return input_parcels_fc_name, traceback.format_exc()
+
+
+def order_counties_by_parcel_count(input_parcels_fc_list):
+    """ Returns the counties ordered from the most to the fewest parcels, so the largest counties (e.g., LOSANGELES,
+        SANDIEGO, ORANGE) are started first instead of being the last ones running at the end.
+    """
+
+    parcel_counts = {}
+    for input_parcels_fc_name in input_parcels_fc_list:
+        parcel_counts[input_parcels_fc_name] = int(arcpy.GetCount_management(input_parcels_gdb + os.sep + input_parcels_fc_name)[0])
+
+    return sorted(input_parcels_fc_list, key=lambda input_parcels_fc_name: parcel_counts[input_parcels_fc_name], reverse=True)
+
+
+def update_statewide_dev_tables(dev_tables_written, merge=None):
+    """ Recreates the statewide requirements and exemptions tables from the county partitions if a county's partitions
+        were written (or the tables don't exist). The Parquet files for each county are read together as one dataset,
+        so there's no statewide table to create.
+        In a file geodatabase the partitions are only merged if merge (default: merge_statewide_dev_tables) is True.
+    """
+
+    if dev_team_output_format not in ("gdb", "both"):
+        return
+
+    if merge is None:
+        merge = merge_statewide_dev_tables
+
+    if not statewide_dev_tables_are_views() and not merge:
+        if dev_tables_written:
+            print("\nThe statewide " + output_requirements_table_name + " and " + output_exemptions_table_name + " tables were not merged from the county partitions (merge_statewide_dev_tables is False) and are out of date." +
+                  " To merge them: python " + os.path.basename(__file__) + " statewide_tables")
+        return
+
+    output_requirements_table = output_gdb_dev_team + os.sep + output_requirements_table_name
+    output_exemptions_table = output_gdb_dev_team + os.sep + output_exemptions_table_name
+
+    if dev_tables_written or not arcpy.Exists(output_requirements_table) or not arcpy.Exists(output_exemptions_table):
+        create_statewide_dev_table(output_requirements_table_name)
+        create_statewide_dev_table(output_exemptions_table_name)
+
+
+def requirement_engine(requirement_id):
+    """ Returns the engine that calculates a requirement along with the other requirements of its kind ("centroid" or
+        "intersect"), or None if it's calculated on its own (see calculate_requirements).
+    """
+
+    if short_circuit_requirements_enabled and requirement_id in short_circuit_requirements:
+        return None
+    if use_centroid_engine and requirement_id in centroid_requirements:
+        return "centroid"
+    if use_intersect_engine and requirement_id in intersect_requirements:
+        return "intersect"
+
+    return None
+
+
+def queue_tasks(input_parcels_fc_list, requirements_to_process, stale_only, run_id):
+    """ Returns the tasks of a run for the task queue (see task_queue_db). Counties are claimed in the order of the list.
+        Each county has a requirement task for each engine (the centroid and intersect requirements are each calculated
+        in a single pass) and for each requirement calculated on its own. With short circuit evaluation, the
+        short circuited requirements depend on the county's other requirement tasks (they use their values).
+        The requirement and exemption tasks for a county are in the same exclusive group (they write to the same Data
+        Basin feature class), and the dev team tables tasks are in one exclusive group for the whole state.
+    """
+
+    # Requirement task name (after the county): requirement ids, in the order of requirements_to_process.
+    requirement_groups = {}
+    for requirement_id in requirements_to_process:
+        engine = requirement_engine(requirement_id)
+        group_name = "requirements:" + engine if engine else "requirement:" + requirement_id
+        if group_name not in requirement_groups:
+            requirement_groups[group_name] = []
+        requirement_groups[group_name].append(requirement_id)
+
+    tasks = []
+    dev_tables_tasks = []
+
+    for priority, input_parcels_fc_name in enumerate(input_parcels_fc_list):
+        county_name = input_parcels_fc_name.split("_")[0].lower()
+        county_group = "county:" + county_name
+        payload = {"input_parcels_fc_name": input_parcels_fc_name, "stale_only": stale_only, "run_id": run_id}
+
+        requirement_tasks = []
+        short_circuited_tasks = []
+        for group_name, requirement_ids in requirement_groups.items():
+            task = {"name": county_name + "/" + group_name, "kind": "requirement", "payload": dict(payload, requirement_ids=requirement_ids),
+                    "exclusive_group": county_group, "priority": priority}
+            if short_circuit_requirements_enabled and requirement_ids[0] in short_circuit_requirements:
+                short_circuited_tasks.append(task)
+            else:
+                requirement_tasks.append(task)
+
+        for task in short_circuited_tasks:
+            task["depends_on"] = [other_task["name"] for other_task in requirement_tasks]
+
+        requirement_tasks.extend(short_circuited_tasks)
+        tasks.extend(requirement_tasks)
+
+        tasks.append({"name": county_name + "/exemptions", "kind": "exemptions", "payload": payload, "depends_on": [task["name"] for task in requirement_tasks],
+                      "exclusive_group": county_group, "priority": priority})
+
+        dev_tables_tasks.append(county_name + "/dev_tables")
+        tasks.append({"name": dev_tables_tasks[-1], "kind": "dev_tables", "payload": payload, "depends_on": [county_name + "/exemptions"],
+                      "exclusive_group": "dev_tables", "priority": priority})
+
+    tasks.append({"name": "statewide_tables", "kind": "statewide_tables", "payload": None, "depends_on": dev_tables_tasks,
+                  "exclusive_group": "dev_tables", "priority": len(input_parcels_fc_list)})
+
+    return tasks
+
+
+def queue_run_id_prefix(input_parcels_fc_list, requirements_to_process, stale_only):
+    """ Returns the start of the task queue run id for the counties and requirements of a run. """
+
+    return Run_State.fingerprint([input_parcels_fc_list, requirements_to_process, stale_only]) + ":"
+
+
+def queue_run_inputs_fingerprint(input_parcels_fc_list):
+    """ Returns a fingerprint of the current inputs to every county of a run (the county parcels and the reference
+        datasets, where clauses, and thresholds of every requirement, see journal_fingerprints).
+    """
+
+    Run_State.clear_dataset_versions()
+    county_input_fingerprints = []
+    for input_parcels_fc_name in input_parcels_fc_list:
+        set_county_parcels_fc_paths(input_parcels_fc_name)
+        county_name = input_parcels_fc_name.split("_")[0].lower()
+        county_input_fingerprints.append(journal_fingerprints(county_fingerprints(county_name, county_parcels_fingerprint()))["dev_tables"])
+
+    return Run_State.fingerprint(county_input_fingerprints)
+
+
+def run_task(task_queue, task):
+    """ Runs a task from the task queue. Returns the task's result (True if a dev_tables task wrote the county's
+        partitions).
+    """
+
+    payload = task["payload"]
+
+    if task["kind"] == "requirement":
+        process_county(payload["input_parcels_fc_name"], payload["requirement_ids"], payload["stale_only"], payload["run_id"], include_exemptions=False)
+    elif task["kind"] == "exemptions":
+        process_county(payload["input_parcels_fc_name"], [], payload["stale_only"], payload["run_id"])
+    elif task["kind"] == "dev_tables":
+        return write_dev_team_outputs(payload["input_parcels_fc_name"], payload["stale_only"], payload["run_id"])
+    elif task["kind"] == "statewide_tables":
+        update_statewide_dev_tables(any(task_queue.results(task["run_id"], "dev_tables")))
+    else:
+        raise ValueError("Unknown task kind: " + str(task["kind"]))
+
+    return None
+
+
+def run_queue_worker(queue_run_id=None):
+    """ Claims and runs tasks from the task queue (from the run, or from any run if queue_run_id is None) until every
+        task has finished. The lease on a task is renewed by a heartbeat while it runs.
+    """
+
+    task_queue = Task_Queue.TaskQueue(task_queue_db)
+    worker = Task_Queue.worker_name()
+
+    while True:
+        task = task_queue.claim(worker, task_lease_seconds, queue_run_id)
+        if not task:
+            if task_queue.is_finished(queue_run_id):
+                break
+            time.sleep(task_poll_seconds)
+            continue
+
+        print("\nWorker " + worker + " running task: " + task["name"] + " (attempt " + str(task["attempts"]) + ")\n")
+
+        try:
+            with Task_Queue.Heartbeat(task_queue_db, task["id"], worker, task_lease_seconds) as heartbeat:
+                result = run_task(task_queue, task)
+        except Exception:
+            error = traceback.format_exc()
+            status = task_queue.fail(task["id"], worker, error)
+            print("\nERROR running task: " + task["name"] + "\n" + error)
+            print("The task will be retried." if status == "pending" else "The task has failed and the tasks that depend on it are skipped.")
+            continue
+
+        if heartbeat.lost or not task_queue.complete(task["id"], worker, result):
+            print("\nThe lease on task " + task["name"] + " was lost before it finished (it was claimed by another worker). Its result was discarded.")
+        else:
+            print("\nFinished task: " + task["name"])
+
+    task_queue.close()
+
+
+# BEGIN PROCESSING #####################################################################################################
+
+if __name__ == "__main__":
+
+    start_time = datetime.datetime.now()
+    print("\nStart Time: " + str(start_time))
+
+    # Worker mode: run tasks from the task queue (from any run) until there are none left.
+    if sys.argv[1:2] == ["worker"]:
+        if not task_queue_db:
+            print("Set task_queue_db to run a worker.")
+            sys.exit(1)
+        print("Running tasks from the task queue: " + task_queue_db)
+        init_county_worker(str(start_time))
+        run_queue_worker()
+        print("Duration: " + str(datetime.datetime.now() - start_time))
+        if profiler:
+            profiler.close()
+        sys.exit(0)
+
+    # On demand: merge (or recreate the views for) the statewide tables from the county partitions, then stop.
+    if sys.argv[1:2] == ["statewide_tables"]:
+        update_statewide_dev_tables(True, merge=True)
+        print("Duration: " + str(datetime.datetime.now() - start_time))
+        sys.exit(0)
+
+    start_profiler(str(start_time))
+
+    arcpy.env.workspace = input_parcels_gdb
+
+    if input_parcels_fc_list == "*":
+        input_parcels_fc_list = arcpy.ListFeatureClasses()
+        input_parcels_fc_list.sort()
+    # With "*", only the requirements that are out of date are recalculated if incremental_recompute is True.
+    stale_only = incremental_recompute and requirements_to_process == "*"
+    if requirements_to_process == "*":
+        requirements_to_process = requirements.keys()
+    requirements_to_process = list(requirements_to_process)
+
+    # A restarted run has the same counties and requirements, and resumes from the run journal.
+    run_id = None
+    if resume_interrupted_runs:
+        run_id = Run_State.fingerprint([input_parcels_fc_list, requirements_to_process, stale_only])
+        print("Run id (journal): " + run_id)
+
+    arcpy.env.workspace = output_gdb_dev_team
+
+    # The statewide tables are only recreated if a county's partitions were written.
+    dev_tables_written = False
+
+    count = 1
+    parcel_count = str(len(input_parcels_fc_list))
+    failed_counties = {}
+
+    if task_queue_db:
+
+        # A restarted run (same counties, requirements, and inputs) continues the tasks that are already in the queue.
+        # If the inputs have changed, the earlier run with the same counties and requirements is replaced.
+        run_id_prefix = queue_run_id_prefix(input_parcels_fc_list, requirements_to_process, stale_only)
+        queue_run_id = run_id_prefix + queue_run_inputs_fingerprint(input_parcels_fc_list)
+        print("\nAdding the tasks for this run to the task queue (run id: " + queue_run_id + ")...")
+
+        task_queue = Task_Queue.TaskQueue(task_queue_db)
+        for earlier_run_id in task_queue.run_ids():
+            if earlier_run_id.startswith(run_id_prefix) and earlier_run_id != queue_run_id:
+                print("Deleting an earlier run with the same counties and requirements and different inputs: " + earlier_run_id)
+                task_queue.delete_run(earlier_run_id)
+        tasks = queue_tasks(order_counties_by_parcel_count(input_parcels_fc_list), requirements_to_process, stale_only, run_id)
+        if not task_queue.add_run(queue_run_id, tasks, task_max_attempts):
+            print("This run is already in the task queue. Continuing it...")
+
+        print("Running tasks with " + str(county_worker_count) + " worker process(es) on this machine...")
+        if county_worker_count > 1:
+            pool = multiprocessing.Pool(county_worker_count, init_county_worker, (str(start_time),))
+            pool.map(run_queue_worker, [queue_run_id] * county_worker_count)
+            pool.close()
+            pool.join()
+        else:
+            run_queue_worker(queue_run_id)
+
+        # County task names start with the county (e.g., alameda/exemptions). The statewide tasks don't have a county.
+        failed_statewide_tasks = {}
+        print("\nTasks: " + str(task_queue.counts(queue_run_id)))
+        for unsuccessful_run_id, task_name, task_status, task_attempts, task_error in task_queue.unsuccessful_tasks(queue_run_id):
+            print("\n" + task_name + ": " + task_status + " after " + str(task_attempts) + " attempt(s)\n" + str(task_error))
+            if "/" in task_name:
+                failed_counties[task_name.split("/")[0]] = task_error
+            else:
+                failed_statewide_tasks[task_name] = task_error
+
+        if failed_counties:
+            print("\nThe following counties failed and need to be rerun: " + str(sorted(failed_counties.keys())))
+        if failed_statewide_tasks:
+            print("\nThe following statewide tasks failed (or were skipped) and need to be rerun: " + str(sorted(failed_statewide_tasks.keys())))
+        if failed_counties or failed_statewide_tasks:
+            print("To retry the failed tasks: python Task_Queue.py retry " + task_queue_db + " " + queue_run_id)
+        else:
+            # Every task has completed, so the next run with the same counties and requirements starts from the beginning.
+            task_queue.delete_run(queue_run_id)
+        task_queue.close()
+
+    elif county_worker_count > 1:
+
+        print("\nProcessing counties with " + str(county_worker_count) + " worker processes (largest counties first)...")
+        input_parcels_fc_list = order_counties_by_parcel_count(input_parcels_fc_list)
+
+        pool = multiprocessing.Pool(county_worker_count, init_county_worker, (str(start_time),))
+        county_args = [(input_parcels_fc_name, requirements_to_process, stale_only, run_id) for input_parcels_fc_name in input_parcels_fc_list]
+
+        # The main process is the only writer to the dev team geodatabase. Counties are written as the workers finish them.
+        for input_parcels_fc_name, error in pool.imap_unordered(process_county_worker, county_args):
+            if error:
+                print("\nERROR processing parcels: " + input_parcels_fc_name + "\n" + error)
+                failed_counties[input_parcels_fc_name] = error
+            else:
+                print("\nFinished processing parcels (" + str(count) + "/" + parcel_count + "): " + input_parcels_fc_name + "\n")
+                dev_tables_written = write_dev_team_outputs(input_parcels_fc_name, stale_only, run_id) or dev_tables_written
+            count += 1
+
+        pool.close()
+        pool.join()
+
+        if failed_counties:
+            print("\nThe following counties failed and need to be rerun: " + str(sorted(failed_counties.keys())))
+
+    else:
+
+        # For each parcel in the user defined list....
+        for input_parcels_fc_name in input_parcels_fc_list:
+
+            print("\nProcessing parcels (" + str(count) + "/" + parcel_count + "): " + input_parcels_fc_name + "\n")
+
+            process_county(input_parcels_fc_name, requirements_to_process, stale_only, run_id)
+            dev_tables_written = write_dev_team_outputs(input_parcels_fc_name, stale_only, run_id) or dev_tables_written
+
+            count += 1
+
+    # With the task queue, the statewide tables are updated by the statewide_tables task.
+    if not task_queue_db:
+        update_statewide_dev_tables(dev_tables_written)
 
-    create_requirements_table_dev_team()
-    create_exemptions_table_dev_team()
+    # Every county has completed, so the next run with the same counties and requirements starts from the beginning.
+    if run_id and not failed_counties:
+        journal_state = Run_State.RunState(run_state_db)
+        journal_state.delete_journal(run_id)
+        journal_state.close()
 
-    count += 1
+    end_time = datetime.datetime.now()
+    duration = end_time - start_time
 
-end_time = datetime.datetime.now()
-duration = end_time - start_time
+    print("Start Time: " + str(start_time))
+    print("End Time: " + str(end_time))
+    print("Duration: " + str(duration))
 
-print("Start Time: " + str(start_time))
-print("End Time: " + str(end_time))
-print("Duration: " + str(duration))
+    if profiler:
+        profiler.close()
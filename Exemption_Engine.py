@@ -0,0 +1,153 @@
+########################################################################################################################
+# File name: Exemption_Engine.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x (ArcGIS Pro)
+# Description:
+# Calculates exemptions from requirement values for all of the parcels in a county at once.
+# The exemptions dictionary is compiled into a plan once, and the plan is evaluated over whole columns of requirement
+# values (NumPy arrays) rather than row by row.
+# The values follow the same rules as the original update cursor implementation:
+# 1 = the requirement/exemption is met, 0 = it is not met, <null> = there is not enough information to tell.
+# For a group of requirements where only one needs to be met (e.g., ["3.2", "3.13", "3.14"]):
+#   Any 1 -> 1, otherwise any <null> -> <null>, otherwise 0.
+# For the exemption (all requirements or groups must be met):
+#   All 1's -> 1, otherwise any 0 -> 0, otherwise <null>.
+# Requirements that are short circuited (see requirements_that_can_change_exemptions) are only calculated for the parcels
+# where they could still change an exemption. The other parcels get not_evaluated_value, which is treated like <null>.
+########################################################################################################################
+
+import numpy as np
+
+# Value used in place of <null> in requirement and exemption arrays. Must match Array_IO.null_value.
+null_value = -1
+
+# Value of a requirement that wasn't calculated for a parcel because it couldn't change any of the parcel's exemptions.
+not_evaluated_value = -2
+
+
+def exemption_field_name(exemption):
+    """ Returns the name of the field for an exemption (e.g., 21159.24 -> E_21159_24). """
+
+    return "E_" + exemption.replace(".", "_")
+
+
+def compile_exemption_plan(exemptions, requirements, exemptions_to_calculate=None):
+    """ Compiles the exemptions dictionary into a list of [exemption field, groups], where groups is a list of lists of
+        requirement fields. Every group must be met for the exemption to be met, and a group is met if any of the
+        requirements in it are met. A single requirement is a group of one.
+    """
+
+    if exemptions_to_calculate is None:
+        exemptions_to_calculate = exemptions.keys()
+
+    plan = []
+    for exemption in exemptions_to_calculate:
+        groups = []
+        for requirement_id in exemptions[exemption]:
+            # ORs
+            if type(requirement_id) == list:
+                groups.append([requirements[or_id] for or_id in requirement_id])
+            # ANDs
+            else:
+                groups.append([requirements[requirement_id]])
+        plan.append([exemption_field_name(exemption), groups])
+
+    return plan
+
+
+def plan_requirement_fields(plan):
+    """ Returns a list of the requirement fields needed to evaluate the plan. """
+
+    fields = []
+    for exemption_field, groups in plan:
+        for group in groups:
+            for field in group:
+                if field not in fields:
+                    fields.append(field)
+
+    return fields
+
+
+def evaluate_group(group, columns):
+    """ Evaluates a group of requirements where only one needs to be met. """
+
+    values = np.vstack([columns[field] for field in group])
+    unknown = (values == null_value) | (values == not_evaluated_value)
+
+    return np.where((values == 1).any(axis=0), 1, np.where(unknown.any(axis=0), null_value, 0))
+
+
+def evaluate_exemption_plan(plan, columns):
+    """ Evaluates a compiled plan over whole columns of requirement values.
+        columns: dictionary of requirement field: array of 1/0/null_value.
+        Returns a dictionary of exemption field: int16 array, plus the "exemptions_count" field (the number of exemptions
+        in the plan that each parcel meets).
+    """
+
+    number_of_parcels = len(next(iter(columns.values()))) if columns else 0
+    exemptions_count = np.zeros(number_of_parcels, dtype=np.int16)
+
+    exemption_columns = {}
+    for exemption_field, groups in plan:
+        group_values = np.vstack([evaluate_group(group, columns) for group in groups]) if groups else np.ones((1, number_of_parcels))
+
+        exemption_values = np.where((group_values == 1).all(axis=0), 1, np.where((group_values == 0).any(axis=0), 0, null_value)).astype(np.int16)
+
+        exemptions_count += (exemption_values == 1)
+        exemption_columns[exemption_field] = exemption_values
+
+    exemption_columns["exemptions_count"] = exemptions_count
+
+    return exemption_columns
+
+
+def requirements_that_can_change_exemptions(exemptions, requirements, requirement_id, columns, number_of_parcels):
+    """ Returns a boolean array which is True for the parcels where the value of requirement_id could still change an
+        exemption, given the requirement values that are already known.
+        columns: dictionary of requirement field: array of 1/0/null_value for the requirements that have already been
+        calculated. Requirements that aren't in columns haven't been calculated yet (their value could be anything).
+        The requirement can't change an exemption if the exemption is already 0 because of another requirement (or OR
+        group) that is 0, or if the requirement is in an OR group that is already 1 because of another requirement.
+        Requirements that aren't used by any exemption are needed for every parcel.
+        This is a conservative test (known <null> values are treated like values that aren't known yet), so it never
+        skips a parcel where the requirement could change an exemption.
+    """
+
+    needed = np.zeros(number_of_parcels, dtype=bool)
+    used = False
+
+    def known_values(or_id, value):
+        field = requirements[or_id]
+        if field not in columns:
+            return np.zeros(number_of_parcels, dtype=bool)
+        return columns[field] == value
+
+    for exemption in exemptions:
+        groups = [requirement if type(requirement) == list else [requirement] for requirement in exemptions[exemption]]
+        if not any(requirement_id in group for group in groups):
+            continue
+        used = True
+
+        # Parcels where the exemption is already 0 because every requirement in another group is 0.
+        exemption_is_0 = np.zeros(number_of_parcels, dtype=bool)
+        for group in groups:
+            if requirement_id not in group:
+                group_is_0 = np.ones(number_of_parcels, dtype=bool)
+                for or_id in group:
+                    group_is_0 &= known_values(or_id, 0)
+                exemption_is_0 |= group_is_0
+
+        for group in groups:
+            if requirement_id in group:
+                # Parcels where the group is already 1 because of another requirement in it.
+                group_is_1 = np.zeros(number_of_parcels, dtype=bool)
+                for or_id in group:
+                    if or_id != requirement_id:
+                        group_is_1 |= known_values(or_id, 1)
+                needed |= ~exemption_is_0 & ~group_is_1
+
+    if not used:
+        return np.ones(number_of_parcels, dtype=bool)
+
+    return needed
@@ -0,0 +1,124 @@
+########################################################################################################################
+# File name: Geometry_Hash.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x (ArcGIS Pro)
+# Description:
+# Canonical geometry hashes and a compact hash set, used to find parcels with duplicate geometries while the parcels
+# are streamed (Prepare_Parcels.project_explode_and_dedupe) instead of DeleteIdentical on a whole feature class.
+# A geometry's hash is calculated from its coordinates after they are quantized (rounded to a grid) and the geometry is
+# normalized (ring orientation, ring start point, and hole order made canonical), so two parcels with the same shape
+# have the same hash regardless of where their rings start or which way they were digitized.
+# The hash set is an open addressing table of 64-bit hashes in a NumPy array (8 bytes per slot, at most half full), so
+# memory is bounded by the number of unique parcels (~256 MB for 12-16 million).
+# Note: with 64-bit hashes, the chance of two different parcels having the same hash in a statewide run is ~1 in 250,000.
+# Requires shapely 2.x.
+########################################################################################################################
+
+import numpy as np
+import shapely
+
+# Coordinates are rounded to a grid of this size (in the units of the coordinate system, meters for Teale Albers).
+default_quantum = 0.001
+
+
+def mix(values):
+    """ splitmix64 finalizer. Spreads the bits of an array of uint64 values. """
+
+    with np.errstate(over="ignore"):
+        values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+
+    return values ^ (values >> np.uint64(31))
+
+
+def canonical_hashes(geometries, quantum=default_quantum):
+    """ Returns a uint64 hash for each geometry. Geometries that are the same after quantizing the coordinates to
+        quantum have the same hash. Empty (None) geometries get a hash of 0.
+    """
+
+    geometries = np.asarray(geometries, dtype=object)
+    hashes = np.zeros(len(geometries), dtype=np.uint64)
+    has_geometry = ~shapely.is_missing(geometries) & ~shapely.is_empty(geometries)
+    if not has_geometry.any():
+        return hashes
+
+    canonical = shapely.normalize(shapely.set_precision(geometries[has_geometry], quantum, mode="pointwise"))
+    coordinates, geometry_index = shapely.get_coordinates(canonical, return_index=True)
+    counts = np.bincount(geometry_index, minlength=len(canonical))
+
+    # Position of each coordinate within its geometry, so the same coordinates in a different order hash differently.
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    positions = np.arange(len(coordinates)) - np.repeat(starts, counts)
+
+    grid = np.round(coordinates / quantum).astype(np.int64).view(np.uint64)
+    with np.errstate(over="ignore"):
+        coordinate_hashes = mix(mix(grid[:, 0]) + grid[:, 1] * np.uint64(0x9E3779B97F4A7C15) + positions.astype(np.uint64))
+        geometry_hashes = np.zeros(len(canonical), dtype=np.uint64)
+        np.add.at(geometry_hashes, geometry_index, coordinate_hashes)
+
+        # Include the number of coordinates and rings, so the coordinates can't be split into rings differently.
+        rings = shapely.get_num_interior_rings(canonical).astype(np.uint64)
+        geometry_hashes = mix(geometry_hashes + mix(counts.astype(np.uint64) + (rings << np.uint64(32))))
+
+    # 0 marks an empty slot in HashSet.
+    geometry_hashes[geometry_hashes == 0] = 1
+    hashes[has_geometry] = geometry_hashes
+
+    return hashes
+
+
+class HashSet(object):
+    """ Set of uint64 hashes (0 is not allowed) in an open addressing table with linear probing. """
+
+    def __init__(self, capacity=1 << 20):
+        self.table = np.zeros(1 << int(np.ceil(np.log2(max(capacity, 16)))), dtype=np.uint64)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def grow(self):
+        hashes = self.table[self.table != 0]
+        self.table = np.zeros(len(self.table) * 2, dtype=np.uint64)
+        self.size = 0
+        self.add(hashes)
+
+    def add(self, hashes):
+        """ Adds an array of hashes to the set. Returns a boolean array which is True for the hashes that weren't
+            already in the set (for a hash that appears more than once in the array, only the first is True).
+        """
+
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        while (self.size + len(hashes)) * 2 > len(self.table):
+            self.grow()
+
+        mask = np.uint64(len(self.table) - 1)
+        added = np.zeros(len(hashes), dtype=bool)
+        pending = np.arange(len(hashes))
+        slots = mix(hashes) & mask
+
+        while len(pending):
+            slot_values = self.table[slots[pending]]
+
+            # Already in the set.
+            found = slot_values == hashes[pending]
+
+            # Empty slot: the first pending hash for each empty slot is inserted. The others check the slot again.
+            empty = np.nonzero(slot_values == 0)[0]
+            unique_slots, first = np.unique(slots[pending[empty]], return_index=True)
+            inserted = pending[empty[first]]
+            self.table[unique_slots] = hashes[inserted]
+            added[inserted] = True
+            self.size += len(inserted)
+
+            done = found.copy()
+            done[empty[first]] = True
+
+            # Slot taken by a different hash: try the next slot.
+            collided = ~found & (slot_values != 0)
+            slots[pending[collided]] = (slots[pending[collided]] + np.uint64(1)) & mask
+
+            pending = pending[~done]
+
+        return added
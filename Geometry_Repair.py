@@ -0,0 +1,138 @@
+########################################################################################################################
+# File name: Geometry_Repair.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x (ArcGIS Pro)
+# Description:
+# Checks and repairs the validity of polygons in chunks across a process pool, used by Prepare_Zoning.repair_geometry in
+# place of a single RepairGeometry on the statewide zoning.
+# The validity of each polygon is recorded in a SQLite cache keyed by a hash of its geometry (WKB), along with the
+# repaired geometry if it wasn't valid. When a new zoning drop is prepared, only the polygons that are new or changed
+# are checked again (a polygon that didn't change has the same hash).
+# Repairs use shapely.make_valid (OGC validity, GEOS). Only the polygon parts of a repaired geometry are kept (make_valid
+# can return lines or points where a ring collapses).
+# Requires shapely 2.x.
+########################################################################################################################
+
+import hashlib
+import multiprocessing
+import sqlite3
+import numpy as np
+import shapely
+
+# Number of polygons checked by a worker at a time.
+default_chunk_size = 10000
+
+
+def geometry_hash(wkb):
+    """ Returns a hash (hex string) of a geometry's WKB. """
+
+    return hashlib.blake2b(wkb, digest_size=16).hexdigest()
+
+
+def polygon_parts(geometry):
+    """ Returns the polygon parts of a geometry as a MultiPolygon (or Polygon if there's one), or None if there are none. """
+
+    parts = shapely.get_parts(geometry)
+    parts = parts[np.isin(shapely.get_type_id(parts), [3, 6])]
+    parts = shapely.get_parts(parts)
+    if len(parts) == 0:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+
+    return shapely.multipolygons(parts)
+
+
+def check_and_repair_chunk(wkbs):
+    """ Checks the validity of a chunk of geometries (as WKB). Returns a list of (is valid, repaired WKB) with None as the
+        repaired WKB for valid geometries and for invalid geometries with no polygon area left after the repair.
+    """
+
+    geometries = shapely.from_wkb(np.array(wkbs, dtype=object))
+    is_valid = shapely.is_valid(geometries)
+
+    results = []
+    for geometry, valid in zip(geometries, is_valid.tolist()):
+        if valid:
+            results.append((True, None))
+        else:
+            repaired = polygon_parts(shapely.make_valid(geometry))
+            results.append((False, shapely.to_wkb(repaired) if repaired is not None else None))
+
+    return results
+
+
+class ValidityCache(object):
+    """ SQLite cache of geometry hash: (is valid, repaired WKB). """
+
+    def __init__(self, database):
+        self.connection = sqlite3.connect(database, timeout=300)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS validity (geometry_hash TEXT PRIMARY KEY, is_valid INTEGER, repaired_wkb BLOB)")
+        self.connection.commit()
+
+    def get(self, hashes):
+        """ Returns a dictionary of geometry hash: (is valid, repaired WKB) for the hashes in the cache. """
+
+        cached = {}
+        unique_hashes = list(set(hashes))
+        for start in range(0, len(unique_hashes), 500):
+            batch = unique_hashes[start:start + 500]
+            rows = self.connection.execute("SELECT geometry_hash, is_valid, repaired_wkb FROM validity WHERE geometry_hash IN (" + ",".join("?" * len(batch)) + ")", batch)
+            for geometry_hash_value, is_valid, repaired_wkb in rows:
+                cached[geometry_hash_value] = (bool(is_valid), bytes(repaired_wkb) if repaired_wkb is not None else None)
+
+        return cached
+
+    def set(self, results):
+        """ Stores a dictionary of geometry hash: (is valid, repaired WKB). """
+
+        self.connection.executemany("INSERT OR REPLACE INTO validity (geometry_hash, is_valid, repaired_wkb) VALUES (?, ?, ?)",
+                                    [(key, int(is_valid), repaired_wkb) for key, (is_valid, repaired_wkb) in results.items()])
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+def check_and_repair(batches, database, chunk_size=default_chunk_size, workers=None):
+    """ Checks the validity of each batch of (ids, WKBs) in batches (e.g., read from a feature class), using the validity
+        cache in database and a process pool for the geometries that aren't in the cache.
+        Yields (id, repaired WKB) for each invalid geometry (with None as the repaired WKB if there's no polygon left).
+        Prints the number of geometries checked, found in the cache, and repaired for each batch.
+    """
+
+    cache = ValidityCache(database)
+    pool = multiprocessing.Pool(workers) if workers != 1 else None
+
+    try:
+        for ids, wkbs in batches:
+            hashes = [geometry_hash(wkb) if wkb else None for wkb in wkbs]
+            results = cache.get([key for key in hashes if key])
+
+            # Geometries to check (one of each).
+            to_check = {}
+            for key, wkb in zip(hashes, wkbs):
+                if key and key not in results and key not in to_check:
+                    to_check[key] = wkb
+
+            keys = list(to_check.keys())
+            chunks = [[to_check[key] for key in keys[start:start + chunk_size]] for start in range(0, len(keys), chunk_size)]
+            checked = pool.map(check_and_repair_chunk, chunks) if pool else [check_and_repair_chunk(chunk) for chunk in chunks]
+            new_results = dict(zip(keys, [result for chunk_results in checked for result in chunk_results]))
+            cache.set(new_results)
+            results.update(new_results)
+
+            repaired = 0
+            for feature_id, key in zip(ids, hashes):
+                if key and not results[key][0]:
+                    repaired += 1
+                    yield feature_id, results[key][1]
+
+            print(str(len(ids)) + " geometries: " + str(len(keys)) + " checked (the rest were in the validity cache), " + str(repaired) + " invalid")
+
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        cache.close()
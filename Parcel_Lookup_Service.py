@@ -0,0 +1,525 @@
+########################################################################################################################
+# File name: Parcel_Lookup_Service.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x (ArcGIS Pro to build the index, any Python 3 with numpy and shapely 2.x to query it)
+# Description:
+# Answers "which requirements and exemptions apply at this lat/lon or APN" in milliseconds, from an index built from
+# the county outputs of Calculate_CEQA_Requirements_and_Exemptions_Statewide.py (*_requirements_and_exemptions).
+# The index is built one county at a time (IndexWriter) and is a folder of NumPy files that are memory-mapped when opened, so a server or worker process starts
+# instantly and only the pages it reads are loaded:
+# - A grid spatial index over the parcel bounding boxes (cells of grid_cell_size meters in Teale Albers), with each
+#   parcel's geometry stored as WKB and only parsed when a point falls in its bounding box.
+# - Hash indexes on fips_apn and cbi_parcel_id_fips_apn_oid: an open addressing table with each unique key once,
+#   pointing to the key's range of rows in an array of rows sorted by key (parcels without a key aren't indexed).
+# - The requirement and exemption values of every parcel (1/0/-1 = <null>) in one int8 matrix.
+# Usage:
+# python Parcel_Lookup_Service.py build <index folder> [output geodatabase]  (requires arcpy)
+# python Parcel_Lookup_Service.py serve <index folder> [port]
+#   GET /point?lon=-121.5&lat=38.5[&datum=WGS84]  GET /apn?fips_apn=...  GET /parcel?id=...
+#   POST /batch[?datum=WGS84] with a CSV body (see Batch_Evaluation.py): the result CSV is streamed back.
+# python Parcel_Lookup_Service.py benchmark <index folder> [number of queries]  (p50/p99 latency)
+# Python API: ParcelIndex(index_folder).lookup_point(lon, lat) / .lookup_apn(fips_apn) / .lookup_parcel_id(parcel_id)
+########################################################################################################################
+
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import time
+import numpy as np
+import shapely
+import Batch_Evaluation
+import Reprojection
+
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    ThreadingHTTPServer = None
+
+# County outputs the index is built from (the Data Basin output geodatabase of the main script).
+output_gdb_data_basin = r"P:\Projects3\CEQA_Site_Check_Version_2_0_2023_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Outputs\Outputs_for_DataBasin.gdb"
+output_fc_suffix = "_requirements_and_exemptions"
+
+# Field names.
+parcel_id_field = "cbi_parcel_id_fips_apn_oid"
+fips_apn_field = "fips_apn"
+county_name_field = "county_name"
+
+# Requirement fields end with the requirement id (e.g., within_city_limits_2_3). Exemption fields start with E_.
+value_field_pattern = re.compile(r"(_\d+_\d+$)|(^E_)|(^exemptions_count$)")
+
+# Width and height of a grid cell in the spatial index (meters).
+grid_cell_size = 1000
+
+default_port = 8765
+
+# Value stored in place of <null>.
+null_value = -1
+
+
+def key_hashes(keys):
+    """ Returns a uint64 hash for each key (string). """
+
+    return np.array([int.from_bytes(hashlib.blake2b(key.encode("utf-8") if isinstance(key, str) else bytes(key), digest_size=8).digest(), "little") for key in keys], dtype=np.uint64)
+
+
+def build_hash_table(hashes):
+    """ Returns an open addressing table (linear probing) of positions in an array of uint64 hashes (of unique keys).
+        Empty slots are -1.
+    """
+
+    table = np.full(1 << int(np.ceil(np.log2(max(len(hashes) * 2, 16)))), -1, dtype=np.int64)
+    mask = np.uint64(len(table) - 1)
+    slots = hashes & mask
+    pending = np.arange(len(hashes))
+
+    while len(pending):
+        empty = np.nonzero(table[slots[pending]] == -1)[0]
+        unique_slots, first = np.unique(slots[pending[empty]], return_index=True)
+        table[unique_slots] = pending[empty[first]]
+
+        inserted = np.zeros(len(pending), dtype=bool)
+        inserted[empty[first]] = True
+        moved = pending[~inserted]
+        slots[moved] = (slots[moved] + np.uint64(1)) & mask
+        pending = moved
+
+    return table
+
+
+def build_key_index(keys):
+    """ Returns a hash index on an array of keys (bytes, b"" = no key): an open addressing table of key numbers (see
+        build_hash_table), the start of each key's rows (followed by the total number of rows), and the rows with a key
+        sorted by key. Each unique key is in the table once, and parcels without a key aren't indexed.
+    """
+
+    keys = np.asarray(keys)
+    rows = np.nonzero(keys != b"")[0]
+    rows = rows[np.argsort(keys[rows], kind="stable")]
+    sorted_keys = keys[rows]
+
+    is_first = np.ones(len(rows), dtype=bool)
+    is_first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    starts = np.nonzero(is_first)[0]
+
+    return build_hash_table(key_hashes(sorted_keys[starts])), np.append(starts, len(rows)).astype(np.int64), rows.astype(np.int64)
+
+
+def build_grid(bounds, cell_size):
+    """ Returns the grid spatial index (sorted cell keys, start of each cell's rows, rows) for an (n, 4) array of
+        bounding boxes. A row is listed in every cell its bounding box overlaps.
+    """
+
+    valid = ~np.isnan(bounds).any(axis=1)
+    rows = np.nonzero(valid)[0]
+    column_min = np.floor(bounds[rows, 0] / cell_size).astype(np.int64)
+    column_max = np.floor(bounds[rows, 2] / cell_size).astype(np.int64)
+    row_min = np.floor(bounds[rows, 1] / cell_size).astype(np.int64)
+    row_max = np.floor(bounds[rows, 3] / cell_size).astype(np.int64)
+
+    columns = column_max - column_min + 1
+    cells_per_row = columns * (row_max - row_min + 1)
+    item_rows = np.repeat(rows, cells_per_row)
+    offsets = np.arange(len(item_rows)) - np.repeat(np.cumsum(cells_per_row) - cells_per_row, cells_per_row)
+    cell_columns = np.repeat(column_min, cells_per_row) + offsets % np.repeat(columns, cells_per_row)
+    cell_rows = np.repeat(row_min, cells_per_row) + offsets // np.repeat(columns, cells_per_row)
+
+    keys = cell_key(cell_columns, cell_rows)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    item_rows = item_rows[order]
+
+    unique_keys, starts = np.unique(keys, return_index=True)
+
+    return unique_keys, np.append(starts, len(keys)).astype(np.int64), item_rows.astype(np.int64)
+
+
+def cell_key(columns, rows):
+    """ Returns the grid cell key for cell columns and rows (which can be negative). """
+
+    return (np.asarray(rows, dtype=np.int64) + (1 << 30)) * (1 << 31) + (np.asarray(columns, dtype=np.int64) + (1 << 30))
+
+
+def key_array(values):
+    """ Returns an array of keys (UTF-8 bytes, b"" for <null>) from a list of strings. """
+
+    if not len(values):
+        return np.array([], dtype="S1")
+
+    return np.array([str(value).encode("utf-8") if value is not None else b"" for value in values], dtype=np.bytes_)
+
+
+class IndexWriter(object):
+    """ Writes an index one county at a time. The arrays of each county are saved to a parts folder as the county is
+        added, and finish combines them (and builds the grid and hash indexes), so only one county's geometries and WKB
+        are in memory at a time.
+    """
+
+    def __init__(self, index_folder, value_fields):
+        self.index_folder = index_folder
+        self.value_fields = list(value_fields)
+        self.parts_folder = os.path.join(index_folder, "parts")
+        if os.path.exists(self.parts_folder):
+            shutil.rmtree(self.parts_folder)
+        os.makedirs(self.parts_folder)
+
+        self.county_names = []
+        self.parts = {}
+        self.parcels = 0
+        self.geometry_bytes = 0
+
+        # Empty first parts, so every array has a part (and the geometry offsets start at 0).
+        self.save_part("county_index", np.array([], dtype=np.int16))
+        self.save_part("parcel_ids", key_array([]))
+        self.save_part("fips_apns", key_array([]))
+        self.save_part("geometries", np.array([], dtype=np.uint8))
+        self.save_part("geometry_offsets", np.zeros(1, dtype=np.int64))
+        self.save_part("bounds", np.zeros((0, 4), dtype=np.float64))
+        self.save_part("values", np.zeros((0, len(self.value_fields)), dtype=np.int8))
+
+    def save_part(self, name, array):
+        if name not in self.parts:
+            self.parts[name] = []
+        path = os.path.join(self.parts_folder, name + "_" + str(len(self.parts[name])) + ".npy")
+        np.save(path, array)
+        self.parts[name].append(path)
+
+    def add_county(self, county_name, parcel_ids, fips_apns, geometries, values):
+        """ Adds a county: the parcel id, fips_apn, and geometry (shapely, Teale Albers) of each parcel, and an
+            (n, number of value fields) array of requirement and exemption values (null_value = <null>).
+        """
+
+        geometries = np.asarray(geometries, dtype=object)
+        wkbs = shapely.to_wkb(geometries)
+        lengths = np.array([len(wkb) if wkb is not None else 0 for wkb in wkbs], dtype=np.int64)
+
+        self.county_names.append(county_name)
+        self.save_part("county_index", np.full(len(geometries), len(self.county_names) - 1, dtype=np.int16))
+        self.save_part("parcel_ids", key_array(parcel_ids))
+        self.save_part("fips_apns", key_array(fips_apns))
+        self.save_part("geometries", np.frombuffer(b"".join(wkb for wkb in wkbs if wkb is not None), dtype=np.uint8))
+        self.save_part("geometry_offsets", self.geometry_bytes + np.cumsum(lengths))
+        self.save_part("bounds", shapely.bounds(geometries))
+        self.save_part("values", np.asarray(values, dtype=np.int8).reshape(len(geometries), len(self.value_fields)))
+
+        self.parcels += len(geometries)
+        self.geometry_bytes += int(lengths.sum())
+
+    def combine(self, name):
+        """ Writes the parts of an array to the index folder. Returns the array (memory-mapped). """
+
+        parts = [np.load(path, mmap_mode="r") for path in self.parts[name]]
+        dtype = np.result_type(*[part.dtype for part in parts])
+        path = os.path.join(self.index_folder, name + ".npy")
+        array = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(sum(len(part) for part in parts),) + parts[0].shape[1:])
+        position = 0
+        for part in parts:
+            array[position:position + len(part)] = part
+            position += len(part)
+        array.flush()
+        del array, parts
+
+        return np.load(path, mmap_mode="r")
+
+    def finish(self):
+        """ Combines the counties and writes the grid and hash indexes and index.json. """
+
+        for name in ["county_index", "geometries", "geometry_offsets", "values"]:
+            self.combine(name)
+
+        bounds = self.combine("bounds")
+        arrays = dict(zip(["grid_keys", "grid_starts", "grid_rows"], build_grid(np.asarray(bounds), grid_cell_size)))
+
+        for key_name, name in [("parcel_id", "parcel_ids"), ("fips_apn", "fips_apns")]:
+            arrays.update(zip([key_name + "_table", key_name + "_starts", key_name + "_rows"], build_key_index(self.combine(name))))
+
+        for name, array in arrays.items():
+            np.save(os.path.join(self.index_folder, name + ".npy"), array)
+
+        with open(os.path.join(self.index_folder, "index.json"), "w") as f:
+            json.dump({"county_names": self.county_names, "value_fields": self.value_fields, "grid_cell_size": grid_cell_size, "parcels": self.parcels}, f, indent=2)
+
+        del bounds
+        shutil.rmtree(self.parts_folder)
+
+
+def build_index(index_folder, output_gdb=output_gdb_data_basin):
+    """ Builds the index from the county outputs (*_requirements_and_exemptions) in the output geodatabase. Requires
+        arcpy. The requirement and exemption fields are the SHORT fields that match value_field_pattern (the union of the
+        fields of all counties, with <null> where a county doesn't have a field).
+    """
+
+    import arcpy
+    import Array_IO
+
+    arcpy.env.workspace = output_gdb
+    county_fcs = sorted(arcpy.ListFeatureClasses("*" + output_fc_suffix))
+
+    value_fields = []
+    for county_fc in county_fcs:
+        for field in arcpy.ListFields(county_fc, field_type="SmallInteger"):
+            if value_field_pattern.search(field.name) and field.name not in value_fields:
+                value_fields.append(field.name)
+
+    index_writer = IndexWriter(index_folder, value_fields)
+    output_crs = arcpy.SpatialReference("NAD_1983_California_Teale_Albers")
+
+    for county_fc in county_fcs:
+        print("Reading " + county_fc + "...")
+        county_fc_path = os.path.join(output_gdb, county_fc)
+        county_fields = [field.name for field in arcpy.ListFields(county_fc_path)]
+
+        oids, county_geometries = Array_IO.read_projected_geometries(county_fc_path, output_crs)
+        columns_by_oid = {}
+        for batch in Array_IO.iter_columns(county_fc_path, ["OID@", county_name_field, parcel_id_field, fips_apn_field]):
+            columns_by_oid.update(zip(batch["OID@"].tolist(), zip(batch[county_name_field].tolist(), batch[parcel_id_field].tolist(), batch[fips_apn_field].tolist())))
+
+        fields_in_county = [field for field in value_fields if field in county_fields]
+        value_oids, value_columns = Array_IO.read_columns(county_fc_path, fields_in_county)
+        value_position = dict(zip(value_oids.tolist(), range(len(value_oids))))
+        positions = np.array([value_position[oid] for oid in oids.tolist()], dtype=np.int64)
+
+        county_values = np.full((len(oids), len(value_fields)), null_value, dtype=np.int8)
+        for field in fields_in_county:
+            county_values[:, value_fields.index(field)] = value_columns[field][positions]
+
+        county_name = columns_by_oid[oids[0]][0] if len(oids) else county_fc.replace(output_fc_suffix, "")
+        index_writer.add_county(county_name, [columns_by_oid[oid][1] for oid in oids.tolist()], [columns_by_oid[oid][2] for oid in oids.tolist()],
+                                county_geometries, county_values)
+
+    print("Writing index...")
+    index_writer.finish()
+
+
+class ParcelIndex(object):
+    """ Memory-mapped parcel index (see IndexWriter). Safe to share between threads (read only). """
+
+    def __init__(self, index_folder):
+        with open(os.path.join(index_folder, "index.json"), "r") as f:
+            metadata = json.load(f)
+
+        self.county_names = metadata["county_names"]
+        self.value_fields = metadata["value_fields"]
+        self.grid_cell_size = metadata["grid_cell_size"]
+
+        for name in ["county_index", "parcel_ids", "fips_apns", "parcel_id_table", "parcel_id_starts", "parcel_id_rows", "fips_apn_table",
+                     "fips_apn_starts", "fips_apn_rows", "geometries", "geometry_offsets", "bounds", "grid_keys", "grid_starts", "grid_rows", "values"]:
+            setattr(self, name, np.load(os.path.join(index_folder, name + ".npy"), mmap_mode="r"))
+
+        # Keys of each hash index ("parcel_id" or "fips_apn").
+        self.keys = {"parcel_id": self.parcel_ids, "fips_apn": self.fips_apns}
+
+    def __len__(self):
+        return len(self.parcel_ids)
+
+    def record(self, row):
+        """ Returns a parcel's county, ids, and requirement & exemption values (None = <null>) as a dictionary. """
+
+        parcel = {
+            county_name_field: self.county_names[self.county_index[row]],
+            parcel_id_field: self.parcel_ids[row].decode("utf-8"),
+            fips_apn_field: self.fips_apns[row].decode("utf-8"),
+        }
+        for field, value in zip(self.value_fields, self.values[row].tolist()):
+            parcel[field] = value if value != null_value else None
+
+        return parcel
+
+    def geometry(self, row):
+        return shapely.from_wkb(self.geometries[self.geometry_offsets[row]:self.geometry_offsets[row + 1]].tobytes())
+
+    def rows_for_key(self, key_name, key):
+        """ Returns the rows with a key in a hash index ("parcel_id" or "fips_apn"). """
+
+        if not key:
+            return []
+
+        table = getattr(self, key_name + "_table")
+        starts = getattr(self, key_name + "_starts")
+        rows = getattr(self, key_name + "_rows")
+        keys = self.keys[key_name]
+
+        key_bytes = key.encode("utf-8")
+        mask = len(table) - 1
+        slot = int(key_hashes([key])[0]) & mask
+        while table[slot] != -1:
+            key_number = int(table[slot])
+            key_rows = rows[starts[key_number]:starts[key_number + 1]]
+            if keys[key_rows[0]] == key_bytes:
+                return key_rows.tolist()
+            slot = (slot + 1) & mask
+
+        return []
+
+    def rows_at_point(self, x, y):
+        """ Returns the rows of the parcels that contain (or touch) a point in Teale Albers. """
+
+        key = cell_key(int(np.floor(x / self.grid_cell_size)), int(np.floor(y / self.grid_cell_size)))
+        i = int(np.searchsorted(self.grid_keys, key))
+        if i == len(self.grid_keys) or self.grid_keys[i] != key:
+            return []
+
+        candidates = np.asarray(self.grid_rows[self.grid_starts[i]:self.grid_starts[i + 1]])
+        bounds = self.bounds[candidates]
+        candidates = candidates[(bounds[:, 0] <= x) & (bounds[:, 2] >= x) & (bounds[:, 1] <= y) & (bounds[:, 3] >= y)]
+
+        return [int(row) for row in candidates if shapely.intersects_xy(self.geometry(row), x, y)]
+
+    def lookup_point(self, lon, lat, datum="NAD83"):
+        """ Returns the parcels at a longitude and latitude (decimal degrees, NAD83 or WGS84). """
+
+        if datum.upper() == "WGS84":
+            lon, lat = Reprojection.wgs84_to_nad83(np.array([lon]), np.array([lat]))
+        x, y = Reprojection.geographic_to_teale_albers(lon, lat)
+
+        return [self.record(row) for row in self.rows_at_point(float(np.ravel(x)[0]), float(np.ravel(y)[0]))]
+
+    def lookup_apn(self, fips_apn):
+        """ Returns the parcels with a fips_apn (there can be more than one parcel per APN). """
+
+        return [self.record(row) for row in self.rows_for_key("fips_apn", fips_apn)]
+
+    def lookup_parcel_id(self, parcel_id):
+        """ Returns the parcel with a cbi_parcel_id_fips_apn_oid (a list, empty if it isn't found). """
+
+        return [self.record(row) for row in self.rows_for_key("parcel_id", parcel_id)]
+
+
+def make_request_handler(parcel_index):
+    """ Returns an HTTP request handler class that answers lookups from the index. """
+
+    class RequestHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            start = time.perf_counter()
+            url = urlparse(self.path)
+            query = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+
+            try:
+                if url.path == "/point":
+                    parcels = parcel_index.lookup_point(float(query["lon"]), float(query["lat"]), query.get("datum", "NAD83"))
+                elif url.path == "/apn":
+                    parcels = parcel_index.lookup_apn(query["fips_apn"])
+                elif url.path == "/parcel":
+                    parcels = parcel_index.lookup_parcel_id(query["id"])
+                else:
+                    self.send_json(404, {"error": "Unknown path: " + url.path})
+                    return
+            except (KeyError, ValueError) as e:
+                self.send_json(400, {"error": "Invalid query: " + str(e)})
+                return
+
+            self.send_json(200, {"parcels": parcels, "milliseconds": round((time.perf_counter() - start) * 1000, 3)})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            query = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+            if url.path != "/batch":
+                self.send_json(404, {"error": "Unknown path: " + url.path})
+                return
+
+            lines = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8-sig").splitlines()
+            try:
+                Batch_Evaluation.input_columns(next(csv.reader(lines[:1]), []))
+            except ValueError as e:
+                self.send_json(400, {"error": str(e)})
+                return
+
+            # No Content-Length: the result is streamed and the connection is closed when it's complete.
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv")
+            self.end_headers()
+            output = io.TextIOWrapper(self.wfile, encoding="utf-8", newline="", write_through=True)
+            Batch_Evaluation.evaluate(parcel_index, lines, output, query.get("datum", "NAD83"))
+            output.detach()
+
+        def send_json(self, status, body):
+            content = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            # Don't print a line for every request.
+            pass
+
+    return RequestHandler
+
+
+def serve(index_folder, port=default_port):
+    """ Serves lookups from the index over HTTP until interrupted. """
+
+    parcel_index = ParcelIndex(index_folder)
+    server = ThreadingHTTPServer(("", port), make_request_handler(parcel_index))
+    print("Serving " + str(len(parcel_index)) + " parcels on port " + str(port) + "...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+def percentile_ms(seconds, percentile):
+    return np.percentile(np.array(seconds) * 1000, percentile)
+
+
+def benchmark(index_folder, number_of_queries=10000, seed=2026):
+    """ Times point and APN lookups for random parcels (points at the center of a parcel) and prints the p50 and p99
+        latency. Returns a dictionary of query type: [p50 ms, p99 ms].
+    """
+
+    open_start = time.perf_counter()
+    parcel_index = ParcelIndex(index_folder)
+    print("Index opened in " + "{:.1f}".format((time.perf_counter() - open_start) * 1000) + " ms (" + str(len(parcel_index)) + " parcels)")
+
+    random = np.random.default_rng(seed)
+    rows = random.integers(0, len(parcel_index), number_of_queries)
+    points = shapely.get_coordinates(shapely.point_on_surface(shapely.from_wkb([parcel_index.geometries[parcel_index.geometry_offsets[row]:parcel_index.geometry_offsets[row + 1]].tobytes() for row in rows])))
+    lons, lats = Reprojection.teale_albers_to_geographic(points[:, 0], points[:, 1])
+
+    timings = {"point": [], "apn": [], "parcel": []}
+    for i, row in enumerate(rows.tolist()):
+        start = time.perf_counter()
+        parcel_index.lookup_point(lons[i], lats[i])
+        timings["point"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        parcel_index.lookup_apn(parcel_index.fips_apns[row].decode("utf-8"))
+        timings["apn"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        parcel_index.lookup_parcel_id(parcel_index.parcel_ids[row].decode("utf-8"))
+        timings["parcel"].append(time.perf_counter() - start)
+
+    results = {}
+    print("\n{:<10} {:>10} {:>10} {:>10}".format("Query", "Queries", "p50 (ms)", "p99 (ms)"))
+    for query_type, seconds in timings.items():
+        results[query_type] = [percentile_ms(seconds, 50), percentile_ms(seconds, 99)]
+        print("{:<10} {:>10} {:>10.3f} {:>10.3f}".format(query_type, len(seconds), results[query_type][0], results[query_type][1]))
+
+    return results
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ("build", "serve", "benchmark"):
+        print("Usage: python Parcel_Lookup_Service.py build|serve|benchmark <index folder> [output geodatabase|port|number of queries]")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    index_folder_arg = sys.argv[2]
+
+    if command == "build":
+        build_index(index_folder_arg, sys.argv[3] if len(sys.argv) > 3 else output_gdb_data_basin)
+    elif command == "serve":
+        serve(index_folder_arg, int(sys.argv[3]) if len(sys.argv) > 3 else default_port)
+    else:
+        benchmark(index_folder_arg, int(sys.argv[3]) if len(sys.argv) > 3 else 10000)
@@ -0,0 +1,78 @@
+########################################################################################################################
+# File name: Parquet_Export.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x (ArcGIS Pro)
+# Description:
+# Writes the requirements and exemptions for the dev team as Parquet files (one file per county) instead of file
+# geodatabase tables. Columns are written straight from the NumPy arrays read from the output parcels:
+# requirement & exemption values (1/0/<null>) are stored as nullable int8 columns, county_name is dictionary encoded,
+# and rows are sorted by parcel id (within a county) and written in row groups of row_group_size rows.
+# Requirements that were short circuited keep their not evaluated value (-2) so they can be told apart from <null>.
+# The county files in a folder can be read together as one statewide dataset (e.g., pyarrow.dataset.dataset(folder)).
+# Requires pyarrow in the ArcGIS Pro python environment (it's included in the default environment).
+########################################################################################################################
+
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Value used in place of <null> in requirement and exemption arrays. Must match Array_IO.null_value.
+null_value = -1
+
+row_group_size = 250000
+
+
+def tri_state_array(values):
+    """ Returns a nullable int8 Arrow array from an array of 1/0/null_value. """
+
+    values = np.asarray(values)
+
+    return pa.array(values.astype(np.int8), type=pa.int8(), mask=(values == null_value))
+
+
+def county_name_array(county_name, length):
+    """ Returns a dictionary encoded Arrow array with the county name repeated length times. """
+
+    return pa.DictionaryArray.from_arrays(pa.array(np.zeros(length, dtype=np.int8)), pa.array([county_name], type=pa.string()))
+
+
+def county_table(county_name, parcel_ids, columns, tri_state_fields, parcel_id_field="cbi_parcel_id_fips_apn_oid", county_name_field="county_name"):
+    """ Returns an Arrow table for a county sorted by parcel id.
+        columns: dictionary of field name: NumPy array in the same order as parcel_ids.
+        Fields in tri_state_fields are written as nullable int8 columns. Other numeric fields keep their type.
+    """
+
+    parcel_ids = np.asarray(parcel_ids)
+    order = np.argsort(parcel_ids, kind="stable")
+
+    arrays = [county_name_array(county_name, len(parcel_ids)), pa.array(parcel_ids[order].astype(str), type=pa.string())]
+    names = [county_name_field, parcel_id_field]
+
+    for field, values in columns.items():
+        values = np.asarray(values)[order]
+        if field in tri_state_fields:
+            arrays.append(tri_state_array(values))
+        else:
+            arrays.append(pa.array(values))
+        names.append(field)
+
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def write_county_table(output_file, table):
+    """ Writes a county table to a Parquet file in row groups. The file is written to a temporary file first and then
+        moved into place, so readers never see a partially written county.
+    """
+
+    output_folder = os.path.dirname(output_file)
+    if output_folder and not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    tmp_file = output_file + ".tmp"
+    with pq.ParquetWriter(tmp_file, table.schema, compression="zstd") as writer:
+        for batch in table.to_batches(max_chunksize=row_group_size):
+            writer.write_table(pa.Table.from_batches([batch], schema=table.schema))
+
+    os.replace(tmp_file, output_file)
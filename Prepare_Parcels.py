@@ -22,6 +22,17 @@ import os
 import datetime
 import json
 import csv
+import functools
+import multiprocessing
+from queue import Full
+import numpy as np
+import shapely
+import Array_IO
+import Geometry_Hash
+import Profiling
+import Reprojection
+import Spatial_Engines
+import Zoning_Overlay
 
 arcpy.env.overwriteOutput = True
 
@@ -68,15 +79,83 @@ statewide_parcels_input_fc_with_zip_mpo = r"P:\Projects3\CEQA_Site_Check_Version
 statewide_parcels_input_fc_with_zip_mpo_sp = r"P:\Projects3\CEQA_Site_Check_Version_2_0_2023_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Inputs\Parcels\Parcels_Projected_Delete_Identical.gdb\Statewide_Parcels_With_Zip_MPO_SP"
 #statewide_parcels_input_fc_with_zip_mpo_sp_zoning = r"P:\Projects3\CEQA_Site_Check_Version_2_0_2023_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Inputs\Parcels\Parcels_Projected_Delete_Identical.gdb\Statewide_Parcels_With_Zip_MPO_SP_Zoning"
 statewide_parcels_input_fc_with_zip_mpo_sp_zoning_block = r"P:\Projects3\CEQA_Site_Check_Version_2_0_2023_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Inputs\Parcels\Parcels_Projected_Delete_Identical.gdb\Statewide_Parcels_With_Zip_MPO_SP_Zoning_Block"
+# Output of join_centroid_attributes (zip code, MPO, specific plan, and CENSUS block in one copy):
+statewide_parcels_input_fc_with_zip_mpo_sp_block = r"P:\Projects3\CEQA_Site_Check_Version_2_0_2023_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Inputs\Parcels\Parcels_Projected_Delete_Identical.gdb\Statewide_Parcels_With_Zip_MPO_SP_Block"
 
 # Custom, out of order, runs:
 statewide_parcels_input_fc_with_zip_mpo_sp_zoning_block_update_sp = r"P:\Projects3\CEQA_Site_Check_Version_2_0_2023_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Inputs\Parcels\Parcels_Projected_Delete_Identical.gdb\Statewide_Parcels_With_Zip_MPO_SP_Zoning_Block_Update_SP"
 
 output_crs = arcpy.SpatialReference("NAD_1983_California_Teale_Albers")
 
-print("Add code to remove newline characters in the apn field. See email from Brianna.")
-exit()
-
+# Layers joined by join_centroid_attributes (the layer that each parcel's centroid falls within):
+# join layer: {join field: [output field, type, length, alias]}
+centroid_join_layers = {
+    zip_codes_source_fc: {"ZIP_CODE": ["zip_code", "TEXT", 10, "Zip Code"]},
+    mpo_source_fc: {"MPO": ["mpo", "TEXT", 55, "MPO"], "Label_MPO": ["label_mpo", "TEXT", 10, "Label_MPO"]},
+    specific_plan_source_fc: {specific_plan_field: ["Specific_Plan", "TEXT", 255, "Specific Plan Name"]},
+    census_block_source_fc: {"NAME20": ["Census_Block", "TEXT", 10, "Census_Block"]},
+}
+
+# Streaming dedupe (project_explode_and_dedupe):
+# Parcels are read dedupe_batch_size at a time. Coordinates are rounded to dedupe_quantum (meters) before they are
+# hashed. dedupe_hash_set_capacity is the initial size of the hash set (it grows as needed).
+dedupe_batch_size = 200000
+dedupe_quantum = 0.001
+dedupe_hash_set_capacity = 32000000
+
+# Number of processes used to project the parcels in project_explode_and_dedupe (each batch is projected in chunks).
+reprojection_workers = 1
+
+# Number of parcels calculated at a time by add_and_calculate_fields (memory use is per batch).
+add_and_calculate_fields_batch_size = 1000000
+
+# Zoning overlay (join_zoning_designations):
+# Parcels are read zoning_overlay_batch_size at a time and split into square tiles zoning_overlay_tile_size meters wide.
+# The tiles are processed by zoning_overlay_workers processes (None = one per CPU).
+zoning_overlay_batch_size = 500000
+zoning_overlay_tile_size = 10000
+zoning_overlay_workers = None
+
+# County partitioning (separate_into_counties):
+# Rows are buffered and inserted into each county separate_into_counties_buffer_size at a time. If
+# separate_into_counties_workers is > 1, the counties are divided between that many writer processes. While a writer's
+# queue is full, the main process checks that the writer is still running every separate_into_counties_queue_timeout
+# seconds.
+separate_into_counties_buffer_size = 50000
+separate_into_counties_workers = 1
+separate_into_counties_queue_timeout = 10
+
+# Profiling:
+# If profile_stages is True, the wall time, CPU time, peak memory, and rows per second of each stage are recorded in the
+# profiling history database (see Profiling.py). To compare with previous runs: python Profiling.py report <profiling_db>
+profile_stages = True
+profiling_db = r"P:\Projects3\CEQA_Site_Check_Version_2_0_2023_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Outputs\profiling_history.sqlite"
+
+
+def profile_stage(function):
+    """ Decorator that records a stage in the profiling history. Rows processed is the number of parcels in the stage's
+        input_fc (or the statewide parcels if the stage doesn't take one).
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not profile_stages:
+            return function(*args, **kwargs)
+
+        input_fc = kwargs.get("input_fc", args[0] if args else statewide_parcels_input_fc)
+        rows = int(arcpy.GetCount_management(input_fc)[0]) if arcpy.Exists(input_fc) else None
+
+        profiler = Profiling.Profiler(profiling_db, str(start_script), "Prepare_Parcels")
+        with profiler.step("statewide", function.__name__, rows):
+            result = function(*args, **kwargs)
+        profiler.close()
+
+        return result
+
+    return wrapper
+
+
+@profile_stage
 def project_and_delete_dups():
     """ Function to project the state-wide parcels dataset provided by OPR and delete parcels with duplicate
     geometry. ~1hr"""
@@ -89,11 +168,7 @@ def project_and_delete_dups():
     print("\nProjecting...")
 
     input_crs = arcpy.Describe(statewide_parcels_source_fc).SpatialReference
-    datum = input_crs.gcs.name
-    if datum == "GCS_North_American_1983":
-        datum_transformation = "WGS_1984_(ITRF00)_To_NAD_1983"
-    else:
-        datum_transformation = ""
+    datum_transformation = Reprojection.datum_transformation(input_crs)
 
     arcpy.Project_management(
         in_dataset=statewide_parcels_source_fc,
@@ -121,6 +196,7 @@ def project_and_delete_dups():
     print("Duration: " + str(duration))
 
 
+@profile_stage
 def explode():
     """ Function to explode multi-part features in the parcels dataset into single part features. """
 
@@ -129,8 +205,105 @@ def explode():
     arcpy.MultipartToSinglepart_management(statewide_parcels_input_fc_multipart, statewide_parcels_input_fc)
 
 
+@profile_stage
+def project_explode_and_dedupe():
+    """ Function to project, explode, and delete parcels with duplicate geometry in a single streaming pass over the
+    state-wide parcels dataset provided by OPR (see Geometry_Hash.py). The parcels are projected as they are read, a
+    parcel is dropped if a parcel with the same canonical geometry hash (of the whole, multi-part geometry) has been read
+    before, and the parcels that are kept are split into single parts. Parts are not compared to each other, so a part
+    that is the same as a part of a different parcel is kept. Memory is bounded by the batch size and the hash set.
+    Replaces project_and_delete_dups and explode (which ran DeleteIdentical on the exploded parts)."""
+
+    print("\nProjecting, Exploding, and Deleting Duplicate Parcels...\n")
+
+    start = datetime.datetime.now()
+    print("Start: " + str(start))
+
+    # The parcels are projected as they're read (see Reprojection.py).
+    read_spatial_reference, source_crs, read_transformation = Array_IO.projection_for_reading(statewide_parcels_source_fc, output_crs)
+    pool = multiprocessing.Pool(reprojection_workers) if source_crs and reprojection_workers > 1 else None
+
+    fields = [field.name for field in arcpy.ListFields(statewide_parcels_source_fc) if field.editable and field.type not in ("OID", "Geometry")]
+    county_name_index = [field.lower() for field in fields].index("county_name")
+
+    arcpy.CreateFeatureclass_management(os.path.dirname(statewide_parcels_input_fc), os.path.basename(statewide_parcels_input_fc), "POLYGON", statewide_parcels_source_fc, spatial_reference=output_crs)
+
+    unique_parcels = Geometry_Hash.HashSet(dedupe_hash_set_capacity)
+    duplicates_by_county = {}
+    parcels_read = 0
+    parts_written = 0
+
+    def write_batch(rows, wkbs):
+        """ Dedupes, explodes, and writes a batch of parcels. Returns the number of parts written. """
+
+        geometries = shapely.from_wkb(np.array(wkbs, dtype=object))
+        if source_crs:
+            geometries = Reprojection.project_geometries(geometries, source_crs, pool=pool)
+
+        # Parcels without a geometry are kept (as they were by DeleteIdentical).
+        has_geometry = ~shapely.is_missing(geometries) & ~shapely.is_empty(geometries)
+        is_new = np.ones(len(geometries), dtype=bool)
+        is_new[has_geometry] = unique_parcels.add(Geometry_Hash.canonical_hashes(geometries[has_geometry], dedupe_quantum))
+
+        for i in np.nonzero(~is_new)[0].tolist():
+            county_name = rows[i][county_name_index]
+            duplicates_by_county[county_name] = duplicates_by_county.get(county_name, 0) + 1
+
+        kept = np.nonzero(is_new & has_geometry)[0]
+        parts, part_index = shapely.get_parts(geometries[kept], return_index=True)
+        no_geometry = np.nonzero(~has_geometry)[0].tolist()
+
+        with arcpy.da.InsertCursor(statewide_parcels_input_fc, fields + ["SHAPE@WKB"]) as ic:
+            for i, part in zip(kept[part_index].tolist(), shapely.to_wkb(parts).tolist()):
+                ic.insertRow(rows[i] + (part,))
+            for i in no_geometry:
+                ic.insertRow(rows[i] + (None,))
+
+        return len(parts) + len(no_geometry)
+
+    rows = []
+    wkbs = []
+    try:
+        with Array_IO.search_cursor(statewide_parcels_source_fc, fields + ["SHAPE@WKB"], spatial_reference=read_spatial_reference, transformation=read_transformation) as sc:
+            for row in sc:
+                rows.append(tuple(row[:-1]))
+                wkbs.append(bytes(row[-1]) if row[-1] else None)
+                if len(rows) == dedupe_batch_size:
+                    parts_written += write_batch(rows, wkbs)
+                    parcels_read += len(rows)
+                    print(str(parcels_read) + " parcels read, " + str(parts_written) + " parts written")
+                    rows = []
+                    wkbs = []
+
+        if rows:
+            parts_written += write_batch(rows, wkbs)
+            parcels_read += len(rows)
+
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    print("\n" + str(parcels_read) + " parcels read, " + str(parts_written) + " parts written")
+    print("\nDuplicate parcels deleted by county:")
+    for county_name, duplicates in sorted(duplicates_by_county.items(), key=lambda item: str(item[0])):
+        print(str(county_name) + ": " + str(duplicates))
+    print("Total: " + str(sum(duplicates_by_county.values())))
+
+    end = datetime.datetime.now()
+    print("\nEnd: " + str(end))
+    duration = end - start
+    print("Duration: " + str(duration))
+
+
+@profile_stage
 def add_and_calculate_fields():
-    """ Function to add and calculate fields to the prepared state-wide parcels dataset. ~8hrs"""
+    """ Function to add and calculate fields to the prepared state-wide parcels dataset.
+    The parcels are read add_and_calculate_fields_batch_size at a time. The four fields are calculated for the whole
+    batch with NumPy (see Reprojection.py for the latitude and longitude) and written by an update cursor over the
+    batch's OBJECTID range, so memory use is per batch.
+    Previously ~8hrs (an update cursor for the id, CalculateField for the state, and CalculateGeometryAttributes for each
+    of latitude and longitude)."""
 
     print("\nAdding and calculating fields...\n")
 
@@ -139,40 +312,48 @@ def add_and_calculate_fields():
 
     fields = [field.name.lower() for field in arcpy.ListFields(statewide_parcels_input_fc)]
 
-    print("\nID Field...")  # Note: the values in fips_apn are not unique even with duplicates removed.
+    cbi_state_field = "state_name"
+    cbi_lat_field = "latitude"
+    cbi_lon_field = "longitude"
 
     if cbi_parcel_id_field not in fields:
         arcpy.AddField_management(statewide_parcels_input_fc, cbi_parcel_id_field, "TEXT")
-
-    with arcpy.da.UpdateCursor(statewide_parcels_input_fc, ["fips_apn", "OBJECTID", cbi_parcel_id_field]) as uc:
-        for row in uc:
-            if row[0]:
-                unique_id = "_".join([row[0], str(row[1])])
-            else:
-                unique_id = "_".join(["no_fips_apn_", str(row[1])])
-            row[2] = unique_id
-            uc.updateRow(row)
-
-    print("\nState Field...")
-
-    cbi_state_field = "state_name"
     if cbi_state_field not in fields:
         arcpy.AddField_management(statewide_parcels_input_fc, cbi_state_field, "TEXT")
-    arcpy.CalculateField_management(statewide_parcels_input_fc, cbi_state_field, "\"California\"")
-
-    print("\nLatitude Field...")
-
-    cbi_lat_field = "latitude"
     if cbi_lat_field not in fields:
         arcpy.AddField_management(statewide_parcels_input_fc, cbi_lat_field, "DOUBLE")
-    arcpy.CalculateGeometryAttributes_management(statewide_parcels_input_fc, [[cbi_lat_field, "CENTROID_Y"]], "", "", "", "DD")
-
-    print("\nLongitude Field...")
-
-    cbi_lon_field = "longitude"
     if cbi_lon_field not in fields:
         arcpy.AddField_management(statewide_parcels_input_fc, cbi_lon_field, "DOUBLE")
-    arcpy.CalculateGeometryAttributes_management(statewide_parcels_input_fc, [[cbi_lon_field, "CENTROID_X"]], "", "", "", "DD")
+
+    print("\nCalculating the ID, State, Latitude, and Longitude fields...")
+
+    oid_field = arcpy.Describe(statewide_parcels_input_fc).OIDFieldName
+    count = 0
+    for batch in Array_IO.iter_columns(statewide_parcels_input_fc, ["OID@", "fips_apn", "SHAPE@XY"], add_and_calculate_fields_batch_size):
+        oids = batch["OID@"]
+        oid_strings = oids.astype(str)
+
+        # Note: the values in fips_apn are not unique even with duplicates removed.
+        fips_apn = batch["fips_apn"].astype(object)
+        has_fips_apn = (fips_apn != None) & (fips_apn != "")
+        fips_apn_strings = np.where(has_fips_apn, fips_apn, "").astype(str)
+        parcel_ids = np.where(has_fips_apn, np.char.add(np.char.add(fips_apn_strings, "_"), oid_strings), np.char.add("no_fips_apn__", oid_strings))
+
+        # The centroids are in Teale Albers. Latitude and longitude are in decimal degrees (NAD83). Parcels without a
+        # geometry have no centroid (NaN), and are written as <null>.
+        longitudes, latitudes = Reprojection.teale_albers_to_geographic(batch["SHAPE@XY"][:, 0], batch["SHAPE@XY"][:, 1])
+
+        columns = {
+            cbi_parcel_id_field: parcel_ids,
+            cbi_state_field: np.full(len(oids), "California", dtype=object),
+            cbi_lat_field: latitudes,
+            cbi_lon_field: longitudes,
+        }
+        where_clause = oid_field + " >= " + str(oids.min()) + " AND " + oid_field + " <= " + str(oids.max())
+        Array_IO.write_columns(statewide_parcels_input_fc, oids, columns, where_clause)
+
+        count += len(oids)
+        print(str(count) + " parcels calculated")
 
     end = datetime.datetime.now()
     print("\nEnd: " + str(end))
@@ -180,6 +361,7 @@ def add_and_calculate_fields():
     print("Duration: " + str(duration))
 
 
+@profile_stage
 def calc_zip_codes():
     """ Function to join the zip codes to the prepared state-wide parcels dataset (spatial join that takes the zip
     code coinciding with the centroid of the parcel). Duration: ~1 hour """
@@ -195,7 +377,7 @@ def calc_zip_codes():
         in_dataset=zip_codes_source_fc,
         out_dataset=zip_codes_input_fc,
         out_coor_system="PROJCS['NAD_1983_California_Teale_Albers',GEOGCS['GCS_North_American_1983',DATUM['D_North_American_1983',SPHEROID['GRS_1980',6378137.0,298.257222101]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Albers'],PARAMETER['False_Easting',0.0],PARAMETER['False_Northing',-4000000.0],PARAMETER['Central_Meridian',-120.0],PARAMETER['Standard_Parallel_1',34.0],PARAMETER['Standard_Parallel_2',40.5],PARAMETER['Latitude_Of_Origin',0.0],UNIT['Meter',1.0]]",
-        transform_method="WGS_1984_(ITRF00)_To_NAD_1983",
+        transform_method=Reprojection.wgs84_to_nad83_transformation,
         in_coor_system="PROJCS['WGS_1984_California_Teale_Albers_FtUS',GEOGCS['GCS_WGS_1984',DATUM['D_WGS_1984',SPHEROID['WGS_1984',6378137.0,298.257223563]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Albers'],PARAMETER['False_Easting',0.0],PARAMETER['False_Northing',-4000000.0],PARAMETER['Central_Meridian',-120.0],PARAMETER['Standard_Parallel_1',34.0],PARAMETER['Standard_Parallel_2',40.5],PARAMETER['Latitude_Of_Origin',0.0],UNIT['Foot_US',0.3048006096012192]]",
         preserve_shape="NO_PRESERVE_SHAPE", max_deviation="", vertical="NO_VERTICAL")
 
@@ -214,6 +396,7 @@ def calc_zip_codes():
     print("Duration: " + str(duration))
 
 
+@profile_stage
 def join_mpo_name(input_fc):
     """ Joins the MPO Name from the MPO boundary that a parcel falls within. """
 
@@ -241,6 +424,7 @@ def join_mpo_name(input_fc):
     print("Duration: " + str(duration))
 
 
+@profile_stage
 def join_specific_plan_name(input_fc, output_fc=statewide_parcels_input_fc_with_zip_mpo_sp):
     """ Joins the Specific Plan Name from the specific plan boundary that a parcel falls within. """
 
@@ -283,8 +467,73 @@ def join_specific_plan_name(input_fc, output_fc=statewide_parcels_input_fc_with_
     print("Duration: " + str(duration))
 
 
+def read_join_layer(join_fc, join_fields):
+    """ Returns the polygons (in the output CRS) and a dictionary of field name: array of values for a join layer. """
+
+    oids, polygons = Array_IO.read_projected_geometries(join_fc, output_crs)
+
+    values_by_oid = {}
+    for batch in Array_IO.iter_columns(join_fc, ["OID@"] + join_fields):
+        values_by_oid.update(zip(batch["OID@"].tolist(), zip(*[batch[field].tolist() for field in join_fields])))
+
+    values = [values_by_oid[oid] for oid in oids.tolist()]
+    columns = dict((field, np.array([row[i] for row in values], dtype=object)) for i, field in enumerate(join_fields))
+
+    return polygons, columns
+
+
+@profile_stage
+def join_centroid_attributes(input_fc, output_fc=statewide_parcels_input_fc_with_zip_mpo_sp_block):
+    """ Joins the zip code, MPO name, specific plan name, and CENSUS block name from the polygons that each parcel's
+    centroid falls within (the equivalent of SpatialJoin "HAVE_THEIR_CENTER_IN"). The centroids are read once and
+    looked up in each layer through a spatial index (see Spatial_Engines.points_in_polygons), and all of the join
+    fields are written in one update cursor pass on a single copy of the parcels. The join layers are projected as
+    they're read (see Reprojection.py). Replaces calc_zip_codes,
+    join_mpo_name, join_specific_plan_name, and join_census_block (~4 statewide spatial joins and copies)."""
+
+    print("\nJoining zip code, MPO, specific plan, and CENSUS block names to parcels...\n")
+
+    start = datetime.datetime.now()
+    print("Start: " + str(start))
+
+    print("\nCopying parcels...")
+    arcpy.CopyFeatures_management(input_fc, output_fc)
+
+    print("\nReading parcel centroids...")
+    oids, xy = Array_IO.read_centroids(output_fc, spatial_reference=output_crs)
+
+    columns = {}
+    for join_fc, join_fields in centroid_join_layers.items():
+        print("Joining " + join_fc + "...")
+        polygons, join_columns = read_join_layer(join_fc, list(join_fields.keys()))
+        matches = Spatial_Engines.points_in_polygons(xy, polygons)
+        for join_field, [output_field, field_type, field_length, field_alias] in join_fields.items():
+            values = np.full(len(oids), None, dtype=object)
+            values[matches >= 0] = join_columns[join_field][matches[matches >= 0]]
+            columns[output_field] = values
+
+    print("\nAdding join fields...")
+    fields = [field.name.lower() for field in arcpy.ListFields(output_fc)]
+    for join_fields in centroid_join_layers.values():
+        for output_field, field_type, field_length, field_alias in join_fields.values():
+            if output_field.lower() in fields:
+                arcpy.DeleteField_management(output_fc, output_field)
+            arcpy.AddField_management(output_fc, output_field, field_type, field_length=field_length, field_alias=field_alias)
+
+    print("\nWriting join fields...")
+    Array_IO.write_columns(output_fc, oids, columns)
+
+    end = datetime.datetime.now()
+    print("\nEnd: " + str(end))
+    duration = end - start
+    print("Duration: " + str(duration))
+
+
+@profile_stage
 def join_zoning_designations(input_fc, threshold):
-    """ Joins the Zoning Designation to each parcel based on the % coverage threshold. ~6 days 14 hours"""
+    """ Joins the Zoning Designation to each parcel based on the % coverage threshold. The % of each parcel covered by
+    each zoning designation is calculated in tiles across a process pool (see Zoning_Overlay.py). Previously ~6 days 14
+    hours (TabulateIntersection)."""
 
     print("Performing Zoning Data Calculations...")
     fields = [field.name for field in arcpy.ListFields(input_fc)]
@@ -298,34 +547,22 @@ def join_zoning_designations(input_fc, threshold):
     # Repairing geometry on the parcels data did not eliminate the topology error (ERROR 160196: Invalid Topology).
     # The problem may be with the zoning data though. Repair geometry was performed on the zoning data
     # in the Prepare_Zoning.py script on 08/18/2023 @ 7:20am
-    #arcpy.RepairGeometry_management(input_fc)
-
-    tabulate_intersection_table_name = "Tabulate_Zoning_Intersection"
-    tabulate_intersection_table = tmp_gdb + os.sep + tabulate_intersection_table_name
-
-    print("Tabulating Intersection (% zoning designation within each parcel)...")
-    arcpy.TabulateIntersection_analysis(
-        in_zone_features=input_fc,
-        zone_fields=cbi_parcel_id_field,
-        in_class_features=zoning_input_fc,
-        out_table=tabulate_intersection_table,
-        class_fields=zoning_field, sum_fields="", xy_tolerance="")
-    # Note: Creating a query table of records > threshold and joining to input fc took took too long.
-    # ~2.5 hours for the remaining code.
-    print("Creating a dictionary of parcel_id: {zoning_designation='', percent_cover = ''} where percent_cover is >= " + str(threshold))
+    # Note: Zoning_Overlay repairs (make_valid) any pair of geometries that fails to intersect.
+
+    print("Reading zoning polygons...")
+    zoning_oids, zoning_polygons = Array_IO.read_geometries(zoning_input_fc, spatial_reference=output_crs)
+    zoning_codes_by_oid = {}
+    for batch in Array_IO.iter_columns(zoning_input_fc, ["OID@", zoning_field]):
+        zoning_codes_by_oid.update(zip(batch["OID@"].tolist(), batch[zoning_field].tolist()))
+    zoning_codes = np.array([zoning_codes_by_oid[oid] for oid in zoning_oids.tolist()], dtype=object)
+
+    print("Tabulating Intersection (% zoning designation within each parcel) in tiles...")
+    print("Creating a dictionary of parcel OBJECTID: {zoning_designation: percent_cover} where percent_cover is >= " + str(threshold))
     zoning_dict = {}
-    with arcpy.da.SearchCursor(tabulate_intersection_table, [cbi_parcel_id_field, zoning_field, "PERCENTAGE"]) as sc:
-        for row in sc:
-            parcel_id = row[0]
-            zoning_designation = row[1]
-            percent_cover = round(row[2], 1)
-            if percent_cover >= threshold:
-                if parcel_id not in zoning_dict:
-                    zoning_dict[parcel_id] = {}
-                    zoning_dict[parcel_id]["zoning_designations"] = {}
-                    zoning_dict[parcel_id]["count"] = 0
-                zoning_dict[parcel_id]["zoning_designations"][zoning_designation] = percent_cover
-                zoning_dict[parcel_id]["count"] += 1
+    parcel_batches = Array_IO.iter_geometries(input_fc, zoning_overlay_batch_size, spatial_reference=output_crs)
+    for parcel_oids, codes, percents in Zoning_Overlay.overlay(parcel_batches, zoning_polygons, zoning_codes, threshold, zoning_overlay_tile_size, zoning_overlay_workers):
+        for oid, zoning_designation, percent_cover in zip(parcel_oids.tolist(), codes.tolist(), percents.tolist()):
+            zoning_dict.setdefault(oid, {})[zoning_designation] = percent_cover
 
     # Delete and add fields each run in case zoning data changes (don't want residual values).
     print("Deleting and Adding Zoning Designation fields...")
@@ -339,44 +576,34 @@ def join_zoning_designations(input_fc, threshold):
     if "Zoning_Designation_Count" in fields:
         arcpy.DeleteField_management(input_fc, "Zoning_Designation_Count")
     arcpy.AddField_management(input_fc, "Zoning_Designation_Count", "SHORT")
-    arcpy.CalculateField_management(input_fc, "Zoning_Designation_Count", 0)
 
     print("Percent_Cover...")
-    arcpy.DeleteField_management(input_fc, "Zoning_Percent_Cover")
+    if "Zoning_Percent_Cover" in fields:
+        arcpy.DeleteField_management(input_fc, "Zoning_Percent_Cover")
     if separate_fields:
         arcpy.AddField_management(input_fc, "Zoning_Percent_Cover", "TEXT")
 
+    print("Writing zoning designations from dictionary to parcels data (" + str(len(zoning_dict)) + " parcels with zoning)...")
+    oids = np.array(list(zoning_dict.keys()), dtype=np.int64)
+    zoning_designations = [sorted(zoning_dict[oid].items()) for oid in oids.tolist()]
     if separate_fields:
-        fields_to_calc = [cbi_parcel_id_field, "Zoning_Designation", "Zoning_Percent_Cover"]
+        columns = {
+            "Zoning_Designation": np.array([",".join(str(k) for k, v in designations) for designations in zoning_designations], dtype=object),
+            "Zoning_Percent_Cover": np.array([",".join(str(v) for k, v in designations) for designations in zoning_designations], dtype=object),
+        }
     else:
-        fields_to_calc = [cbi_parcel_id_field, "Zoning_Designation", "Zoning_Designation_Count"]
-
-    count = 0
-    print("Running update cursor to add zoning designations from dictionary to to parcels data...")
-    with arcpy.da.UpdateCursor(input_fc, fields_to_calc) as uc:
-        for row in uc:
-            print(count)
-            row[2] = 0  # Initialize the zoning designation count to 0
-            parcel_id = row[0]
-            if parcel_id in zoning_dict:
-                #print(zoning_dict[parcel_id])
-                zoning_designations = []
-                percentages = []
-                if separate_fields:
-                    for k,v in zoning_dict[parcel_id].items():
-                        zoning_designations.append(k)
-                        percentages.append(str(v))
-                    # Set the Zoning Designations and Percent Cover
-                    print(zoning_designations)
-                    print(percentages)
-                    row[1] = ",".join(zoning_designations)
-                    row[2] = ",".join(percentages)
-                else:
-                    print(parcel_id + ": " + str(zoning_dict[parcel_id]))
-                    row[1] = json.dumps(zoning_dict[parcel_id]["zoning_designations"])
-                    row[2] = json.dumps(zoning_dict[parcel_id]["count"])
+        columns = {
+            "Zoning_Designation": np.array([json.dumps(dict(designations)) for designations in zoning_designations], dtype=object),
+            "Zoning_Designation_Count": np.array([len(designations) for designations in zoning_designations], dtype=np.int64),
+        }
+    Array_IO.write_columns(input_fc, oids, columns)
+
+    # Parcels without a zoning designation get a count of 0.
+    if not separate_fields:
+        with arcpy.da.UpdateCursor(input_fc, ["Zoning_Designation_Count"], "Zoning_Designation_Count IS NULL") as uc:
+            for row in uc:
+                row[0] = 0
                 uc.updateRow(row)
-            count += 1
 
     end = datetime.datetime.now()
     print("\nEnd: " + str(end))
@@ -384,6 +611,7 @@ def join_zoning_designations(input_fc, threshold):
     print("Duration: " + str(duration))
 
 
+@profile_stage
 def join_census_block(input_fc):
     """ Joins the CENSUS Block Name from the TIGER CENSUS Blocks that a parcel falls within. ~1 hour """
 
@@ -414,6 +642,7 @@ def join_census_block(input_fc):
     print("Duration: " + str(duration))
 
 
+@profile_stage
 def clean_up_fields(input_fc, fields_to_delete=None, fields_to_remove_alias=None):
     """ Function to delete extraneous fields and remove aliases from the state-wide dataset. ~8hrs """
 
@@ -441,31 +670,137 @@ def clean_up_fields(input_fc, fields_to_delete=None, fields_to_remove_alias=None
     print("Duration: " + str(duration))
 
 
+def county_parcels_fc(county_name):
+    """ Returns the path to the output parcels feature class for a county. """
+
+    output_county_name = county_name.replace(" County", "").replace(" ", "").upper() + "_Parcels"
+
+    return output_gdb + os.sep + output_county_name
+
+
+def create_county_parcels_fc(input_fc, county_name):
+    """ Creates a county's output parcels feature class, with the same schema as the input. """
+
+    print(county_name)
+    output_county_parcels_fc = county_parcels_fc(county_name)
+    arcpy.CreateFeatureclass_management(os.path.dirname(output_county_parcels_fc), os.path.basename(output_county_parcels_fc), "POLYGON", input_fc, spatial_reference=input_fc)
+
+
+def write_county_rows(county_name, fields, rows):
+    """ Inserts a buffer of rows into a county's output parcels feature class. """
+
+    with arcpy.da.InsertCursor(county_parcels_fc(county_name), fields) as ic:
+        for row in rows:
+            ic.insertRow(row)
+
+
+def county_writer(fields, queue):
+    """ Writer process for separate_into_counties. Writes (county name, rows) buffers from the queue until it receives
+    None. """
+
+    while True:
+        item = queue.get()
+        if item is None:
+            break
+        county_name, rows = item
+        write_county_rows(county_name, fields, rows)
+
+
+def put_to_writer(queue, writer, item):
+    """ Puts an item on a writer process's queue, waiting while the queue is full. Raises a RuntimeError if the writer
+    has stopped (instead of waiting forever for it to take the item). """
+
+    while True:
+        if not writer.is_alive():
+            # Items left in the queue are discarded, so the main process doesn't wait for them at exit.
+            queue.cancel_join_thread()
+            raise RuntimeError("The county writer process " + writer.name + " stopped (exit code " + str(writer.exitcode) + "). See the messages above.")
+        try:
+            queue.put(item, timeout=separate_into_counties_queue_timeout)
+            return
+        except Full:
+            pass
+
+
+@profile_stage
 def separate_into_counties(input_fc):
-    """ Function to separate state-wide parcels dataset into separate parcel datasets for each county. ~1.5hrs"""
+    """ Function to separate state-wide parcels dataset into separate parcel datasets for each county. The statewide
+    parcels are read once and the rows are written to each county in buffers of separate_into_counties_buffer_size rows
+    (by separate_into_counties_workers writer processes if > 1). Previously ~1.5hrs (a Select for each county)."""
 
     print("\nSeparating parcels by county...\n")
 
     start = datetime.datetime.now()
     print("Start: " + str(start))
 
-    print("\nGathering a list of county names...")
-
-    county_name_list = []
-    with arcpy.da.SearchCursor(input_fc, ["county_name"]) as sc:
-        for row in sc:
-            county_name = row[0]
-            if county_name not in county_name_list:
-                county_name_list.append(county_name)
-
-    print("\nCreating separate parcel datasets for each county...")
-
-    for county_name in county_name_list:
-        print(county_name)
-        output_county_name = county_name.replace(" County", "").replace(" ", "").upper() + "_Parcels"
-        output_county_parcels_fc = output_gdb + os.sep + output_county_name
-        expression = "county_name = '" + county_name + "'"
-        arcpy.Select_analysis(input_fc, output_county_parcels_fc, expression)
+    # Geometries are copied as WKB, so the rows can be sent to the writer processes.
+    fields = [field.name for field in arcpy.ListFields(input_fc) if field.editable and field.type not in ("OID", "Geometry")] + ["SHAPE@WKB"]
+    county_name_index = [field.lower() for field in fields].index("county_name")
+
+    queues = []
+    writers = []
+    if separate_into_counties_workers > 1:
+        for i in range(separate_into_counties_workers):
+            queue = multiprocessing.Queue(maxsize=4)
+            writer = multiprocessing.Process(target=county_writer, args=(fields, queue))
+            writer.start()
+            queues.append(queue)
+            writers.append(writer)
+
+    # Each county's feature class is created here (in the main process) the first time the county is read, before any of
+    # its rows are written, so the writer processes only insert rows. Counties are given to the writers in turn.
+    buffers = {}
+    writer_index = {}
+
+    def add_county(county_name):
+        create_county_parcels_fc(input_fc, county_name)
+        writer_index[county_name] = len(buffers) % max(len(queues), 1)
+        buffers[county_name] = []
+
+    def flush(county_name):
+        rows = [row[:-1] + (bytes(row[-1]) if row[-1] else None,) for row in buffers[county_name]]
+        if queues:
+            i = writer_index[county_name]
+            put_to_writer(queues[i], writers[i], (county_name, rows))
+        else:
+            write_county_rows(county_name, fields, rows)
+        buffers[county_name] = []
+
+    print("\nCreating separate parcel datasets for each county and writing the parcels...")
+
+    rows_without_county = 0
+    try:
+        with arcpy.da.SearchCursor(input_fc, fields) as sc:
+            for row in sc:
+                county_name = row[county_name_index]
+                if not county_name:
+                    rows_without_county += 1
+                    continue
+                if county_name not in buffers:
+                    add_county(county_name)
+                buffers[county_name].append(row)
+                if len(buffers[county_name]) == separate_into_counties_buffer_size:
+                    flush(county_name)
+
+        for county_name in buffers:
+            if buffers[county_name]:
+                flush(county_name)
+
+    finally:
+        # Writers that are still running finish the rows in their queue and stop. The ones that have stopped are skipped.
+        for queue, writer in zip(queues, writers):
+            try:
+                put_to_writer(queue, writer, None)
+            except RuntimeError:
+                pass
+        for writer in writers:
+            writer.join()
+
+    if any(writer.exitcode != 0 for writer in writers):
+        raise RuntimeError("A county writer process failed. See the messages above.")
+
+    if rows_without_county:
+        print("\nWarning: " + str(rows_without_county) + " parcels without a county name were not written to a county.")
 
     end = datetime.datetime.now()
     print("\nEnd: " + str(end))
@@ -473,6 +808,7 @@ def separate_into_counties(input_fc):
     print("Duration: " + str(duration))
 
 
+@profile_stage
 def add_zoning_description(input_fc):
 
     zoning_lookup_dict = {}
@@ -496,28 +832,39 @@ def add_zoning_description(input_fc):
             uc.updateRow(row)
 
 
-#project_and_delete_dups()
-#explode()
-#add_and_calculate_fields()
-#calc_zip_codes()
-#join_mpo_name(input_fc=statewide_parcels_input_fc_with_zip)
-#join_specific_plan_name(input_fc=statewide_parcels_input_fc_with_zip_mpo)
-#join_zoning_designations(input_fc=statewide_parcels_input_fc_with_zip_mpo_sp_zoning_block, threshold=20)
-#join_census_block(input_fc=statewide_parcels_input_fc_with_zip_mpo_sp)
+if __name__ == "__main__":
 
-# Not used...
-#add_zoning_description(input_fc=test_parcels_with_zoning)
+    print("Add code to remove newline characters in the apn field. See email from Brianna.")
+    exit()
 
-# Custom, out of order, runs:
-#join_specific_plan_name(input_fc=statewide_parcels_input_fc_with_zip_mpo_sp_zoning_block, output_fc=statewide_parcels_input_fc_with_zip_mpo_sp_zoning_block_update_sp)
-##
+    #project_explode_and_dedupe()
+    # Replaced by project_explode_and_dedupe:
+    #project_and_delete_dups()
+    #explode()
+    #add_and_calculate_fields()
+    #join_centroid_attributes(input_fc=statewide_parcels_input_fc)
+    #join_zoning_designations(input_fc=statewide_parcels_input_fc_with_zip_mpo_sp_block, threshold=20)
+
+    # Replaced by join_centroid_attributes:
+    #calc_zip_codes()
+    #join_mpo_name(input_fc=statewide_parcels_input_fc_with_zip)
+    #join_specific_plan_name(input_fc=statewide_parcels_input_fc_with_zip_mpo)
+    #join_zoning_designations(input_fc=statewide_parcels_input_fc_with_zip_mpo_sp_zoning_block, threshold=20)
+    #join_census_block(input_fc=statewide_parcels_input_fc_with_zip_mpo_sp)
+
+    # Not used...
+    #add_zoning_description(input_fc=test_parcels_with_zoning)
+
+    # Custom, out of order, runs:
+    #join_specific_plan_name(input_fc=statewide_parcels_input_fc_with_zip_mpo_sp_zoning_block, output_fc=statewide_parcels_input_fc_with_zip_mpo_sp_zoning_block_update_sp)
+    ##
 
-clean_up_fields(input_fc=statewide_parcels_input_fc_with_zip_mpo_sp_zoning_block_update_sp, fields_to_delete=["Shape_Length_1", "Shape_Area_1", "Join_Count", "TARGET_FID", "Join_Count_1", "Join_Count_12", "TARGET_FID_1", "TARGET_FID_12"])
+    clean_up_fields(input_fc=statewide_parcels_input_fc_with_zip_mpo_sp_zoning_block_update_sp, fields_to_delete=["Shape_Length_1", "Shape_Area_1", "Join_Count", "TARGET_FID", "Join_Count_1", "Join_Count_12", "TARGET_FID_1", "TARGET_FID_12"])
 
-separate_into_counties(input_fc=statewide_parcels_input_fc_with_zip_mpo_sp_zoning_block_update_sp)
+    separate_into_counties(input_fc=statewide_parcels_input_fc_with_zip_mpo_sp_zoning_block_update_sp)
 
-end_script = datetime.datetime.now()
-print("\nEnd Script: " + str(end_script))
+    end_script = datetime.datetime.now()
+    print("\nEnd Script: " + str(end_script))
 
-duration = end_script - start_script
-print("Total Duration: " + str(duration))
+    duration = end_script - start_script
+    print("Total Duration: " + str(duration))
@@ -8,14 +8,20 @@
 # Performs the following tasks:
 #
 # 1. Merge
-# 2. Project
-# 3. Repair Geometry
+# 2. Project (as the zoning is copied to the output. See Reprojection.py)
+# 3. Repair Geometry (in parallel, with a validity cache so only new or changed polygons are checked. See Geometry_Repair.py)
 # Total Runtime: ~20mins + x for repair geometry (1st run=days, second run=minutes).
 
 ########################################################################################################################
 import arcpy
 import datetime
+import multiprocessing
 import os
+import numpy as np
+import shapely
+import Array_IO
+import Geometry_Repair
+import Reprojection
 
 input_gdb = r"\\loxodonta\GIS\Source_Data\planningCadastre\state\CA\Zoning\From_Mark_Hedlund_OPR\20230809\Zoning2023_8_9\Official.gdb\zoning"
 tmp_gdb = r"P:\Projects3\CEQA_Site_Check_Version_2_0_2023_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Intermediate\Zoning\Scratch\Scratch.gdb"
@@ -25,51 +31,125 @@ output_fc = r"P:\Projects3\CEQA_Site_Check_Version_2_0_2023_mike_gough\Tasks\CEQ
 
 output_crs = arcpy.SpatialReference("NAD_1983_California_Teale_Albers")
 
-arcpy.env.workspace = input_gdb
+#merged_zoning_fc = os.path.join(tmp_gdb, "california_zoning_merge")
+merged_zoning_fc = r"\\loxodonta\gis\Source_Data\planningCadastre\state\CA\Zoning\From_Mark_Hedlund_OPR\20230921\Zoning2023_9_21\DistributionV1.gdb\CaliforniaZoning"
 
-input_fc_list = arcpy.ListFeatureClasses()
+# Repair Geometry:
+# The validity of each zoning polygon is cached by geometry hash, so the cache should be kept between zoning drops.
+# Polygons are read repair_batch_size at a time and checked in chunks of repair_chunk_size by repair_workers processes
+# (None = one per CPU).
+validity_cache_db = r"P:\Projects3\CEQA_Site_Check_Version_2_0_2023_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Intermediate\Zoning\zoning_validity_cache.sqlite"
+repair_batch_size = 200000
+repair_chunk_size = 10000
+repair_workers = None
 
-print("Input Zoning Feature Classes: " + str(input_fc_list))
+# Project:
+# Zoning polygons are projected project_batch_size at a time, in chunks across project_workers processes if > 1.
+project_batch_size = 200000
+project_workers = 1
 
-start_script = datetime.datetime.now()
-print("Start: " + str(start_script))
-
-#merged_zoning_fc = os.path.join(tmp_gdb, "california_zoning_merge")
-merged_zoning_fc = r"\\loxodonta\gis\Source_Data\planningCadastre\state\CA\Zoning\From_Mark_Hedlund_OPR\20230921\Zoning2023_9_21\DistributionV1.gdb\CaliforniaZoning"
 
 def merge():
     print("Merge input zoning datasets")
     arcpy.Merge_management(input_fc_list, merged_zoning_fc)
 
 
-input_crs = arcpy.Describe(merged_zoning_fc).spatialReference
-
-
 def project():
-    if input_crs.name != output_crs:
-        print("Input CRS " + input_crs.name)
-        print("Project to " + output_crs.name)
-        datum = input_crs.gcs.name
-        if datum == "GCS_North_American_1983":
-            datum_transformation = "WGS_1984_(ITRF00)_To_NAD_1983"
-        else:
-            datum_transformation = ""
-        arcpy.Project_management(merged_zoning_fc, output_fc, output_crs, datum_transformation)
-    else:
-        arcpy.CopyFeatures_management(merged_zoning_fc, output_fc)
+    """ Projects the merged zoning to Teale Albers as it's copied to the output, in batches of project_batch_size (see
+    Reprojection.py). """
+
+    input_crs = arcpy.Describe(merged_zoning_fc).spatialReference
+    print("Input CRS " + input_crs.name)
+    print("Project to " + output_crs.name)
+
+    read_spatial_reference, source_crs, read_transformation = Array_IO.projection_for_reading(merged_zoning_fc, output_crs)
+    fields = [field.name for field in arcpy.ListFields(merged_zoning_fc) if field.editable and field.type not in ("OID", "Geometry")]
+
+    arcpy.CreateFeatureclass_management(os.path.dirname(output_fc), os.path.basename(output_fc), "POLYGON", merged_zoning_fc, spatial_reference=output_crs)
+
+    pool = multiprocessing.Pool(project_workers) if source_crs and project_workers > 1 else None
+
+    def write_batch(rows, wkbs):
+        geometries = shapely.from_wkb(np.array(wkbs, dtype=object))
+        if source_crs:
+            geometries = Reprojection.project_geometries(geometries, source_crs, pool=pool)
+        with arcpy.da.InsertCursor(output_fc, fields + ["SHAPE@WKB"]) as ic:
+            for row, wkb in zip(rows, shapely.to_wkb(geometries).tolist()):
+                ic.insertRow(row + (wkb,))
+
+    rows = []
+    wkbs = []
+    try:
+        with Array_IO.search_cursor(merged_zoning_fc, fields + ["SHAPE@WKB"], spatial_reference=read_spatial_reference, transformation=read_transformation) as sc:
+            for row in sc:
+                rows.append(tuple(row[:-1]))
+                wkbs.append(bytes(row[-1]) if row[-1] else None)
+                if len(rows) == project_batch_size:
+                    write_batch(rows, wkbs)
+                    rows = []
+                    wkbs = []
+
+        if rows:
+            write_batch(rows, wkbs)
+
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+
+def read_wkb_batches(input_fc, batch_size):
+    """ Yields the OBJECTIDs and geometries (as WKB) of batch_size features at a time. """
+
+    oids = []
+    wkbs = []
+    with arcpy.da.SearchCursor(input_fc, ["OID@", "SHAPE@WKB"]) as sc:
+        for row in sc:
+            oids.append(row[0])
+            wkbs.append(bytes(row[1]) if row[1] else None)
+            if len(oids) == batch_size:
+                yield oids, wkbs
+                oids = []
+                wkbs = []
+
+    if oids:
+        yield oids, wkbs
 
 
 def repair_geometry():
     print("Repairing Geometry...")
-    arcpy.RepairGeometry_management(output_fc)
 
+    repaired = dict(Geometry_Repair.check_and_repair(read_wkb_batches(output_fc, repair_batch_size), validity_cache_db, repair_chunk_size, repair_workers))
+
+    # Features with no polygon left after the repair are deleted (like RepairGeometry with DELETE_NULL).
+    print("Updating " + str(len(repaired)) + " repaired geometries...")
+    with arcpy.da.UpdateCursor(output_fc, ["OID@", "SHAPE@WKB"]) as uc:
+        for row in uc:
+            if row[0] in repaired:
+                if repaired[row[0]] is None:
+                    uc.deleteRow()
+                else:
+                    row[1] = repaired[row[0]]
+                    uc.updateRow(row)
+
+
+if __name__ == "__main__":
+
+    arcpy.env.workspace = input_gdb
+
+    input_fc_list = arcpy.ListFeatureClasses()
+
+    print("Input Zoning Feature Classes: " + str(input_fc_list))
+
+    start_script = datetime.datetime.now()
+    print("Start: " + str(start_script))
 
-#merge()
-project()
-repair_geometry()
+    #merge()
+    project()
+    repair_geometry()
 
-end_script = datetime.datetime.now()
-print("\nEnd Script: " + str(end_script))
+    end_script = datetime.datetime.now()
+    print("\nEnd Script: " + str(end_script))
 
-duration = end_script - start_script
-print("Total Duration: " + str(duration))
+    duration = end_script - start_script
+    print("Total Duration: " + str(duration))
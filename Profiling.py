@@ -0,0 +1,196 @@
+########################################################################################################################
+# File name: Profiling.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x (ArcGIS Pro)
+# Description:
+# Records how long each step of a run takes in a SQLite history database, so the runtime of a requirement, the
+# exemptions, the dev team tables, or a Prepare_Parcels stage can be compared between runs (instead of the RUNTIME
+# DURATION notes at the top of the scripts).
+# For each step: wall time, CPU time, peak memory (the largest resident set size of the process while the step ran,
+# sampled every memory_sample_seconds on a background thread), rows processed and rows per second, keyed by run, script,
+# county, and step.
+# Peak memory requires psutil on Windows (it's included in the ArcGIS Pro python environment).
+# Report (flags steps that are slower than in previous runs):
+# python Profiling.py report <history database> [tolerance (default 0.25 = 25% slower)] [previous runs (default 5)]
+########################################################################################################################
+
+import contextlib
+import datetime
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Steps shorter than this (in seconds) are never flagged as regressions. Their times are mostly noise.
+minimum_regression_seconds = 5
+
+# How often the memory of the process is sampled while a step runs (seconds).
+memory_sample_seconds = 0.25
+
+
+def rss_mb():
+    """ Returns the current resident set size (memory) of this process in MB, or None if it can't be measured. """
+
+    if psutil:
+        return psutil.Process().memory_info().rss / 1024.0 / 1024.0
+    if os.path.exists("/proc/self/statm"):
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024.0 / 1024.0
+
+    return None
+
+
+class MemorySampler(object):
+    """ Samples the resident set size of this process on a background thread until stopped. peak_mb is the largest
+        sample (None if the memory can't be measured).
+    """
+
+    def __init__(self):
+        self.peak_mb = rss_mb()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        if self.peak_mb is not None:
+            self.thread.start()
+
+    def sample(self):
+        self.peak_mb = max(self.peak_mb, rss_mb())
+
+    def run(self):
+        while not self.stopped.wait(memory_sample_seconds):
+            self.sample()
+
+    def stop(self):
+        """ Stops sampling and returns the peak (MB). """
+
+        if self.peak_mb is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.sample()
+
+        return self.peak_mb
+
+
+class Profiler(object):
+    """ Records the steps of a run in the history database. Every process in a run (e.g., the county worker processes)
+        uses the same run label so that its steps are grouped with the rest of the run.
+    """
+
+    def __init__(self, database, run_label, script):
+        self.run_label = run_label
+        self.script = script
+        self.host = socket.gethostname()
+        self.connection = sqlite3.connect(database, timeout=300)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS steps (run_label TEXT, script TEXT, county TEXT, step TEXT, host TEXT, pid INTEGER, started TEXT, wall_seconds REAL, cpu_seconds REAL, peak_rss_mb REAL, rows INTEGER, rows_per_second REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS steps_index ON steps (script, county, step)")
+        self.connection.commit()
+
+    @contextlib.contextmanager
+    def step(self, county, step, rows=None):
+        """ Context manager that times the code it wraps and records it as a step. Steps that raise an exception aren't
+            recorded (their times would be misleading).
+        """
+
+        started = datetime.datetime.now()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        memory_sampler = MemorySampler()
+
+        try:
+            yield
+        finally:
+            step_peak_rss_mb = memory_sampler.stop()
+
+        wall_seconds = time.perf_counter() - wall_start
+        cpu_seconds = time.process_time() - cpu_start
+        rows_per_second = rows / wall_seconds if rows and wall_seconds > 0 else None
+
+        self.connection.execute(
+            "INSERT INTO steps (run_label, script, county, step, host, pid, started, wall_seconds, cpu_seconds, peak_rss_mb, rows, rows_per_second) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.run_label, self.script, county, step, self.host, os.getpid(), str(started), wall_seconds, cpu_seconds, step_peak_rss_mb, rows, rows_per_second))
+        self.connection.commit()
+
+        print("Step " + step + " (" + county + "): " + str(datetime.timedelta(seconds=round(wall_seconds))) + (" (" + str(int(rows_per_second)) + " rows/sec)" if rows_per_second else ""))
+
+    def close(self):
+        self.connection.close()
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def report(database, tolerance=0.25, previous_runs=5):
+    """ Prints the steps of the most recent run of each script, compared with the median wall time of the same
+        (script, county, step) in up to previous_runs earlier runs. Steps more than tolerance slower are flagged.
+        Returns a list of [script, county, step, wall seconds, previous median wall seconds] for the flagged steps.
+    """
+
+    connection = sqlite3.connect(database)
+    regressions = []
+
+    scripts = [row[0] for row in connection.execute("SELECT DISTINCT script FROM steps ORDER BY script")]
+    for script in scripts:
+        run_labels = [row[0] for row in connection.execute("SELECT run_label FROM steps WHERE script = ? GROUP BY run_label ORDER BY MIN(started) DESC", (script,))]
+        latest_run_label = run_labels[0]
+        earlier_run_labels = run_labels[1:previous_runs + 1]
+
+        print("\n" + script + ": run " + latest_run_label + " compared with " + str(len(earlier_run_labels)) + " previous run(s)\n")
+        print("{:<16} {:<28} {:>12} {:>12} {:>8} {:>12} {:>10}".format("County", "Step", "Wall (s)", "Previous (s)", "Change", "Rows/sec", "Peak MB"))
+
+        rows = connection.execute("SELECT county, step, SUM(wall_seconds), SUM(rows), MAX(peak_rss_mb) FROM steps WHERE script = ? AND run_label = ? GROUP BY county, step ORDER BY county, step", (script, latest_run_label)).fetchall()
+        for county, step, wall_seconds, step_rows, step_peak_rss_mb in rows:
+
+            previous_wall_seconds = []
+            for run_label in earlier_run_labels:
+                previous = connection.execute("SELECT SUM(wall_seconds) FROM steps WHERE script = ? AND run_label = ? AND county = ? AND step = ?", (script, run_label, county, step)).fetchone()[0]
+                if previous is not None:
+                    previous_wall_seconds.append(previous)
+
+            flag = ""
+            if previous_wall_seconds:
+                previous_median = median(previous_wall_seconds)
+                change = (wall_seconds - previous_median) / previous_median if previous_median > 0 else 0
+                change_text = "{:+.0%}".format(change)
+                if change > tolerance and wall_seconds - previous_median > minimum_regression_seconds:
+                    flag = "  REGRESSION"
+                    regressions.append([script, county, step, wall_seconds, previous_median])
+                previous_text = "{:.1f}".format(previous_median)
+            else:
+                change_text = previous_text = "-"
+
+            rows_per_second_text = "{:.0f}".format(step_rows / wall_seconds) if step_rows and wall_seconds > 0 else "-"
+            peak_rss_text = "{:.0f}".format(step_peak_rss_mb) if step_peak_rss_mb else "-"
+
+            print("{:<16} {:<28} {:>12.1f} {:>12} {:>8} {:>12} {:>10}{}".format(county, step, wall_seconds, previous_text, change_text, rows_per_second_text, peak_rss_text, flag))
+
+    connection.close()
+
+    print("\n" + str(len(regressions)) + " regression(s) found (tolerance: " + "{:.0%}".format(tolerance) + ").")
+
+    return regressions
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 3 or sys.argv[1] != "report":
+        print("Usage: python Profiling.py report <history database> [tolerance] [previous runs]")
+        sys.exit(1)
+
+    history_database = sys.argv[2]
+    regression_tolerance = float(sys.argv[3]) if len(sys.argv) > 3 else 0.25
+    number_of_previous_runs = int(sys.argv[4]) if len(sys.argv) > 4 else 5
+
+    sys.exit(1 if report(history_database, regression_tolerance, number_of_previous_runs) else 0)
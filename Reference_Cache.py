@@ -0,0 +1,207 @@
+########################################################################################################################
+# File name: Reference_Cache.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x (ArcGIS Pro)
+# Description:
+# A local cache of the reference datasets used to calculate requirements, clipped to each county.
+# Each cached layer is the source dataset (with its where clause applied) clipped to the extent of a county's parcels
+# plus a margin, and projected to NAD_1983_California_Teale_Albers. Cached layers are stored in their own file
+# geodatabase in the cache folder so that each county only has to read a small, local, already projected dataset
+# instead of the statewide one (which may be on a network share, in an enterprise geodatabase, or in another CRS).
+# Each cached layer has a version key (the source path and version, the where clause, the clip extent) and is rebuilt
+# when the key changes. Least recently used layers are deleted when the cache exceeds its size cap.
+# The cache can be shared by several processes (e.g., county worker processes). A layer returned by get is leased to the
+# process until it calls release (or the lease expires, if the process dies), and leased layers are never deleted.
+########################################################################################################################
+
+import arcpy
+import datetime
+import os
+import shutil
+import socket
+import sqlite3
+import time
+import Reprojection
+import Run_State
+
+output_crs = arcpy.SpatialReference("NAD_1983_California_Teale_Albers")
+
+
+def folder_size(folder):
+    """ Returns the total size of the files in a folder, in bytes. """
+
+    size = 0
+    for root, dirs, file_names in os.walk(folder):
+        for file_name in file_names:
+            size += os.path.getsize(os.path.join(root, file_name))
+
+    return size
+
+
+def datum_transformation(input_spatial_reference):
+    """ Returns the datum transformation used when projecting to the output CRS (same rule as the Prepare scripts). """
+
+    return Reprojection.datum_transformation(input_spatial_reference)
+
+
+class ReferenceCache(object):
+    """ Cache of reference datasets clipped to a county extent and projected to the output CRS. """
+
+    def __init__(self, cache_folder, max_size_mb=20000, margin_meters=1000, lease_hours=24):
+        """ margin_meters is added around the county extent. It must be at least as large as the largest search
+            distance used with the cached layers.
+            lease_hours is how long a layer stays leased to a process that doesn't release it (e.g., one that crashed).
+            It must be longer than it takes to process a county.
+        """
+
+        self.cache_folder = cache_folder
+        self.max_size = max_size_mb * 1024 * 1024
+        self.margin_meters = margin_meters
+        self.lease_seconds = lease_hours * 3600
+        self.owner = socket.gethostname() + ":" + str(os.getpid())
+
+        if not os.path.exists(cache_folder):
+            os.makedirs(cache_folder)
+
+        self.connection = sqlite3.connect(os.path.join(cache_folder, "cache_index.sqlite"), timeout=300)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS layers (source TEXT, where_clause TEXT, county TEXT, version_key TEXT, path TEXT, size INTEGER, last_used TEXT, PRIMARY KEY (source, where_clause, county))")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS leases (path TEXT, owner TEXT, expires REAL, PRIMARY KEY (path, owner))")
+        self.connection.commit()
+
+    def lease(self, path):
+        """ Leases a layer to this process so it isn't deleted while it's being read. """
+
+        self.connection.execute("INSERT OR REPLACE INTO leases (path, owner, expires) VALUES (?, ?, ?)", (path, self.owner, time.time() + self.lease_seconds))
+        self.connection.commit()
+
+    def release(self):
+        """ Releases the layers leased to this process (e.g., when it has finished a county). """
+
+        self.connection.execute("DELETE FROM leases WHERE owner = ?", (self.owner,))
+        self.connection.commit()
+
+    def leased_paths(self):
+        """ Returns the paths of the layers leased to any process (leases that haven't expired). """
+
+        self.connection.execute("DELETE FROM leases WHERE expires < ?", (time.time(),))
+        self.connection.commit()
+
+        return set(row[0] for row in self.connection.execute("SELECT path FROM leases"))
+
+    def get(self, source_fc, county, county_extent, where_clause=None):
+        """ Returns the path to the cached copy of source_fc (where_clause applied) clipped to the county extent (an
+            arcpy Extent in the output CRS). The cached copy is created if it doesn't exist or is out of date.
+        """
+
+        where_clause_key = where_clause or ""
+        version_key = Run_State.fingerprint([
+            Run_State.dataset_version(source_fc),
+            where_clause_key,
+            [county_extent.XMin, county_extent.YMin, county_extent.XMax, county_extent.YMax],
+            self.margin_meters,
+            output_crs.name,
+        ])
+
+        row = self.connection.execute("SELECT version_key, path FROM layers WHERE source = ? AND where_clause = ? AND county = ?", (source_fc, where_clause_key, county)).fetchone()
+
+        if row and row[0] == version_key and arcpy.Exists(row[1]):
+            self.connection.execute("UPDATE layers SET last_used = ? WHERE source = ? AND where_clause = ? AND county = ?", (str(datetime.datetime.now()), source_fc, where_clause_key, county))
+            self.connection.commit()
+            self.lease(row[1])
+            return row[1]
+
+        if row:
+            print("Cached reference layer is out of date. Rebuilding: " + source_fc)
+            # A layer that is still being read by another process is deleted by a later eviction instead.
+            if row[1] not in self.leased_paths():
+                self.delete_layer(row[1])
+        else:
+            print("Caching reference layer for " + county + ": " + source_fc)
+
+        # Leased before it's built, so another process's eviction doesn't delete the new geodatabase.
+        path = self.layer_path(version_key)
+        self.lease(path)
+        self.build_layer(source_fc, county_extent, where_clause, version_key)
+        gdb = os.path.dirname(path)
+
+        self.connection.execute(
+            "INSERT OR REPLACE INTO layers (source, where_clause, county, version_key, path, size, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (source_fc, where_clause_key, county, version_key, path, folder_size(gdb), str(datetime.datetime.now())))
+        self.connection.commit()
+
+        self.evict()
+
+        return path
+
+    def layer_path(self, version_key):
+        """ Returns the path to the cached layer with a version key. """
+
+        return os.path.join(self.cache_folder, "reference_" + version_key[:16] + ".gdb", "reference")
+
+    def build_layer(self, source_fc, county_extent, where_clause, version_key):
+        """ Clips (and projects) the source dataset to the county extent plus the margin in a new file geodatabase. """
+
+        output_fc = self.layer_path(version_key)
+        gdb = os.path.dirname(output_fc)
+        gdb_name = os.path.basename(gdb)
+        if arcpy.Exists(gdb):
+            arcpy.Delete_management(gdb)
+        arcpy.CreateFileGDB_management(self.cache_folder, gdb_name)
+
+        margin = self.margin_meters
+        clip_polygon = arcpy.Polygon(arcpy.Array([
+            arcpy.Point(county_extent.XMin - margin, county_extent.YMin - margin),
+            arcpy.Point(county_extent.XMin - margin, county_extent.YMax + margin),
+            arcpy.Point(county_extent.XMax + margin, county_extent.YMax + margin),
+            arcpy.Point(county_extent.XMax + margin, county_extent.YMin - margin),
+        ]), output_crs)
+
+        source_layer = arcpy.MakeFeatureLayer_management(source_fc, "reference_cache_source_layer", where_clause)
+
+        # Setting the output coordinate system projects the features as they are clipped.
+        transformation = datum_transformation(arcpy.Describe(source_fc).spatialReference)
+        with arcpy.EnvManager(outputCoordinateSystem=output_crs, geographicTransformations=transformation):
+            arcpy.Clip_analysis(source_layer, clip_polygon, output_fc)
+
+        arcpy.Delete_management(source_layer)
+
+        return output_fc
+
+    def delete_layer(self, path):
+        """ Deletes a cached layer's geodatabase. """
+
+        gdb = os.path.dirname(path)
+        if os.path.exists(gdb):
+            shutil.rmtree(gdb, ignore_errors=True)
+
+    def evict(self):
+        """ Deletes the least recently used layers until the cache is below its size cap, along with the geodatabases
+            of layers that were replaced while they were leased. Leased layers are never deleted.
+        """
+
+        leased_paths = self.leased_paths()
+        rows = self.connection.execute("SELECT source, where_clause, county, path, size FROM layers ORDER BY last_used").fetchall()
+        total_size = sum(row[4] for row in rows)
+
+        indexed_gdbs = set(os.path.basename(os.path.dirname(row[3])) for row in rows)
+        leased_gdbs = set(os.path.basename(os.path.dirname(path)) for path in leased_paths)
+        for gdb_name in os.listdir(self.cache_folder):
+            if gdb_name.startswith("reference_") and gdb_name.endswith(".gdb") and gdb_name not in indexed_gdbs and gdb_name not in leased_gdbs:
+                print("Deleting a replaced reference layer: " + gdb_name)
+                shutil.rmtree(os.path.join(self.cache_folder, gdb_name), ignore_errors=True)
+
+        for source, where_clause, county, path, size in rows:
+            if total_size <= self.max_size:
+                break
+            if path in leased_paths:
+                continue
+            print("Reference cache is over its size cap. Deleting: " + path)
+            self.delete_layer(path)
+            self.connection.execute("DELETE FROM layers WHERE source = ? AND where_clause = ? AND county = ?", (source, where_clause, county))
+            total_size -= size
+
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
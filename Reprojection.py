@@ -0,0 +1,268 @@
+########################################################################################################################
+# File name: Reprojection.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x (ArcGIS Pro)
+# Description:
+# Vectorized (NumPy) conversions between NAD_1983_California_Teale_Albers (the CRS of the prepared parcels) and
+# geographic coordinates (GCS_North_American_1983, decimal degrees).
+# Used in place of arcpy geometry calculations that convert one feature at a time (e.g., CalculateGeometryAttributes
+# with the "DD" format). No datum transformation is needed: both coordinate systems use NAD83 (GRS 1980 ellipsoid).
+# Formulas: Albers Equal-Area Conic (ellipsoid), Snyder, Map Projections - A Working Manual (USGS PP 1395), pp. 101-102.
+# Also projects whole geometries to Teale Albers in batches (project_geometries), optionally in chunks across a process
+# pool, so the prep stages can project their inputs as they read them instead of writing a projected copy first
+# (Project_management). Supported source coordinate systems (see source_crs): NAD83 or WGS 1984 geographic, Teale Albers
+# (NAD83 or WGS 1984, any linear unit), and WGS 1984 Web Mercator. Other coordinate systems are projected by arcpy as
+# they are read, using the same datum transformation (datum_transformation).
+# WGS 1984 coordinates are converted to NAD83 with the WGS_1984_(ITRF00)_To_NAD_1983 transformation (coordinate frame
+# Helmert, 7 parameters).
+########################################################################################################################
+
+import multiprocessing
+import numpy as np
+import shapely
+
+# GRS 1980 ellipsoid.
+semi_major_axis = 6378137.0
+flattening = 1 / 298.257222101
+
+# NAD_1983_California_Teale_Albers.
+false_easting = 0.0
+false_northing = -4000000.0
+central_meridian = -120.0
+standard_parallel_1 = 34.0
+standard_parallel_2 = 40.5
+latitude_of_origin = 0.0
+
+eccentricity_squared = flattening * (2 - flattening)
+eccentricity = np.sqrt(eccentricity_squared)
+
+# WGS 1984 ellipsoid.
+wgs84_flattening = 1 / 298.257223563
+
+# WGS_1984_(ITRF00)_To_NAD_1983 (coordinate frame): translations (meters), rotations (arc seconds), scale (ppm).
+itrf00_to_nad83 = [0.9956, -1.9013, -0.5215, 0.025915, 0.009426, 0.011599, 0.00062]
+
+# Datum transformation used for datasets that aren't in NAD83. Used by every prep stage that projects to Teale Albers.
+wgs84_to_nad83_transformation = "WGS_1984_(ITRF00)_To_NAD_1983"
+
+# Number of geometries projected by a worker at a time (project_geometries).
+default_chunk_size = 100000
+
+
+def albers_q(latitude_radians):
+    """ Snyder equation 3-12. """
+
+    sin_latitude = np.sin(latitude_radians)
+    e_sin = eccentricity * sin_latitude
+
+    return (1 - eccentricity_squared) * (sin_latitude / (1 - eccentricity_squared * sin_latitude ** 2) - (1 / (2 * eccentricity)) * np.log((1 - e_sin) / (1 + e_sin)))
+
+
+def albers_m(latitude_radians):
+    """ Snyder equation 14-15. """
+
+    sin_latitude = np.sin(latitude_radians)
+
+    return np.cos(latitude_radians) / np.sqrt(1 - eccentricity_squared * sin_latitude ** 2)
+
+
+# Projection constants (Snyder equations 14-13, 14-14, 14-12).
+m1 = albers_m(np.radians(standard_parallel_1))
+m2 = albers_m(np.radians(standard_parallel_2))
+q1 = albers_q(np.radians(standard_parallel_1))
+q2 = albers_q(np.radians(standard_parallel_2))
+q0 = albers_q(np.radians(latitude_of_origin))
+qp = albers_q(np.radians(90.0))
+
+n = (m1 ** 2 - m2 ** 2) / (q2 - q1)
+C = m1 ** 2 + n * q1
+rho0 = semi_major_axis * np.sqrt(C - n * q0) / n
+
+
+def geographic_to_teale_albers(longitude, latitude):
+    """ Projects arrays of longitude and latitude (decimal degrees, NAD83) to Teale Albers x and y (meters). """
+
+    longitude = np.asarray(longitude, dtype=np.float64)
+    latitude = np.asarray(latitude, dtype=np.float64)
+
+    rho = semi_major_axis * np.sqrt(C - n * albers_q(np.radians(latitude))) / n
+    theta = n * np.radians(longitude - central_meridian)
+
+    x = false_easting + rho * np.sin(theta)
+    y = false_northing + rho0 - rho * np.cos(theta)
+
+    return x, y
+
+
+def teale_albers_to_geographic(x, y):
+    """ Converts arrays of Teale Albers x and y (meters) to longitude and latitude (decimal degrees, NAD83). """
+
+    x = np.asarray(x, dtype=np.float64) - false_easting
+    y = np.asarray(y, dtype=np.float64) - false_northing
+
+    rho = np.sqrt(x ** 2 + (rho0 - y) ** 2)
+    theta = np.arctan2(x, rho0 - y)
+    q = (C - (rho * n / semi_major_axis) ** 2) / n
+
+    # Latitude from q: first through the authalic latitude (Snyder equation 3-18, series form), then refined with two
+    # iterations of Snyder equation 3-16.
+    beta = np.arcsin(np.clip(q / qp, -1, 1))
+    e4 = eccentricity_squared ** 2
+    e6 = eccentricity_squared ** 3
+    latitude = (beta
+                + (eccentricity_squared / 3 + 31 * e4 / 180 + 517 * e6 / 5040) * np.sin(2 * beta)
+                + (23 * e4 / 360 + 251 * e6 / 3780) * np.sin(4 * beta)
+                + (761 * e6 / 45360) * np.sin(6 * beta))
+
+    for iteration in range(2):
+        sin_latitude = np.sin(latitude)
+        one_minus_e2_sin2 = 1 - eccentricity_squared * sin_latitude ** 2
+        e_sin = eccentricity * sin_latitude
+        latitude = latitude + one_minus_e2_sin2 ** 2 / (2 * np.cos(latitude)) * (
+            q / (1 - eccentricity_squared) - sin_latitude / one_minus_e2_sin2 + (1 / (2 * eccentricity)) * np.log((1 - e_sin) / (1 + e_sin)))
+
+    longitude = central_meridian + np.degrees(theta / n)
+
+    return longitude, np.degrees(latitude)
+
+
+def datum_transformation(input_spatial_reference):
+    """ Returns the datum transformation used when projecting a dataset (with this spatial reference) to Teale Albers:
+        WGS_1984_(ITRF00)_To_NAD_1983 for datasets in WGS 1984 or NAD83 (it's ignored for NAD83), otherwise none.
+    """
+
+    if input_spatial_reference.gcs.name in ("GCS_WGS_1984", "GCS_North_American_1983"):
+        return wgs84_to_nad83_transformation
+
+    return ""
+
+
+def geodetic_to_ecef(longitude, latitude, ellipsoid_flattening):
+    """ Converts longitude and latitude (decimal degrees, height 0) to earth centered (X, Y, Z) coordinates. """
+
+    e2 = ellipsoid_flattening * (2 - ellipsoid_flattening)
+    longitude = np.radians(longitude)
+    latitude = np.radians(latitude)
+    prime_vertical_radius = semi_major_axis / np.sqrt(1 - e2 * np.sin(latitude) ** 2)
+
+    return (prime_vertical_radius * np.cos(latitude) * np.cos(longitude),
+            prime_vertical_radius * np.cos(latitude) * np.sin(longitude),
+            prime_vertical_radius * (1 - e2) * np.sin(latitude))
+
+
+def ecef_to_geodetic(x, y, z, ellipsoid_flattening):
+    """ Converts earth centered (X, Y, Z) coordinates to longitude and latitude (decimal degrees). """
+
+    e2 = ellipsoid_flattening * (2 - ellipsoid_flattening)
+    p = np.sqrt(x ** 2 + y ** 2)
+    latitude = np.arctan2(z, p * (1 - e2))
+    for iteration in range(4):
+        prime_vertical_radius = semi_major_axis / np.sqrt(1 - e2 * np.sin(latitude) ** 2)
+        height = p / np.cos(latitude) - prime_vertical_radius
+        latitude = np.arctan2(z, p * (1 - e2 * prime_vertical_radius / (prime_vertical_radius + height)))
+
+    return np.degrees(np.arctan2(y, x)), np.degrees(latitude)
+
+
+def wgs84_to_nad83(longitude, latitude):
+    """ Converts WGS 1984 longitude and latitude to NAD83 (WGS_1984_(ITRF00)_To_NAD_1983, coordinate frame rotation). """
+
+    tx, ty, tz, rx, ry, rz, ds = itrf00_to_nad83
+    rx, ry, rz = np.radians(np.array([rx, ry, rz]) / 3600.0)
+    scale = 1 + ds * 1e-6
+
+    x, y, z = geodetic_to_ecef(longitude, latitude, wgs84_flattening)
+    x_nad83 = tx + scale * (x + rz * y - ry * z)
+    y_nad83 = ty + scale * (-rz * x + y + rx * z)
+    z_nad83 = tz + scale * (ry * x - rx * y + z)
+
+    return ecef_to_geodetic(x_nad83, y_nad83, z_nad83, flattening)
+
+
+def web_mercator_to_geographic(x, y):
+    """ Converts WGS 1984 Web Mercator (auxiliary sphere) x and y (meters) to longitude and latitude (decimal degrees). """
+
+    return np.degrees(x / semi_major_axis), np.degrees(2 * np.arctan(np.exp(y / semi_major_axis)) - np.pi / 2)
+
+
+def source_crs(spatial_reference):
+    """ Returns a description of a spatial reference (an arcpy SpatialReference) that project_geometries can project
+        from ([type, datum, meters per unit]), or None if it isn't supported (the geometries should be projected by
+        arcpy as they are read).
+    """
+
+    datum = {"GCS_North_American_1983": "NAD83", "GCS_WGS_1984": "WGS84"}.get(spatial_reference.gcs.name)
+    if datum is None:
+        return None
+
+    if spatial_reference.type == "Geographic":
+        return ["geographic", datum, 1.0]
+
+    projection_name = spatial_reference.projectionName
+    if projection_name == "Albers":
+        teale_albers = [false_easting, false_northing, central_meridian, standard_parallel_1, standard_parallel_2, latitude_of_origin]
+        parameters = [spatial_reference.falseEasting * spatial_reference.metersPerUnit, spatial_reference.falseNorthing * spatial_reference.metersPerUnit,
+                      spatial_reference.centralMeridian, spatial_reference.standardParallel1, spatial_reference.standardParallel2, spatial_reference.latitudeOfOrigin]
+        if np.allclose(parameters, teale_albers):
+            return ["teale_albers", datum, spatial_reference.metersPerUnit]
+
+    if projection_name == "Mercator_Auxiliary_Sphere" and datum == "WGS84":
+        return ["web_mercator", datum, spatial_reference.metersPerUnit]
+
+    return None
+
+
+def coordinates_to_teale_albers(coordinates, source):
+    """ Projects an (n, 2) array of coordinates in the source coordinate system (see source_crs) to Teale Albers. """
+
+    crs_type, datum, meters_per_unit = source
+    x = coordinates[:, 0]
+    y = coordinates[:, 1]
+
+    if crs_type == "teale_albers":
+        x = x * meters_per_unit
+        y = y * meters_per_unit
+        if datum == "NAD83":
+            return np.stack([x, y], axis=1)
+        # WGS 1984 Teale Albers: the difference between the WGS 1984 and GRS 1980 ellipsoids is < 1 mm.
+        longitude, latitude = teale_albers_to_geographic(x, y)
+    elif crs_type == "web_mercator":
+        longitude, latitude = web_mercator_to_geographic(x * meters_per_unit, y * meters_per_unit)
+    else:
+        longitude, latitude = x, y
+
+    if datum == "WGS84":
+        longitude, latitude = wgs84_to_nad83(longitude, latitude)
+
+    return np.stack(geographic_to_teale_albers(longitude, latitude), axis=1)
+
+
+def project_chunk(args):
+    """ Pool worker for project_geometries. Geometries are passed as WKB. """
+
+    wkbs, source = args
+
+    return shapely.to_wkb(shapely.transform(shapely.from_wkb(wkbs), lambda coordinates: coordinates_to_teale_albers(coordinates, source)))
+
+
+def project_geometries(geometries, source, chunk_size=default_chunk_size, workers=1, pool=None):
+    """ Projects an array of shapely geometries from the source coordinate system (see source_crs) to Teale Albers.
+        If workers is > 1 (or a pool is provided), the geometries are projected in chunks of chunk_size across a
+        process pool. Empty (None) geometries stay None.
+    """
+
+    geometries = np.asarray(geometries, dtype=object)
+    transform = lambda coordinates: coordinates_to_teale_albers(coordinates, source)
+
+    if workers == 1 and pool is None or len(geometries) <= chunk_size:
+        return shapely.transform(geometries, transform)
+
+    chunks = [(shapely.to_wkb(geometries[start:start + chunk_size]), source) for start in range(0, len(geometries), chunk_size)]
+    if pool is None:
+        with multiprocessing.Pool(workers) as worker_pool:
+            projected = worker_pool.map(project_chunk, chunks)
+    else:
+        projected = pool.map(project_chunk, chunks)
+
+    return shapely.from_wkb(np.concatenate(projected))
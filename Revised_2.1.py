@@ -1,5 +1,7 @@
 import arcpy
 import os
+import hashlib
+import json
 
 intermediate_ws = r"P:\Projects3\CEQA_Site_Check_Version_1_0_2021_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Intermediate\Intermediate.gdb"
 scratch_ws = r"P:\Projects3\CEQA_Site_Check_Version_1_0_2021_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Intermediate\Scratch\Scratch.gdb"
@@ -8,6 +10,13 @@ cities_with_population_fc = r"Database Connections\CBI Intermediate.sde\cbiinter
 unincorporated_islands_with_population_fc = r"P:\Projects3\CEQA_Site_Check_Version_1_0_2021_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Intermediate\Intermediate.gdb\Unincorporated_Islands_CALFIRE_2021_with_Population_Dissolve"
 urbanized_area_prc_21071 = intermediate_ws + os.sep + "urbanized_area_prc_21071_v1_0"
 
+# Adjacency graph (polygons that share a line segment), saved so it can be reused when only the population inputs change.
+# The graph is rebuilt if the geometries in urbanized_area_prc_21071 change.
+adjacency_graph_json = r"P:\Projects3\CEQA_Site_Check_Version_1_0_2021_mike_gough\Tasks\CEQA_Parcel_Exemptions\Data\Intermediate\urbanized_area_prc_21071_adjacency.json"
+
+# Boundary segment coordinates are rounded to this many decimal places before they are compared.
+segment_precision = 3
+
 arcpy.Union_analysis([cities_with_population_fc, unincorporated_islands_with_population_fc], urbanized_area_prc_21071)
 
 fields_to_drop = [
@@ -60,7 +69,78 @@ fields = [
 
 ]
 
-urbanized_area_prc_21071_layer = arcpy.MakeFeatureLayer_management(urbanized_area_prc_21071)
+
+def read_rings(input_fc):
+    """ Returns a dictionary of OBJECTID: list of rings (lists of (x, y) vertices) and a fingerprint of the geometries. """
+
+    rings_by_oid = {}
+    fingerprint = hashlib.sha1()
+    with arcpy.da.SearchCursor(input_fc, ["OID@", "SHAPE@"]) as sc:
+        for row in sorted(sc, key=lambda row: row[0]):
+            oid, shape = row
+            rings = []
+            if shape:
+                for part in shape:
+                    ring = []
+                    for point in part:
+                        # A None point separates the rings of a part (exterior and holes).
+                        if point is None:
+                            rings.append(ring)
+                            ring = []
+                        else:
+                            ring.append((round(point.X, segment_precision), round(point.Y, segment_precision)))
+                    rings.append(ring)
+            rings_by_oid[oid] = rings
+            fingerprint.update((str(oid) + ":" + str(rings)).encode("utf-8"))
+
+    return rings_by_oid, fingerprint.hexdigest()
+
+
+def build_adjacency_graph(rings_by_oid):
+    """ Returns a dictionary of OBJECTID: sorted list of the OBJECTIDs of the polygons that share a line segment with it
+    (the equivalent of SelectLayerByLocation "SHARE_A_LINE_SEGMENT_WITH").
+    Each boundary segment is hashed with its end points in sorted order (so it has the same key in both polygons,
+    regardless of the direction the rings were digitized in) and polygons with a key in common are neighbors.
+    Note: This relies on shared boundaries having the same vertices, which is the case for the output of Union. """
+
+    oids_by_segment = {}
+    for oid, rings in rings_by_oid.items():
+        for ring in rings:
+            for start, end in zip(ring[:-1], ring[1:]):
+                if start != end:
+                    oids_by_segment.setdefault(min(start, end) + max(start, end), set()).add(oid)
+
+    neighbors = dict((oid, set()) for oid in rings_by_oid)
+    for oids in oids_by_segment.values():
+        if len(oids) > 1:
+            for oid in oids:
+                neighbors[oid].update(oids - {oid})
+
+    return dict((oid, sorted(oid_neighbors)) for oid, oid_neighbors in neighbors.items())
+
+
+def get_adjacency_graph(input_fc):
+    """ Returns the adjacency graph for the input, from adjacency_graph_json if the geometries haven't changed since it
+    was saved, otherwise built and saved. """
+
+    rings_by_oid, fingerprint = read_rings(input_fc)
+
+    if os.path.exists(adjacency_graph_json):
+        with open(adjacency_graph_json, "r") as f:
+            saved = json.load(f)
+        if saved["fingerprint"] == fingerprint:
+            print("Using saved adjacency graph: " + adjacency_graph_json)
+            return dict((int(oid), oid_neighbors) for oid, oid_neighbors in saved["neighbors"].items())
+
+    print("Building adjacency graph...")
+    neighbors = build_adjacency_graph(rings_by_oid)
+    with open(adjacency_graph_json, "w") as f:
+        json.dump({"fingerprint": fingerprint, "neighbors": neighbors}, f)
+
+    return neighbors
+
+
+adjacency_graph = get_adjacency_graph(urbanized_area_prc_21071)
 
 # Need to get population estimates in there first in order to be able to look at the population of surrounding cities.
 with arcpy.da.UpdateCursor(urbanized_area_prc_21071, fields) as uc:
@@ -91,6 +171,14 @@ with arcpy.da.UpdateCursor(urbanized_area_prc_21071, fields) as uc:
         uc.updateRow(row)
 
 
+# Attributes of each polygon used for the surrounding city totals.
+area_km2_by_oid = {}
+population_by_oid = {}
+with arcpy.da.SearchCursor(urbanized_area_prc_21071, ["OBJECTID", "area_km2", "population_estimate"]) as sc:
+    for row in sc:
+        area_km2_by_oid[row[0]] = row[1]
+        population_by_oid[row[0]] = row[2]
+
 with arcpy.da.UpdateCursor(urbanized_area_prc_21071, fields) as uc:
     for row in uc:
 
@@ -106,33 +194,29 @@ with arcpy.da.UpdateCursor(urbanized_area_prc_21071, fields) as uc:
         population_density = population_estimate / area_km2
         row[12] = population_density  # Population density of this polygon
 
-        # Iterate over the cities surrounding this polygon and total up information about the surrounding cities.
-        this_polygon = arcpy.SelectLayerByAttribute_management(urbanized_area_prc_21071_layer, "NEW_SELECTION", "OBJECTID = " + str(row[7]))
-        surrounding_cities_layer = arcpy.SelectLayerByLocation_management(urbanized_area_prc_21071_layer, "SHARE_A_LINE_SEGMENT_WITH", this_polygon)
-
-        with arcpy.da.SearchCursor(surrounding_cities_layer, fields) as sc:
-            surrounding_city_count = 0
-            surrounding_area_total = 0
-            surrounding_population_total = 0
-            surrounding_population_list = []
-
-            for surrounding_cities_row in sc:
-                surrounding_city_oid = surrounding_cities_row[7]
-                # If the polygon that shares a line segment with this polygon is not this polygons itself add to the totals.
-                if oid != surrounding_city_oid:
-                    surrounding_city_count += 1  # Count Surrounding City
-                    surrounding_area = surrounding_cities_row[13]  # Area Surrounding City
-                    surrounding_area_total += surrounding_area  # Area Surrounding City Total
-                    surrounding_city_population = surrounding_cities_row[6]  # Surrounding Population
-                    surrounding_population_total += surrounding_city_population  # Surrounding Population Total
-                    surrounding_population_list.append(surrounding_city_population)  # List of surrounding population.
-
-            surrounding_population_list_sorted = sorted(surrounding_population_list)
-
-            print(" Surrounding City Count:" + str(surrounding_city_count))
-            print(" Surrounding Population List:" + str(surrounding_population_list_sorted))
-            print(" Surrounding Population:" + str(surrounding_population_total))
-            print(" Surrounding Area:" + str(surrounding_area))
+        # Iterate over the cities surrounding this polygon (from the adjacency graph) and total up information about the
+        # surrounding cities.
+        surrounding_city_count = 0
+        surrounding_area_total = 0
+        surrounding_population_total = 0
+        surrounding_population_list = []
+
+        for surrounding_city_oid in adjacency_graph.get(oid, []):
+            # If the polygon that shares a line segment with this polygon is not this polygons itself add to the totals.
+            if oid != surrounding_city_oid:
+                surrounding_city_count += 1  # Count Surrounding City
+                surrounding_area = area_km2_by_oid[surrounding_city_oid]  # Area Surrounding City
+                surrounding_area_total += surrounding_area  # Area Surrounding City Total
+                surrounding_city_population = population_by_oid[surrounding_city_oid]  # Surrounding Population
+                surrounding_population_total += surrounding_city_population  # Surrounding Population Total
+                surrounding_population_list.append(surrounding_city_population)  # List of surrounding population.
+
+        surrounding_population_list_sorted = sorted(surrounding_population_list)
+
+        print(" Surrounding City Count:" + str(surrounding_city_count))
+        print(" Surrounding Population List:" + str(surrounding_population_list_sorted))
+        print(" Surrounding Population:" + str(surrounding_population_total))
+        print(" Surrounding Area:" + str(surrounding_area))
 
         # If there area surrounding cities, populate surrounding city fields. If not, leave NULL <null>.
         row[8] = surrounding_city_count
@@ -0,0 +1,359 @@
+########################################################################################################################
+# File name: Run_State.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x (ArcGIS Pro)
+# Description:
+# Keeps track of the state of the outputs created by Calculate_CEQA_Requirements_and_Exemptions_Statewide.py in a
+# SQLite database so that only the results that are out of date need to be recalculated.
+# Every (county, requirement) result is stored with a fingerprint of its inputs: the version of each reference dataset
+# (path, size and modification time of its own files), the where clause or threshold used, and the county parcels.
+# When the fingerprint of the current inputs doesn't match the stored fingerprint, the result is stale.
+# The database also holds the run journal: each step of a run (a requirement, the exemptions, or the dev team tables for
+# a county) is recorded when it starts and when it completes (with the fingerprint of its inputs), so an interrupted run
+# can be restarted from the first step that didn't complete (or whose inputs have changed).
+########################################################################################################################
+
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+
+# Dataset versions are cached until clear_dataset_versions is called (at the start of each county, so a long running
+# worker picks up datasets that change between counties).
+dataset_versions = {}
+
+
+def clear_dataset_versions():
+    dataset_versions.clear()
+
+
+def read_varuint(data, position):
+    """ Returns a variable length unsigned integer (7 bits per byte) from a file geodatabase table and the position after it. """
+
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def read_field_descriptions(table, table_path):
+    """ Returns a list of (name, type, nullable) for each field in the header of a file geodatabase table (the contents
+        of a .gdbtable file). Raises a ValueError if the table isn't in the expected format (ArcGIS 10.x file geodatabase
+        tables).
+    """
+
+    if struct.unpack_from("<i", table, 0)[0] != 3:
+        raise ValueError("Unsupported file geodatabase table: " + table_path)
+
+    position = struct.unpack_from("<q", table, 32)[0] + 4
+    version, flags, number_of_fields = struct.unpack_from("<iih", table, position)
+    position += 10
+    fields = []
+    for field in range(number_of_fields):
+        name = table[position + 1:position + 1 + table[position] * 2].decode("utf-16-le")
+        position += 1 + table[position] * 2
+        position += 1 + table[position] * 2
+        field_type = table[position]
+        position += 1
+        if field_type == 4:
+            # String: max length, flags, default value.
+            nullable = bool(table[position + 4] & 1)
+            default_length, position = read_varuint(table, position + 5)
+            position += default_length
+        elif field_type in (0, 1, 2, 3, 5, 13, 14, 15, 16):
+            # Numbers and dates: width, flags, default value.
+            nullable = bool(table[position + 1] & 1)
+            position += 3 + table[position + 2]
+        elif field_type in (6, 8, 10, 11, 12):
+            # OBJECTID, binary, GUID, GlobalID, XML: width, flags.
+            nullable = bool(table[position + 1] & 1)
+            position += 2
+        elif field_type in (7, 9):
+            # Geometry and raster: flags, (raster column name), spatial reference, origins, scales and tolerances.
+            nullable = bool(table[position + 1] & 1)
+            position += 2
+            if field_type == 9:
+                position += 1 + table[position] * 2
+            position += 2 + struct.unpack_from("<H", table, position)[0]
+            geometry_flags = table[position]
+            position += 1
+            has_m = bool(geometry_flags & 2)
+            has_z = bool(geometry_flags & 4)
+            if field_type == 7 or geometry_flags:
+                position += 8 * (4 + 3 * has_m + 3 * has_z)
+            if field_type == 9:
+                position += 1
+            else:
+                # The extent, then optional doubles (e.g., the z and m range) before the spatial index grid sizes, which
+                # start with a 0 byte and the number of grid sizes (1 to 3) as an int32.
+                position += 32
+                while not (table[position] == 0 and 1 <= table[position + 1] <= 3 and table[position + 2:position + 5] == b"\0\0\0"):
+                    position += 8
+                position += 5 + 8 * table[position + 1]
+        else:
+            raise ValueError("Unexpected field type (" + str(field_type) + ") in " + table_path)
+        fields.append((name, field_type, nullable))
+
+    return fields
+
+
+def file_gdb_table_field_names(table_path):
+    """ Returns the names of the fields in a file geodatabase table (.gdbtable file), read from its header. """
+
+    with open(table_path, "rb") as table_file:
+        # The field descriptions are near the start of the file, but their size depends on the fields.
+        table = table_file.read(40)
+        field_descriptions_offset = struct.unpack_from("<q", table, 32)[0]
+        table_file.seek(field_descriptions_offset)
+        field_descriptions_size = struct.unpack("<i", table_file.read(4))[0]
+        table_file.seek(0)
+        table = table_file.read(field_descriptions_offset + 4 + field_descriptions_size)
+
+    return [name for name, field_type, nullable in read_field_descriptions(table, table_path)]
+
+
+def file_gdb_table_ids(gdb):
+    """ Returns a dictionary of table name (lower case): table id read from the system catalog (a00000001.gdbtable) of a
+        file geodatabase. The files of a table are named a<table id as 8 hex digits>.*
+        Raises a ValueError if the catalog isn't in the expected format (ArcGIS 10.x file geodatabase tables).
+    """
+
+    with open(os.path.join(gdb, "a00000001.gdbtablx"), "rb") as tablx_file:
+        tablx = tablx_file.read()
+    with open(os.path.join(gdb, "a00000001.gdbtable"), "rb") as table_file:
+        table = table_file.read()
+
+    magic, number_of_blocks, number_of_rows, offset_size = struct.unpack_from("<4i", tablx, 0)
+    # The offsets are followed by a trailer with a bitmap of the 1024 row blocks that are present if any are missing.
+    trailer = 16 + number_of_blocks * 1024 * offset_size
+    if magic != 3 or offset_size not in (4, 5, 6) or len(tablx) < trailer or (len(tablx) >= trailer + 4 and struct.unpack_from("<i", tablx, trailer)[0] != 0):
+        raise ValueError("Unsupported system catalog index in " + gdb)
+
+    # Field descriptions: (type, nullable) for each field.
+    fields = [(field_type, nullable) for name, field_type, nullable in read_field_descriptions(table, os.path.join(gdb, "a00000001.gdbtable"))]
+    if any(field_type not in (1, 4, 6) for field_type, nullable in fields):
+        raise ValueError("Unexpected field type in the system catalog of " + gdb)
+
+    number_of_nullable_fields = sum(1 for field_type, nullable in fields if nullable)
+
+    table_ids = {}
+    for row in range(number_of_rows):
+        offset = int.from_bytes(tablx[16 + row * offset_size:16 + (row + 1) * offset_size], "little")
+        if not offset:
+            # Deleted row.
+            continue
+        position = offset + 4
+        null_flags = table[position:position + (number_of_nullable_fields + 7) // 8]
+        position += len(null_flags)
+        nullable_index = 0
+        name = None
+        for field_type, nullable in fields:
+            if field_type == 6:
+                continue
+            if nullable:
+                is_null = null_flags[nullable_index // 8] & (1 << (nullable_index % 8))
+                nullable_index += 1
+                if is_null:
+                    continue
+            if field_type == 4:
+                length, position = read_varuint(table, position)
+                if name is None:
+                    name = table[position:position + length].decode("utf-8")
+                position += length
+            else:
+                position += 4
+        if name is not None:
+            table_ids[name.lower()] = row + 1
+
+    return table_ids
+
+
+def arcpy_field_names(dataset):
+    """ Returns the names of the fields in a dataset from arcpy.ListFields. """
+
+    import arcpy
+
+    return [field.name for field in arcpy.ListFields(dataset)]
+
+
+def dataset_files(dataset):
+    """ Returns the files that make up a dataset, without ArcGIS lock files (*.lock), which are created whenever a
+        dataset is opened. A file geodatabase table or feature class is made up of its own aXXXXXXXX.* files (the other
+        datasets in the geodatabase are left out). The table id read from the system catalog is checked: the
+        aXXXXXXXX.gdbtable file must exist and have the same fields as arcpy.ListFields reports for the dataset.
+        Raises a ValueError if a file geodatabase dataset isn't found in the geodatabase's system catalog or doesn't
+        pass the check.
+    """
+
+    dataset_lower = dataset.lower()
+
+    if ".gdb" in dataset_lower:
+        gdb = dataset[:dataset_lower.index(".gdb") + 4]
+        table_ids = file_gdb_table_ids(gdb)
+        name = os.path.basename(dataset.rstrip("\\/")).lower()
+        if name not in table_ids:
+            raise ValueError(name + " not found in the system catalog of " + gdb)
+        prefix = "a" + format(table_ids[name], "08x") + "."
+        table_path = os.path.join(gdb, prefix + "gdbtable")
+        if not os.path.exists(table_path):
+            raise ValueError(table_path + " (" + name + " in the system catalog) doesn't exist")
+        if [field.lower() for field in file_gdb_table_field_names(table_path)] != [field.lower() for field in arcpy_field_names(dataset)]:
+            raise ValueError("the fields in " + table_path + " (" + name + " in the system catalog) don't match the fields of the dataset")
+        files = [os.path.join(gdb, file_name) for file_name in os.listdir(gdb) if file_name.lower().startswith(prefix)]
+    elif os.path.isdir(dataset):
+        files = []
+        for root, dirs, file_names in os.walk(dataset):
+            files.extend(os.path.join(root, file_name) for file_name in file_names)
+    else:
+        # Include the sidecar files of a shapefile (.dbf, .prj, etc.) or raster (.aux.xml, .ovr, etc.).
+        folder = os.path.dirname(dataset)
+        base_name = os.path.splitext(os.path.basename(dataset))[0]
+        files = [os.path.join(folder, file_name) for file_name in os.listdir(folder) if file_name.startswith(base_name + ".")]
+
+    return [file_path for file_path in files if not file_path.lower().endswith(".lock")]
+
+
+def describe_version(dataset):
+    """ Returns a version string for a dataset based on its row count, extent and fields. Used for enterprise
+        geodatabase (.sde) datasets, which have no files, and file geodatabase datasets with a system catalog that
+        can't be read.
+    """
+
+    import arcpy
+
+    description = arcpy.Describe(dataset)
+    fields = [[field.name, field.type, field.length] for field in arcpy.ListFields(dataset)]
+    version = "count:" + str(arcpy.GetCount_management(dataset)[0]) + ";fields:" + fingerprint(fields)
+    if hasattr(description, "extent"):
+        version += ";extent:" + str(description.extent)
+
+    return version
+
+
+def dataset_version(dataset):
+    """ Returns a string identifying the current version of a dataset: the newest modification time and total size of
+        its files (see dataset_files). Opening a dataset (lock files) or editing another dataset in the same file
+        geodatabase doesn't change its version. If the files of a file geodatabase dataset can't be found (or don't
+        match the dataset), it's versioned by describe_version instead. Enterprise geodatabase (.sde) datasets have no files, so they are
+        versioned by their row count, extent and fields.
+    """
+
+    if dataset in dataset_versions:
+        return dataset_versions[dataset]
+
+    if ".sde" in dataset.lower():
+        version = describe_version(dataset)
+
+    else:
+        try:
+            files = dataset_files(dataset)
+        except (OSError, ValueError, struct.error, IndexError) as e:
+            print("Unable to find the files of " + dataset + " (" + str(e) + "). Versioning it by its row count, extent and fields.")
+            files = None
+
+        if files is None:
+            version = describe_version(dataset)
+        else:
+            modified_time = 0
+            size = 0
+            for file_path in files:
+                file_stat = os.stat(file_path)
+                modified_time = max(modified_time, file_stat.st_mtime)
+                size += file_stat.st_size
+
+            version = "modified:" + str(modified_time) + ";size:" + str(size)
+
+    dataset_versions[dataset] = dataset + "|" + version
+
+    return dataset_versions[dataset]
+
+
+def fingerprint(inputs):
+    """ Returns a fingerprint (hash) of a list of input values. """
+
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class RunState(object):
+    """ Stores the fingerprint of each (county, item) result, where item is a requirement id or another output
+        (e.g., "parcels" or an exemption), and the journal of the steps completed by each run.
+    """
+
+    def __init__(self, database):
+        self.connection = sqlite3.connect(database, timeout=300)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS fingerprints (county TEXT, item TEXT, fingerprint TEXT, updated TEXT, PRIMARY KEY (county, item))")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS journal (run_id TEXT, county TEXT, step TEXT, status TEXT, updated TEXT, fingerprint TEXT, PRIMARY KEY (run_id, county, step))")
+        # Journals created before the steps had fingerprints (their completed steps are run again).
+        if "fingerprint" not in [row[1] for row in self.connection.execute("PRAGMA table_info(journal)")]:
+            self.connection.execute("ALTER TABLE journal ADD COLUMN fingerprint TEXT")
+        self.connection.commit()
+
+    def get_fingerprints(self, county):
+        """ Returns a dictionary of item: fingerprint for a county. """
+
+        rows = self.connection.execute("SELECT item, fingerprint FROM fingerprints WHERE county = ?", (county,))
+
+        return dict(rows.fetchall())
+
+    def set_fingerprints(self, county, item_fingerprints):
+        """ Stores a dictionary of item: fingerprint for a county. """
+
+        updated = str(datetime.datetime.now())
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO fingerprints (county, item, fingerprint, updated) VALUES (?, ?, ?, ?)",
+            [(county, item, item_fingerprint, updated) for item, item_fingerprint in item_fingerprints.items()])
+        self.connection.commit()
+
+    def delete_fingerprints(self, county):
+        """ Deletes all of the stored fingerprints for a county (e.g., when the county parcels are recreated). """
+
+        self.connection.execute("DELETE FROM fingerprints WHERE county = ?", (county,))
+        self.connection.commit()
+
+    def get_journal(self, run_id, county, step_fingerprints=None):
+        """ Returns a dictionary of step: status ("started" or "completed") for a county in a run. If a dictionary of
+            step: fingerprint of the current inputs is given, the completed steps with a different fingerprint (their
+            inputs have changed since they completed) are left out, so they are run again.
+        """
+
+        rows = self.connection.execute("SELECT step, status, fingerprint FROM journal WHERE run_id = ? AND county = ?", (run_id, county))
+
+        journal = {}
+        for step, status, step_fingerprint in rows.fetchall():
+            if status == "completed" and step_fingerprints is not None and step_fingerprint != step_fingerprints.get(step):
+                continue
+            journal[step] = status
+
+        return journal
+
+    def set_journal(self, run_id, county, steps, status, step_fingerprints=None):
+        """ Records the status ("started" or "completed") of a list of steps for a county in a run, with the fingerprint
+            of each step's inputs (from a dictionary of step: fingerprint, if given).
+        """
+
+        step_fingerprints = step_fingerprints or {}
+        updated = str(datetime.datetime.now())
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO journal (run_id, county, step, status, updated, fingerprint) VALUES (?, ?, ?, ?, ?, ?)",
+            [(run_id, county, step, status, updated, step_fingerprints.get(step)) for step in steps])
+        self.connection.commit()
+
+    def delete_journal(self, run_id, county=None):
+        """ Deletes the journal for a county in a run, or for the whole run if no county is given. """
+
+        if county is None:
+            self.connection.execute("DELETE FROM journal WHERE run_id = ?", (run_id,))
+        else:
+            self.connection.execute("DELETE FROM journal WHERE run_id = ? AND county = ?", (run_id, county))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,206 @@
+########################################################################################################################
+# File name: Spatial_Engines.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x (ArcGIS Pro)
+# Description:
+# Array based engines used to calculate requirements for all of the parcels in a county at once.
+# The engines operate on NumPy arrays and shapely geometries only (no arcpy), which allows them to be run and
+# benchmarked outside of ArcGIS. Reading and writing feature classes is handled by Array_IO.py.
+# Requires shapely 2.x.
+########################################################################################################################
+
+import numpy as np
+import shapely
+
+# Number of points tested against the spatial index at a time. Limits the memory used on the largest counties.
+point_batch_size = 500000
+
+
+def points_in_polygon_layers(xy, polygon_layers):
+    """ Tests a set of points (e.g., parcel centroids) against several polygon layers through a single spatial index.
+        xy: (n, 2) array of point coordinates.
+        polygon_layers: list of arrays of shapely polygons (one array per reference layer).
+        Returns an (n_layers, n) boolean array which is True where the point falls in (or on the boundary of) a
+        polygon in that layer. This is the equivalent of SelectLayerByLocation "HAVE_THEIR_CENTER_IN".
+    """
+
+    hits = np.zeros((len(polygon_layers), len(xy)), dtype=bool)
+
+    # Explode multipart polygons so the bounding boxes in the index are as tight as possible.
+    parts = []
+    part_layer_index = []
+    for layer_index, polygons in enumerate(polygon_layers):
+        layer_parts = shapely.get_parts(np.asarray(polygons, dtype=object))
+        parts.append(layer_parts)
+        part_layer_index.append(np.full(len(layer_parts), layer_index, dtype=np.int32))
+
+    if not parts or sum(len(layer_parts) for layer_parts in parts) == 0:
+        return hits
+
+    parts = np.concatenate(parts)
+    part_layer_index = np.concatenate(part_layer_index)
+    tree = shapely.STRtree(parts)
+
+    for start in range(0, len(xy), point_batch_size):
+        points = shapely.points(xy[start:start + point_batch_size])
+        point_index, part_index = tree.query(points, predicate="intersects")
+        hits[part_layer_index[part_index], point_index + start] = True
+
+    return hits
+
+
+def points_in_polygons(xy, polygons):
+    """ Returns the index of the polygon each point (e.g., a parcel centroid) falls in, or -1 if it isn't in any.
+        If a point falls in more than one polygon, the lowest index is returned (the first polygon, like the "First"
+        merge rule of a SpatialJoin). This is the equivalent of SpatialJoin "HAVE_THEIR_CENTER_IN" (JOIN_ONE_TO_ONE).
+        Empty (None) polygons never match.
+    """
+
+    matches = np.full(len(xy), -1, dtype=np.int64)
+    polygons = np.asarray(polygons, dtype=object)
+    if len(xy) == 0 or len(polygons) == 0:
+        return matches
+
+    tree = shapely.STRtree(polygons)
+    first = np.full(len(xy), len(polygons), dtype=np.int64)
+
+    for start in range(0, len(xy), point_batch_size):
+        points = shapely.points(xy[start:start + point_batch_size])
+        point_index, polygon_index = tree.query(points, predicate="intersects")
+        np.minimum.at(first, point_index + start, polygon_index)
+
+    found = first < len(polygons)
+    matches[found] = first[found]
+
+    return matches
+
+
+def count_polygon_cells_in_window(polygon, window, window_column, window_row, column_range, row_range, x_origin, y_origin, cell_size):
+    """ Returns the number of data cells in a window that have their center inside the polygon. Only the part of the
+        window covered by the polygon's column_range and row_range (in raster cells) is tested.
+    """
+
+    cells = window[row_range[0] - window_row:row_range[1] - window_row, column_range[0] - window_column:column_range[1] - window_column]
+    rows, columns = np.nonzero(cells)
+    if len(rows) == 0:
+        return 0
+
+    x = x_origin + (column_range[0] + columns + 0.5) * cell_size
+    y = y_origin - (row_range[0] + rows + 0.5) * cell_size
+
+    return int(np.count_nonzero(shapely.contains_xy(polygon, x, y)))
+
+
+def count_raster_cells_in_polygons(polygons, read_window, x_origin, y_origin, cell_size, raster_columns, raster_rows, window_size=4096, halo_size=None):
+    """ Counts the number of raster cells with data that have their center inside each polygon. This is the "COUNT"
+        calculated by Zonal Statistics (zones are rasterized at the cell centers of the value raster).
+        The raster is read in windows of at most window_size x window_size cells, so memory use is bounded regardless
+        of the size of the raster or the county. The raster is split into tiles of (window_size - halo_size) cells and
+        each polygon belongs to the tile its top left corner falls in. Each tile reads one window covering all of its
+        polygons: the tile plus a halo of up to halo_size cells to the right and below for the polygons that extend past
+        the tile. Polygons larger than halo_size cells (wide or tall) are read on their own, in blocks.
+        halo_size defaults to window_size / 8 (e.g., 512 m for a window of 4096 cells of 1 m).
+        read_window(column, row, columns, rows) must return a boolean array (True = cell has data), where row 0 is the
+        top of the raster. The polygons must be in the raster's coordinate system. None (empty) polygons get a count of 0.
+    """
+
+    counts = np.zeros(len(polygons), dtype=np.int64)
+    if len(polygons) == 0:
+        return counts
+
+    if halo_size is None:
+        halo_size = window_size // 8
+    tile_size = window_size - halo_size
+
+    # Cell ranges covered by each polygon's bounding box (end exclusive), limited to the raster.
+    bounds = shapely.bounds(polygons)
+    with np.errstate(invalid="ignore"):
+        column_min = np.clip(np.floor((bounds[:, 0] - x_origin) / cell_size), 0, raster_columns)
+        column_max = np.clip(np.ceil((bounds[:, 2] - x_origin) / cell_size), 0, raster_columns)
+        row_min = np.clip(np.floor((y_origin - bounds[:, 3]) / cell_size), 0, raster_rows)
+        row_max = np.clip(np.ceil((y_origin - bounds[:, 1]) / cell_size), 0, raster_rows)
+
+    in_raster = ~np.isnan(bounds).any(axis=1)
+    in_raster[in_raster] &= (column_max[in_raster] > column_min[in_raster]) & (row_max[in_raster] > row_min[in_raster])
+
+    column_min = np.nan_to_num(column_min).astype(np.int64)
+    column_max = np.nan_to_num(column_max).astype(np.int64)
+    row_min = np.nan_to_num(row_min).astype(np.int64)
+    row_max = np.nan_to_num(row_max).astype(np.int64)
+
+    oversized = in_raster & ((column_max - column_min > halo_size) | (row_max - row_min > halo_size))
+    polygon_indexes = np.nonzero(in_raster & ~oversized)[0]
+
+    # Group the polygons by tile. A polygon starts in its tile and is no larger than the halo, so the window for a tile
+    # (from the top left of its polygons to the bottom right of its polygons) is at most window_size x window_size.
+    tiles_per_row = raster_columns // tile_size + 1
+    tile_keys = (row_min[polygon_indexes] // tile_size) * tiles_per_row + column_min[polygon_indexes] // tile_size
+    order = np.argsort(tile_keys, kind="stable")
+    polygon_indexes = polygon_indexes[order]
+    tile_keys = tile_keys[order]
+    group_starts = np.concatenate([[0], np.nonzero(np.diff(tile_keys))[0] + 1, [len(tile_keys)]]) if len(tile_keys) else np.array([0])
+
+    for group_start, group_end in zip(group_starts[:-1], group_starts[1:]):
+        group = polygon_indexes[group_start:group_end]
+        shapely.prepare(polygons[group])
+
+        window_column = column_min[group].min()
+        window_row = row_min[group].min()
+        window = read_window(window_column, window_row, column_max[group].max() - window_column, row_max[group].max() - window_row)
+        for i in group:
+            counts[i] = count_polygon_cells_in_window(polygons[i], window, window_column, window_row, (column_min[i], column_max[i]), (row_min[i], row_max[i]), x_origin, y_origin, cell_size)
+
+    # Read each oversized polygon on its own, in blocks of at most window_size x window_size cells.
+    for i in np.nonzero(oversized)[0]:
+        shapely.prepare(polygons[i])
+        for block_row in range(row_min[i], row_max[i], window_size):
+            block_rows = min(window_size, row_max[i] - block_row)
+            for block_column in range(column_min[i], column_max[i], window_size):
+                block_columns = min(window_size, column_max[i] - block_column)
+                window = read_window(block_column, block_row, block_columns, block_rows)
+                counts[i] += count_polygon_cells_in_window(polygons[i], window, block_column, block_row, (block_column, block_column + block_columns), (block_row, block_row + block_rows), x_origin, y_origin, cell_size)
+
+    return counts
+
+
+def build_polygon_index(polygon_layers):
+    """ Builds one spatial index over several polygon layers for polygons_intersect_index.
+        The polygons are exploded into single parts (so the bounding boxes in the index are as tight as possible) and
+        prepared (so each part can be tested against many parcels quickly).
+        Returns the index, the parts, the layer index of each part, and the number of layers.
+    """
+
+    parts = []
+    part_layer_index = []
+    for layer_index, polygons in enumerate(polygon_layers):
+        layer_parts = shapely.get_parts(np.asarray(polygons, dtype=object))
+        parts.append(layer_parts)
+        part_layer_index.append(np.full(len(layer_parts), layer_index, dtype=np.int32))
+
+    parts = np.concatenate(parts) if parts else np.array([], dtype=object)
+    part_layer_index = np.concatenate(part_layer_index) if part_layer_index else np.array([], dtype=np.int32)
+    shapely.prepare(parts)
+
+    return shapely.STRtree(parts), parts, part_layer_index, len(polygon_layers)
+
+
+def polygons_intersect_index(polygons, polygon_index):
+    """ Tests a batch of polygons (e.g., parcels) against every layer in a polygon index built by build_polygon_index.
+        Returns an (n_layers, n) boolean array which is True where the polygon intersects a polygon in that layer.
+        This is the equivalent of SelectLayerByLocation "INTERSECT".
+    """
+
+    tree, parts, part_layer_index, number_of_layers = polygon_index
+    hits = np.zeros((number_of_layers, len(polygons)), dtype=bool)
+    if len(parts) == 0 or len(polygons) == 0:
+        return hits
+
+    # Bounding box prefilter: pairs of polygons and reference parts with intersecting bounding boxes.
+    polygon_index, part_index = tree.query(polygons)
+
+    # Exact test, using the prepared reference parts.
+    intersects = shapely.intersects(parts[part_index], polygons[polygon_index])
+    hits[part_layer_index[part_index[intersects]], polygon_index[intersects]] = True
+
+    return hits
@@ -0,0 +1,298 @@
+########################################################################################################################
+# File name: Task_Queue.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x (ArcGIS Pro)
+# Description:
+# File based task queue (a SQLite database on a shared path) used by Calculate_CEQA_Requirements_and_Exemptions_Statewide.py
+# to split a run into work units (a requirement for a county, the exemptions for a county, the dev team tables for a
+# county, and the statewide tables) that any number of worker processes, on any number of machines, can claim.
+# - A task can only be claimed once all of the tasks it depends on have completed.
+# - Only one task in an exclusive group runs at a time (e.g., the tasks that write to the same county feature class, or
+#   the tasks that write to the dev team geodatabase).
+# - A claimed task is leased to its worker for lease_seconds. The worker renews the lease while the task runs (see
+#   Heartbeat). If the worker dies, the lease expires and the task is claimed again by another worker.
+# - A task that fails (or whose lease expires) is retried up to max_attempts times, after retry_delay_seconds times the
+#   number of attempts. A task that has used all of its attempts is failed, and the tasks that depend on it are skipped.
+# Every change to the queue is made in an immediate transaction (the database is locked for writing), so two workers
+# can't claim the same task. The default rollback journal is used rather than WAL, which doesn't work on network shares.
+# Leases are compared with the clock of the machine claiming the task, so the clocks of the worker machines should be
+# synchronized (to well within lease_seconds).
+# To see the state of the tasks in a queue: python Task_Queue.py status <database> [run id]
+# To retry the failed and skipped tasks of a run: python Task_Queue.py retry <database> <run id>
+########################################################################################################################
+
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+default_lease_seconds = 900
+default_max_attempts = 3
+default_retry_delay_seconds = 60
+
+
+def worker_name():
+    """ Returns a name for this worker process that is unique across machines (host name and process id). """
+
+    return socket.gethostname() + ":" + str(os.getpid())
+
+
+class TaskQueue(object):
+    """ Queue of tasks, each identified by the run it belongs to and its name. """
+
+    def __init__(self, database):
+        # Transactions are started explicitly (BEGIN IMMEDIATE) so claims are atomic.
+        self.connection = sqlite3.connect(database, timeout=300, isolation_level=None)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT, name TEXT, kind TEXT, payload TEXT, "
+                                "exclusive_group TEXT, priority INTEGER, status TEXT, attempts INTEGER, max_attempts INTEGER, available_after REAL, "
+                                "lease_owner TEXT, lease_expires REAL, heartbeat REAL, result TEXT, error TEXT, UNIQUE (run_id, name))")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS dependencies (task_id INTEGER, depends_on INTEGER, PRIMARY KEY (task_id, depends_on))")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, run_id)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS dependencies_depends_on ON dependencies (depends_on)")
+
+    def transaction(self):
+        """ Starts an immediate transaction (locks the database for writing). """
+
+        self.connection.execute("BEGIN IMMEDIATE")
+
+    def add_run(self, run_id, tasks, max_attempts=default_max_attempts):
+        """ Adds the tasks of a run to the queue. tasks is a list of dictionaries with a name, kind, payload (any JSON
+            serializable value), and optionally depends_on (a list of task names in the run), exclusive_group, and
+            priority (lower numbers are claimed first). Tasks are added in one transaction.
+            If the run is already in the queue (e.g., the run was restarted), nothing is added and False is returned.
+        """
+
+        self.transaction()
+        try:
+            if self.connection.execute("SELECT 1 FROM tasks WHERE run_id = ? LIMIT 1", (run_id,)).fetchone():
+                self.connection.execute("ROLLBACK")
+                return False
+
+            task_ids = {}
+            for task in tasks:
+                cursor = self.connection.execute(
+                    "INSERT INTO tasks (run_id, name, kind, payload, exclusive_group, priority, status, attempts, max_attempts, available_after) VALUES (?, ?, ?, ?, ?, ?, 'pending', 0, ?, 0)",
+                    (run_id, task["name"], task["kind"], json.dumps(task.get("payload")), task.get("exclusive_group"), task.get("priority", 0), max_attempts))
+                task_ids[task["name"]] = cursor.lastrowid
+
+            self.connection.executemany("INSERT INTO dependencies (task_id, depends_on) VALUES (?, ?)",
+                                        [(task_ids[task["name"]], task_ids[depends_on]) for task in tasks for depends_on in task.get("depends_on", [])])
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+
+        return True
+
+    def skip_dependents(self, task_id):
+        """ Skips the pending tasks that depend (directly or indirectly) on a failed task. Called in a transaction. """
+
+        failed_name = self.connection.execute("SELECT name FROM tasks WHERE id = ?", (task_id,)).fetchone()[0]
+        to_check = [task_id]
+        while to_check:
+            dependent_ids = [row[0] for row in self.connection.execute(
+                "SELECT d.task_id FROM dependencies d JOIN tasks t ON t.id = d.task_id WHERE d.depends_on = ? AND t.status = 'pending'", (to_check.pop(),))]
+            for dependent_id in dependent_ids:
+                self.connection.execute("UPDATE tasks SET status = 'skipped', error = ? WHERE id = ?", ("Depends on a task that failed: " + failed_name, dependent_id))
+            to_check.extend(dependent_ids)
+
+    def retry_or_fail(self, task_id, error, now):
+        """ Returns a task to the queue to be retried, or fails it (and skips its dependents) if it has used all of its
+            attempts. Called in a transaction. Returns the new status ("pending" or "failed").
+        """
+
+        attempts, max_attempts = self.connection.execute("SELECT attempts, max_attempts FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        status = "pending" if attempts < max_attempts else "failed"
+        self.connection.execute("UPDATE tasks SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, available_after = ? WHERE id = ?",
+                                (status, error, now + default_retry_delay_seconds * attempts, task_id))
+        if status == "failed":
+            self.skip_dependents(task_id)
+
+        return status
+
+    def claim(self, worker, lease_seconds=default_lease_seconds, run_id=None):
+        """ Claims the next task that is ready to run (in the run, or in any run if run_id is None) for a worker. Tasks
+            whose lease has expired are returned to the queue (or failed) first.
+            Returns the task as a dictionary (id, run_id, name, kind, payload, attempts), or None if no task is ready.
+        """
+
+        now = time.time()
+        self.transaction()
+        try:
+            expired = self.connection.execute("SELECT id, lease_owner FROM tasks WHERE status = 'running' AND lease_expires < ?", (now,)).fetchall()
+            for task_id, lease_owner in expired:
+                self.retry_or_fail(task_id, "The lease expired (the worker " + str(lease_owner) + " stopped sending heartbeats).", now)
+
+            row = self.connection.execute(
+                "SELECT t.id, t.run_id, t.name, t.kind, t.payload, t.attempts FROM tasks t "
+                "WHERE t.status = 'pending' AND t.available_after <= ? AND (? IS NULL OR t.run_id = ?) "
+                "AND NOT EXISTS (SELECT 1 FROM dependencies d JOIN tasks p ON p.id = d.depends_on WHERE d.task_id = t.id AND p.status != 'completed') "
+                "AND (t.exclusive_group IS NULL OR NOT EXISTS (SELECT 1 FROM tasks r WHERE r.status = 'running' AND r.exclusive_group = t.exclusive_group)) "
+                "ORDER BY t.priority, t.id LIMIT 1", (now, run_id, run_id)).fetchone()
+
+            if row:
+                self.connection.execute("UPDATE tasks SET status = 'running', attempts = attempts + 1, lease_owner = ?, lease_expires = ?, heartbeat = ? WHERE id = ?",
+                                        (worker, now + lease_seconds, now, row[0]))
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+
+        if not row:
+            return None
+
+        task_id, task_run_id, name, kind, payload, attempts = row
+
+        return {"id": task_id, "run_id": task_run_id, "name": name, "kind": kind, "payload": json.loads(payload), "attempts": attempts + 1}
+
+    def heartbeat(self, task_id, worker, lease_seconds=default_lease_seconds):
+        """ Renews a worker's lease on a task. Returns False if the worker no longer holds the lease. """
+
+        now = time.time()
+        cursor = self.connection.execute("UPDATE tasks SET lease_expires = ?, heartbeat = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                                         (now + lease_seconds, now, task_id, worker))
+
+        return cursor.rowcount == 1
+
+    def complete(self, task_id, worker, result=None):
+        """ Marks a task as completed with a result (any JSON serializable value). Returns False (and the task isn't
+            changed) if the worker no longer holds the lease, e.g., it expired and the task was claimed again.
+        """
+
+        cursor = self.connection.execute("UPDATE tasks SET status = 'completed', result = ?, error = NULL, lease_owner = NULL, lease_expires = NULL WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                                         (json.dumps(result), task_id, worker))
+
+        return cursor.rowcount == 1
+
+    def fail(self, task_id, worker, error):
+        """ Records a failed attempt at a task. The task is retried if it has attempts left, otherwise it's failed and
+            the tasks that depend on it are skipped. Returns the new status ("pending" or "failed"), or None if the
+            worker no longer holds the lease.
+        """
+
+        self.transaction()
+        try:
+            if self.connection.execute("SELECT 1 FROM tasks WHERE id = ? AND status = 'running' AND lease_owner = ?", (task_id, worker)).fetchone():
+                status = self.retry_or_fail(task_id, error, time.time())
+            else:
+                status = None
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+
+        return status
+
+    def results(self, run_id, kind):
+        """ Returns the results of the completed tasks of a kind in a run. """
+
+        rows = self.connection.execute("SELECT result FROM tasks WHERE run_id = ? AND kind = ? AND status = 'completed'", (run_id, kind))
+
+        return [json.loads(row[0]) for row in rows]
+
+    def counts(self, run_id=None):
+        """ Returns a dictionary of status: number of tasks (in the run, or in every run if run_id is None). """
+
+        rows = self.connection.execute("SELECT status, COUNT(*) FROM tasks WHERE (? IS NULL OR run_id = ?) GROUP BY status", (run_id, run_id))
+
+        return dict(rows.fetchall())
+
+    def is_finished(self, run_id=None):
+        """ Returns True if no task is pending or running (in the run, or in every run if run_id is None). """
+
+        counts = self.counts(run_id)
+
+        return not counts.get("pending") and not counts.get("running")
+
+    def unsuccessful_tasks(self, run_id=None):
+        """ Returns (run id, name, status, attempts, error) for each failed or skipped task. """
+
+        rows = self.connection.execute("SELECT run_id, name, status, attempts, error FROM tasks WHERE status IN ('failed', 'skipped') AND (? IS NULL OR run_id = ?) ORDER BY id",
+                                       (run_id, run_id))
+
+        return rows.fetchall()
+
+    def retry(self, run_id):
+        """ Returns the failed and skipped tasks of a run to the queue with all of their attempts. """
+
+        self.transaction()
+        self.connection.execute("UPDATE tasks SET status = 'pending', attempts = 0, available_after = 0 WHERE run_id = ? AND status IN ('failed', 'skipped')", (run_id,))
+        self.connection.execute("COMMIT")
+
+    def run_ids(self):
+        """ Returns the ids of the runs in the queue. """
+
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT run_id FROM tasks ORDER BY run_id")]
+
+    def delete_run(self, run_id):
+        """ Deletes the tasks of a run (e.g., once every task has completed). """
+
+        self.transaction()
+        self.connection.execute("DELETE FROM dependencies WHERE task_id IN (SELECT id FROM tasks WHERE run_id = ?)", (run_id,))
+        self.connection.execute("DELETE FROM tasks WHERE run_id = ?", (run_id,))
+        self.connection.execute("COMMIT")
+
+    def close(self):
+        self.connection.close()
+
+
+class Heartbeat(object):
+    """ Context manager that renews a worker's lease on a task from a background thread (with its own connection to the
+        queue) every lease_seconds / 4 while the task runs. lost is set to True if the lease is lost.
+    """
+
+    def __init__(self, database, task_id, worker, lease_seconds=default_lease_seconds):
+        self.database = database
+        self.task_id = task_id
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        queue = TaskQueue(self.database)
+        try:
+            while not self.stopped.wait(self.lease_seconds / 4.0):
+                try:
+                    if not queue.heartbeat(self.task_id, self.worker, self.lease_seconds):
+                        self.lost = True
+                        return
+                except sqlite3.Error as e:
+                    # The database can be locked (or the share unavailable) for a while. Try again on the next beat.
+                    print("Heartbeat failed: " + str(e))
+        finally:
+            queue.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stopped.set()
+        self.thread.join()
+        return False
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ("status", "retry") or (sys.argv[1] == "retry" and len(sys.argv) < 4):
+        print("Usage: python Task_Queue.py status <database> [run id]")
+        print("       python Task_Queue.py retry <database> <run id>")
+        sys.exit(1)
+
+    task_queue = TaskQueue(sys.argv[2])
+    selected_run_id = sys.argv[3] if len(sys.argv) > 3 else None
+
+    if sys.argv[1] == "retry":
+        task_queue.retry(selected_run_id)
+
+    print("Tasks: " + str(task_queue.counts(selected_run_id)))
+    for unsuccessful_run_id, task_name, task_status, task_attempts, task_error in task_queue.unsuccessful_tasks(selected_run_id):
+        print("\n" + unsuccessful_run_id + " " + task_name + ": " + task_status + " after " + str(task_attempts) + " attempt(s)\n" + str(task_error))
+
+    task_queue.close()
@@ -0,0 +1,212 @@
+########################################################################################################################
+# File name: Zoning_Overlay.py
+# Author: Mike Gough
+# Date created: 10/17/2026
+# Python Version: 3.x (ArcGIS Pro)
+# Description:
+# Tiled overlay engine used by Prepare_Parcels.join_zoning_designations in place of a single statewide
+# TabulateIntersection. Calculates the percent of each parcel covered by each zoning designation (code).
+# Parcels are split into square tiles (by the center of their bounding box, so each parcel is in exactly one tile) and
+# each tile is sent to a process pool along with the zoning polygons that overlap it. Tiles are sent as the parcel
+# batches are read (in this process), with at most max_pending_tiles_per_worker tiles per worker waiting at a time, so
+# only a few batches are held in memory. In the workers:
+# - Parcels that intersect a single zoning polygon and are covered by it are given 100% without an intersection.
+# - Otherwise the area of the intersection with each zoning polygon is summed by code (overlapping polygons with the
+#   same code are unioned first so the overlap isn't counted twice).
+# - Parcels with no area (e.g., slivers collapsed to a line) get no results, whether or not they are covered.
+# - Only (parcel, code, percent) results with a percent (rounded to 1 decimal) >= threshold are sent back.
+# The engine operates on shapely geometries only (no arcpy). Requires shapely 2.x.
+########################################################################################################################
+
+import multiprocessing
+import queue
+import numpy as np
+import shapely
+
+# Width and height of a tile (in the units of the coordinate system, meters for Teale Albers).
+default_tile_size = 10000
+
+# Number of tiles per worker that can be sent to the pool and not yet returned. More keeps the workers busy when tiles
+# take different amounts of time; fewer holds less parcel and zoning WKB in memory.
+max_pending_tiles_per_worker = 2
+
+
+def tile_keys(geometries, tile_size):
+    """ Returns the tile (column, row) each geometry falls in, based on the center of its bounding box. """
+
+    bounds = shapely.bounds(geometries)
+    x = (bounds[:, 0] + bounds[:, 2]) / 2
+    y = (bounds[:, 1] + bounds[:, 3]) / 2
+
+    return np.floor(x / tile_size).astype(np.int64), np.floor(y / tile_size).astype(np.int64)
+
+
+def split_into_tiles(parcel_ids, parcel_geometries, tile_size):
+    """ Yields (parcel ids, parcel geometries) for each tile. Empty (None) geometries are left out. """
+
+    has_geometry = ~shapely.is_missing(parcel_geometries)
+    parcel_ids = parcel_ids[has_geometry]
+    parcel_geometries = parcel_geometries[has_geometry]
+    if len(parcel_ids) == 0:
+        return
+
+    columns, rows = tile_keys(parcel_geometries, tile_size)
+    order = np.lexsort((columns, rows))
+    keys = np.stack([columns[order], rows[order]], axis=1)
+    starts = np.concatenate([[0], np.nonzero((np.diff(keys, axis=0) != 0).any(axis=1))[0] + 1, [len(order)]])
+
+    for start, end in zip(starts[:-1], starts[1:]):
+        tile = order[start:end]
+        yield parcel_ids[tile], parcel_geometries[tile]
+
+
+def intersection_areas(parcels, zoning):
+    """ Returns the area of the intersection of each pair of geometries. Pairs that fail (invalid geometries) are
+        repaired with make_valid and tried again.
+    """
+
+    try:
+        return shapely.area(shapely.intersection(parcels, zoning))
+    except shapely.errors.GEOSException:
+        areas = np.zeros(len(parcels))
+        for i in range(len(parcels)):
+            try:
+                areas[i] = shapely.intersection(parcels[i], zoning[i]).area
+            except shapely.errors.GEOSException:
+                areas[i] = shapely.intersection(shapely.make_valid(parcels[i]), shapely.make_valid(zoning[i])).area
+        return areas
+
+
+def tabulate_tile(parcel_ids, parcels, zoning, zoning_codes, threshold):
+    """ Returns the parcel ids, codes, and percents (rounded to 1 decimal) for a tile where the percent of the parcel
+        covered by the code is >= threshold. zoning and zoning_codes are the zoning polygons that overlap the tile.
+    """
+
+    empty = (np.array([], dtype=parcel_ids.dtype), np.array([], dtype=object), np.array([], dtype=np.float64))
+    if len(parcels) == 0 or len(zoning) == 0:
+        return empty
+
+    shapely.prepare(zoning)
+    parcel_areas = shapely.area(parcels)
+
+    tree = shapely.STRtree(zoning)
+    parcel_index, zoning_index = tree.query(parcels, predicate="intersects")
+    has_area = parcel_areas[parcel_index] > 0
+    parcel_index = parcel_index[has_area]
+    zoning_index = zoning_index[has_area]
+    if len(parcel_index) == 0:
+        return empty
+
+    # Fast path: parcels that intersect a single zoning polygon and are covered by it.
+    pairs_per_parcel = np.bincount(parcel_index, minlength=len(parcels))
+    single = pairs_per_parcel[parcel_index] == 1
+    covered = np.zeros(len(parcel_index), dtype=bool)
+    covered[single] = shapely.covers(zoning[zoning_index[single]], parcels[parcel_index[single]])
+
+    percents = np.full(len(parcel_index), 100.0)
+    overlay = ~covered
+    if overlay.any():
+        percents[overlay] = intersection_areas(parcels[parcel_index[overlay]], zoning[zoning_index[overlay]]) / parcel_areas[parcel_index[overlay]] * 100
+
+    # Sum by parcel and code.
+    codes = zoning_codes[zoning_index]
+    results = {}
+    repeated = {}
+    for pair, (i, code) in enumerate(zip(parcel_index.tolist(), codes.tolist())):
+        key = (i, code)
+        if key in results:
+            repeated.setdefault(key, [results[key][1]]).append(pair)
+            results[key] = [results[key][0] + percents[pair], pair]
+        else:
+            results[key] = [percents[pair], pair]
+
+    # Overlapping zoning polygons with the same code: percent of the union of the intersections.
+    for key, pairs in repeated.items():
+        pieces = shapely.intersection(parcels[parcel_index[pairs]], zoning[zoning_index[pairs]])
+        results[key][0] = shapely.union_all(pieces).area / parcel_areas[key[0]] * 100
+
+    result_ids = []
+    result_codes = []
+    result_percents = []
+    for (i, code), (percent, pair) in results.items():
+        percent = round(percent, 1)
+        if percent >= threshold:
+            result_ids.append(parcel_ids[i])
+            result_codes.append(code)
+            result_percents.append(percent)
+
+    return np.array(result_ids, dtype=parcel_ids.dtype), np.array(result_codes, dtype=object), np.array(result_percents, dtype=np.float64)
+
+
+def tabulate_tile_worker(args):
+    """ Pool worker for tabulate_tile. Geometries are passed as WKB. """
+
+    parcel_ids, parcel_wkbs, zoning_wkbs, zoning_codes, threshold = args
+
+    return tabulate_tile(parcel_ids, shapely.from_wkb(parcel_wkbs), shapely.from_wkb(zoning_wkbs), zoning_codes, threshold)
+
+
+def tile_tasks(parcel_batches, zoning_tree, zoning_wkbs, zoning_codes, threshold, tile_size):
+    """ Yields the pool arguments for each tile in each batch of (parcel ids, parcel geometries). """
+
+    for parcel_ids, parcel_geometries in parcel_batches:
+        for tile_parcel_ids, tile_parcels in split_into_tiles(np.asarray(parcel_ids), np.asarray(parcel_geometries, dtype=object), tile_size):
+            tile_bounds = shapely.total_bounds(tile_parcels)
+            tile_zoning = zoning_tree.query(shapely.box(*tile_bounds))
+            yield tile_parcel_ids, shapely.to_wkb(tile_parcels), zoning_wkbs[tile_zoning], zoning_codes[tile_zoning], threshold
+
+
+def overlay(parcel_batches, zoning, zoning_codes, threshold, tile_size=default_tile_size, workers=None):
+    """ Tabulates the percent of each parcel covered by each zoning code, for each batch of (parcel ids, parcel
+        geometries) in parcel_batches (e.g., Array_IO.iter_geometries). The zoning polygons must be in the same
+        coordinate system as the parcels.
+        Yields (parcel ids, codes, percents) arrays for each tile as it finishes (in no particular order), with only the
+        results where the percent (rounded to 1 decimal) is >= threshold.
+        If workers is 1, the tiles are processed in this process.
+    """
+
+    zoning = np.asarray(zoning, dtype=object)
+    zoning_codes = np.asarray(zoning_codes, dtype=object)
+    has_geometry = ~shapely.is_missing(zoning)
+    zoning = zoning[has_geometry]
+    zoning_codes = zoning_codes[has_geometry]
+
+    zoning_tree = shapely.STRtree(zoning)
+    zoning_wkbs = shapely.to_wkb(zoning)
+    tasks = tile_tasks(parcel_batches, zoning_tree, zoning_wkbs, zoning_codes, threshold, tile_size)
+
+    if workers == 1:
+        for task in tasks:
+            yield tabulate_tile_worker(task)
+        return
+
+    # The tasks (and the parcel batches, e.g. a cursor) are read here, in this process's thread, and only sent to the pool
+    # while fewer than max_pending tiles are waiting. Results come back through finished as the tiles finish.
+    workers = workers or multiprocessing.cpu_count()
+    max_pending = workers * max_pending_tiles_per_worker
+    finished = queue.Queue()
+    pending = 0
+
+    def next_result():
+        result = finished.get()
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        for task in tasks:
+            while pending >= max_pending:
+                yield next_result()
+                pending -= 1
+            pool.apply_async(tabulate_tile_worker, (task,), callback=finished.put, error_callback=finished.put)
+            pending += 1
+            while not finished.empty():
+                yield next_result()
+                pending -= 1
+        while pending:
+            yield next_result()
+            pending -= 1
+    finally:
+        pool.close()
+        pool.join()
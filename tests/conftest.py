@@ -0,0 +1,27 @@
+import importlib
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+# The scripts are modules in the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules that import arcpy. They're imported with a stand-in arcpy module (no geoprocessing is done by the functions
+# tested here) and removed again after each test.
+arcpy_modules = ["Calculate_CEQA_Requirements_and_Exemptions_Statewide", "Array_IO", "Reference_Cache", "Parquet_Export"]
+
+
+@pytest.fixture
+def statewide(monkeypatch, tmp_path):
+    monkeypatch.setitem(sys.modules, "arcpy", mock.MagicMock())
+    monkeypatch.setitem(sys.modules, "arcpy.sa", mock.MagicMock())
+    monkeypatch.setenv("APPDATA", str(tmp_path))
+    for name in arcpy_modules:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+
+    yield importlib.import_module("Calculate_CEQA_Requirements_and_Exemptions_Statewide")
+
+    for name in arcpy_modules:
+        sys.modules.pop(name, None)
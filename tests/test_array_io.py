@@ -0,0 +1,38 @@
+import importlib
+import sys
+from unittest import mock
+
+import pytest
+
+
+@pytest.fixture
+def array_io(monkeypatch):
+    monkeypatch.setitem(sys.modules, "arcpy", mock.MagicMock())
+    monkeypatch.delitem(sys.modules, "Array_IO", raising=False)
+
+    yield importlib.import_module("Array_IO")
+
+    sys.modules.pop("Array_IO", None)
+
+
+def test_datum_transformation_is_only_set_while_the_cursor_is_created(array_io, monkeypatch):
+    spatial_reference = mock.MagicMock()
+    spatial_reference.gcs.name = "GCS_WGS_1984"
+    spatial_reference.projectionName = "Lambert_Conformal_Conic"
+    spatial_reference.type = "Projected"
+    array_io.arcpy.Describe.return_value.spatialReference = spatial_reference
+
+    environment = []
+    array_io.arcpy.EnvManager.side_effect = lambda **settings: mock.MagicMock(__enter__=lambda self: environment.append(settings))
+    array_io.arcpy.da.SearchCursor.return_value.__enter__.return_value = iter([])
+
+    output_spatial_reference = object()
+    read_spatial_reference, source, transformation = array_io.projection_for_reading("zoning", output_spatial_reference)
+    assert (read_spatial_reference, source, transformation) == (output_spatial_reference, None, "WGS_1984_(ITRF00)_To_NAD_1983")
+    assert environment == []
+
+    list(array_io.iter_projected_geometries("zoning", output_spatial_reference))
+    assert environment == [{"geographicTransformations": "WGS_1984_(ITRF00)_To_NAD_1983"}]
+
+    # Nothing is left in the environment for other cursors and tools.
+    assert not isinstance(array_io.arcpy.env.geographicTransformations, str)
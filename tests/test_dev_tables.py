@@ -0,0 +1,30 @@
+def test_file_gdb_statewide_tables_are_only_merged_when_asked(statewide, monkeypatch):
+    monkeypatch.setattr(statewide, "output_gdb_dev_team", "Outputs_for_DevTeam.gdb")
+    monkeypatch.setattr(statewide, "dev_team_output_format", "gdb")
+    monkeypatch.setattr(statewide, "merge_statewide_dev_tables", False)
+
+    created = []
+    monkeypatch.setattr(statewide, "create_statewide_dev_table", created.append)
+
+    statewide.update_statewide_dev_tables(True)
+    assert created == []
+
+    # On demand (python Calculate_CEQA_Requirements_and_Exemptions_Statewide.py statewide_tables).
+    statewide.update_statewide_dev_tables(True, merge=True)
+    assert created == ["requirements", "exemptions"]
+
+    monkeypatch.setattr(statewide, "merge_statewide_dev_tables", True)
+    statewide.update_statewide_dev_tables(True)
+    assert created == ["requirements", "exemptions"] * 2
+
+
+def test_statewide_views_are_created_without_merging(statewide, monkeypatch):
+    monkeypatch.setattr(statewide, "output_gdb_dev_team", "Outputs_for_DevTeam.geodatabase")
+    monkeypatch.setattr(statewide, "dev_team_output_format", "gdb")
+    monkeypatch.setattr(statewide, "merge_statewide_dev_tables", False)
+
+    created = []
+    monkeypatch.setattr(statewide, "create_statewide_dev_table", created.append)
+
+    statewide.update_statewide_dev_tables(True)
+    assert created == ["requirements", "exemptions"]
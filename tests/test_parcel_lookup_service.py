@@ -0,0 +1,50 @@
+import numpy as np
+import shapely
+
+import Parcel_Lookup_Service
+
+
+def write_test_index(index_folder, counties):
+    index_writer = Parcel_Lookup_Service.IndexWriter(str(index_folder), ["within_city_limits_2_3"])
+    for county_name, parcel_ids, fips_apns, geometries in counties:
+        index_writer.add_county(county_name, parcel_ids, fips_apns, geometries, np.ones((len(parcel_ids), 1), dtype=np.int8))
+    index_writer.finish()
+
+    return Parcel_Lookup_Service.ParcelIndex(str(index_folder))
+
+
+def test_duplicate_and_empty_keys_are_indexed_once(tmp_path):
+    # Two counties, written one at a time. fips_apn "1" is on three parcels (in both counties). Two parcels have no
+    # fips_apn.
+    boxes = [shapely.box(i * 10, 0, i * 10 + 10, 10) for i in range(6)]
+    parcel_index = write_test_index(tmp_path / "index", [
+        ("ALAMEDA", ["1_1", "1_2", "no_fips_apn__3"], ["1", "1", None], boxes[:3]),
+        ("BUTTE", ["1_4", "2_5", "no_fips_apn__6"], ["1", "2", ""], boxes[3:]),
+    ])
+
+    assert len(parcel_index) == 6
+    assert [parcel["county_name"] for parcel in parcel_index.lookup_apn("1")] == ["ALAMEDA", "ALAMEDA", "BUTTE"]
+    assert parcel_index.rows_for_key("fips_apn", "1") == [0, 1, 3]
+    assert parcel_index.rows_for_key("fips_apn", "2") == [4]
+    assert parcel_index.rows_for_key("fips_apn", "3") == []
+    assert parcel_index.rows_for_key("fips_apn", "") == []
+    assert parcel_index.rows_for_key("parcel_id", "2_5") == [4]
+
+    # Each unique key is in the table once.
+    assert (np.asarray(parcel_index.fips_apn_table) != -1).sum() == 2
+    assert (np.asarray(parcel_index.parcel_id_table) != -1).sum() == 6
+
+    # The geometries of the second county follow the first.
+    assert parcel_index.geometry(4).equals(boxes[4])
+    assert parcel_index.rows_at_point(45, 5) == [4]
+    assert parcel_index.record(4)["within_city_limits_2_3"] == 1
+
+
+def test_many_parcels_with_the_same_key(tmp_path):
+    # Lookups don't probe through the duplicates (they used to all be in one cluster of the table).
+    boxes = [shapely.box(i, 0, i + 1, 1) for i in range(5000)]
+    parcel_index = write_test_index(tmp_path / "index", [("ALAMEDA", [str(i) for i in range(5000)], ["1"] * 4999 + ["2"], boxes)])
+
+    assert parcel_index.rows_for_key("fips_apn", "1") == list(range(4999))
+    assert parcel_index.rows_for_key("fips_apn", "2") == [4999]
+    assert len(parcel_index.fips_apn_table) == 16
@@ -0,0 +1,132 @@
+import importlib
+import multiprocessing
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+# Modules that import arcpy. They're imported with a stand-in arcpy module and removed again after each test.
+arcpy_modules = ["Prepare_Parcels", "Array_IO"]
+
+
+@pytest.fixture
+def prepare_parcels(monkeypatch, tmp_path):
+    monkeypatch.setitem(sys.modules, "arcpy", mock.MagicMock())
+    monkeypatch.setenv("APPDATA", str(tmp_path))
+    for name in arcpy_modules:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+
+    yield importlib.import_module("Prepare_Parcels")
+
+    for name in arcpy_modules:
+        sys.modules.pop(name, None)
+
+
+def test_put_to_writer_stops_waiting_when_the_writer_has_stopped(prepare_parcels, monkeypatch):
+    monkeypatch.setattr(prepare_parcels, "separate_into_counties_queue_timeout", 0.1)
+
+    # A writer that stops without reading its queue (e.g., it failed on the first buffer).
+    queue = multiprocessing.Queue(maxsize=1)
+    writer = multiprocessing.Process(target=os._exit, args=(1,))
+    writer.start()
+    writer.join()
+
+    queue.put(("ALAMEDA", []))
+    with pytest.raises(RuntimeError, match="stopped"):
+        prepare_parcels.put_to_writer(queue, writer, None)
+
+
+def test_dedupe_compares_whole_parcels_not_parts(prepare_parcels, monkeypatch):
+    import shapely
+
+    monkeypatch.setattr(prepare_parcels, "profile_stages", False)
+    monkeypatch.setattr(prepare_parcels.Array_IO, "projection_for_reading", lambda input_fc, output_crs: (None, None, None))
+
+    square = shapely.box(0, 0, 10, 10)
+    other_square = shapely.box(20, 0, 30, 10)
+    source_rows = [
+        # Parcel A: two parts.
+        ("A", "ALAMEDA", shapely.to_wkb(shapely.multipolygons([square, other_square]))),
+        # Parcel B: a different parcel with a part that is the same as one of A's parts. It's kept.
+        ("B", "ALAMEDA", shapely.to_wkb(square)),
+        # Parcel C: the same geometry as A (with the parts in the other order). It's deleted.
+        ("C", "BUTTE", shapely.to_wkb(shapely.multipolygons([other_square, square]))),
+        # Parcel D: no geometry. It's kept.
+        ("D", "BUTTE", None),
+    ]
+
+    fields = []
+    for name in ("fips_apn", "county_name"):
+        field = mock.MagicMock(editable=True, type="String")
+        field.name = name
+        fields.append(field)
+    prepare_parcels.arcpy.ListFields.return_value = fields
+
+    inserted = []
+    search_cursor = prepare_parcels.arcpy.da.SearchCursor.return_value.__enter__.return_value
+    search_cursor.__iter__.side_effect = lambda: iter(source_rows)
+    insert_cursor = prepare_parcels.arcpy.da.InsertCursor.return_value.__enter__.return_value
+    insert_cursor.insertRow.side_effect = inserted.append
+
+    prepare_parcels.project_explode_and_dedupe()
+
+    assert [row[0] for row in inserted] == ["A", "A", "B", "D"]
+
+
+def test_separate_into_counties_creates_each_county_before_writing_it(prepare_parcels, monkeypatch):
+    monkeypatch.setattr(prepare_parcels, "profile_stages", False)
+    monkeypatch.setattr(prepare_parcels, "separate_into_counties_buffer_size", 2)
+
+    fields = []
+    for name in ("fips_apn", "county_name"):
+        field = mock.MagicMock(editable=True, type="String")
+        field.name = name
+        fields.append(field)
+    prepare_parcels.arcpy.ListFields.return_value = fields
+
+    source_rows = [("1", "Alameda County", None), ("2", "Butte County", None), ("3", "Alameda County", None), ("4", None, None), ("5", "Butte County", None)]
+    search_cursor = prepare_parcels.arcpy.da.SearchCursor.return_value.__enter__.return_value
+    search_cursor.__iter__.side_effect = lambda: iter(source_rows)
+
+    events = []
+    monkeypatch.setattr(prepare_parcels, "create_county_parcels_fc", lambda input_fc, county_name: events.append(("create", county_name)))
+    monkeypatch.setattr(prepare_parcels, "write_county_rows", lambda county_name, fields, rows: events.append(("write", county_name, [row[0] for row in rows])))
+
+    prepare_parcels.separate_into_counties("parcels")
+
+    # The statewide parcels are read once.
+    assert prepare_parcels.arcpy.da.SearchCursor.call_count == 1
+    assert events == [
+        ("create", "Alameda County"),
+        ("create", "Butte County"),
+        ("write", "Alameda County", ["1", "3"]),
+        ("write", "Butte County", ["2", "5"]),
+    ]
+
+
+def test_add_and_calculate_fields_writes_each_batch_by_oid_range(prepare_parcels, monkeypatch):
+    import numpy as np
+
+    monkeypatch.setattr(prepare_parcels, "profile_stages", False)
+    prepare_parcels.arcpy.ListFields.return_value = []
+    prepare_parcels.arcpy.Describe.return_value.OIDFieldName = "OBJECTID"
+
+    batches = [
+        {"OID@": np.array([1, 2]), "fips_apn": np.array(["06001_A", None], dtype=object), "SHAPE@XY": np.array([[-150000.0, -50000.0], [np.nan, np.nan]])},
+        {"OID@": np.array([3]), "fips_apn": np.array([""]), "SHAPE@XY": np.array([[0.0, 0.0]])},
+    ]
+    monkeypatch.setattr(prepare_parcels.Array_IO, "iter_columns", lambda input_table, fields, batch_size: iter(batches))
+
+    writes = []
+    monkeypatch.setattr(prepare_parcels.Array_IO, "write_columns", lambda input_table, oids, columns, where_clause: writes.append((oids.tolist(), columns, where_clause)))
+
+    prepare_parcels.add_and_calculate_fields()
+
+    assert [(oids, where_clause) for oids, columns, where_clause in writes] == [([1, 2], "OBJECTID >= 1 AND OBJECTID <= 2"), ([3], "OBJECTID >= 3 AND OBJECTID <= 3")]
+    assert writes[0][1][prepare_parcels.cbi_parcel_id_field].tolist() == ["06001_A_1", "no_fips_apn__2"]
+    assert writes[1][1][prepare_parcels.cbi_parcel_id_field].tolist() == ["no_fips_apn__3"]
+    assert writes[0][1]["state_name"].tolist() == ["California", "California"]
+
+    latitudes = writes[0][1]["latitude"]
+    assert 30 < latitudes[0] < 42 and np.isnan(latitudes[1])
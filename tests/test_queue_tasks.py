@@ -0,0 +1,28 @@
+def tasks_by_name(tasks):
+    return dict((task["name"], task) for task in tasks)
+
+
+def test_one_task_per_engine_and_per_other_requirement(statewide, monkeypatch):
+    monkeypatch.setattr(statewide, "use_centroid_engine", True)
+    monkeypatch.setattr(statewide, "use_intersect_engine", True)
+    monkeypatch.setattr(statewide, "short_circuit_requirements_enabled", False)
+
+    tasks = tasks_by_name(statewide.queue_tasks(["ALAMEDA_Parcels"], ["2.1", "8.5", "2.5", "9.4", "9.5"], False, None))
+
+    assert tasks["alameda/requirements:centroid"]["payload"]["requirement_ids"] == ["2.1", "2.5"]
+    assert tasks["alameda/requirements:intersect"]["payload"]["requirement_ids"] == ["8.5", "9.4"]
+    assert tasks["alameda/requirement:9.5"]["payload"]["requirement_ids"] == ["9.5"]
+    assert not tasks["alameda/requirement:9.5"].get("depends_on")
+    assert [task for task in tasks if task.startswith("alameda/requirement")] == ["alameda/requirements:centroid", "alameda/requirements:intersect", "alameda/requirement:9.5"]
+    assert tasks["alameda/exemptions"]["depends_on"] == ["alameda/requirements:centroid", "alameda/requirements:intersect", "alameda/requirement:9.5"]
+
+
+def test_short_circuited_requirements_wait_for_the_other_requirements(statewide, monkeypatch):
+    monkeypatch.setattr(statewide, "use_centroid_engine", True)
+    monkeypatch.setattr(statewide, "short_circuit_requirements_enabled", True)
+
+    tasks = tasks_by_name(statewide.queue_tasks(["ALAMEDA_Parcels", "BUTTE_Parcels"], ["9.5", "2.1", "2.5", "9.2"], False, None))
+
+    assert tasks["alameda/requirement:9.5"]["depends_on"] == ["alameda/requirements:centroid", "alameda/requirement:9.2"]
+    assert tasks["butte/requirement:9.5"]["depends_on"] == ["butte/requirements:centroid", "butte/requirement:9.2"]
+    assert "alameda/requirement:9.5" in tasks["alameda/exemptions"]["depends_on"]
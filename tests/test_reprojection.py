@@ -0,0 +1,71 @@
+import numpy as np
+import shapely
+
+import Reprojection
+
+# NAD83 longitude, latitude and NAD83 / California Albers (EPSG:3310, the same as NAD_1983_California_Teale_Albers)
+# x, y computed with PROJ.
+control_points = [
+    [-120.0, 37.0, 0.0, -112982.4091],
+    [-124.2, 41.9, -349028.4111, 439074.7112],
+    [-114.6, 32.7, 506810.3291, -575814.4714],
+    [-118.2437, 34.0522, 162138.8622, -438874.8286],
+    [-122.4194, 37.7749, -212792.0081, -24127.7073],
+    [-121.4944, 38.5816, -130031.4262, 63858.1944],
+]
+
+# WGS 1984 longitude, latitude and NAD83 longitude, latitude computed with a PROJ Helmert pipeline with the
+# WGS_1984_(ITRF00)_To_NAD_1983 parameters (coordinate frame).
+wgs84_to_nad83_points = [
+    [-120.0, 37.0, -119.9999872467, 36.9999949525],
+    [-124.2, 41.9, -124.1999859560, 41.8999949012],
+    [-114.6, 32.7, -114.5999885563, 32.6999951117],
+    [-122.4194, 37.7749, -122.4193867848, 37.7748950558],
+]
+
+
+def test_control_points():
+    longitude, latitude, x, y = np.array(control_points).T
+
+    projected_x, projected_y = Reprojection.geographic_to_teale_albers(longitude, latitude)
+    assert np.abs(projected_x - x).max() < 0.001
+    assert np.abs(projected_y - y).max() < 0.001
+
+    unprojected_longitude, unprojected_latitude = Reprojection.teale_albers_to_geographic(x, y)
+    assert np.abs(unprojected_longitude - longitude).max() < 1e-8
+    assert np.abs(unprojected_latitude - latitude).max() < 1e-8
+
+
+def test_round_trip_across_california():
+    longitude, latitude = np.meshgrid(np.linspace(-124.5, -114.0, 50), np.linspace(32.5, 42.0, 50))
+    x, y = Reprojection.geographic_to_teale_albers(longitude.ravel(), latitude.ravel())
+    round_trip_longitude, round_trip_latitude = Reprojection.teale_albers_to_geographic(x, y)
+
+    # 1e-9 degrees is about 0.1 mm.
+    assert np.abs(round_trip_longitude - longitude.ravel()).max() < 1e-9
+    assert np.abs(round_trip_latitude - latitude.ravel()).max() < 1e-9
+
+
+def test_wgs84_to_nad83_shift():
+    wgs84_longitude, wgs84_latitude, nad83_longitude, nad83_latitude = np.array(wgs84_to_nad83_points).T
+
+    longitude, latitude = Reprojection.wgs84_to_nad83(wgs84_longitude, wgs84_latitude)
+    assert np.abs(longitude - nad83_longitude).max() < 1e-9
+    assert np.abs(latitude - nad83_latitude).max() < 1e-9
+
+    # In California the shift is about 1 to 1.5 meters (NAD83 is to the east and south of WGS 1984).
+    x, y = Reprojection.geographic_to_teale_albers(longitude, latitude)
+    wgs84_x, wgs84_y = Reprojection.geographic_to_teale_albers(wgs84_longitude, wgs84_latitude)
+    shift = np.hypot(x - wgs84_x, y - wgs84_y)
+    assert (shift > 1.0).all() and (shift < 1.5).all()
+
+
+def test_wgs84_geometries_are_shifted_to_nad83():
+    wgs84_longitude, wgs84_latitude, nad83_longitude, nad83_latitude = np.array(wgs84_to_nad83_points).T
+    points = shapely.points(np.stack([wgs84_longitude, wgs84_latitude], axis=1))
+
+    projected = Reprojection.project_geometries(points, ["geographic", "WGS84", 1.0])
+
+    x, y = Reprojection.geographic_to_teale_albers(nad83_longitude, nad83_latitude)
+    assert np.abs(shapely.get_x(projected) - x).max() < 0.001
+    assert np.abs(shapely.get_y(projected) - y).max() < 0.001
@@ -0,0 +1,188 @@
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from unittest import mock
+
+import pytest
+
+import Run_State
+
+# File geodatabases written with GDAL (OpenFileGDB driver) by make_test_gdbs (see the end of this file). The edited
+# geodatabase has the same layers with 2 more features each, so editing a layer is copying its files from there.
+data_folder = os.path.join(os.path.dirname(__file__), "data")
+test_gdb = os.path.join(data_folder, "Parcels_Prepared_By_County.gdb")
+edited_test_gdb = os.path.join(data_folder, "Parcels_Prepared_By_County_Edited.gdb")
+test_layer_fields = ["SHAPE", "OBJECTID", "value"]
+
+
+def current_version(dataset):
+    Run_State.clear_dataset_versions()
+    return Run_State.dataset_version(dataset)
+
+
+def table_files_prefix(gdb, layer):
+    return "a" + format(Run_State.file_gdb_table_ids(gdb)[layer.lower()], "08x") + "."
+
+
+def edit_layer(gdb, layer):
+    prefix = table_files_prefix(edited_test_gdb, layer)
+    for file_name in os.listdir(edited_test_gdb):
+        if file_name.startswith(prefix):
+            shutil.copyfile(os.path.join(edited_test_gdb, file_name), os.path.join(gdb, file_name))
+
+
+def list_fields(names):
+    fields = []
+    for name in names:
+        field = mock.MagicMock(type="Integer", length=4)
+        field.name = name
+        fields.append(field)
+    return fields
+
+
+@pytest.fixture
+def arcpy(monkeypatch):
+    arcpy = mock.MagicMock()
+    arcpy.ListFields.side_effect = lambda dataset: list_fields(test_layer_fields)
+    arcpy.GetCount_management.return_value = ["3"]
+    monkeypatch.setitem(sys.modules, "arcpy", arcpy)
+    return arcpy
+
+
+@pytest.fixture
+def gdb(tmp_path, arcpy):
+    gdb = str(tmp_path / "Parcels_Prepared_By_County.gdb")
+    shutil.copytree(test_gdb, gdb)
+    return gdb
+
+
+def test_table_ids_are_read_from_the_system_catalog(gdb):
+    table_ids = Run_State.file_gdb_table_ids(gdb)
+
+    assert table_ids["gdb_systemcatalog"] == 1
+    alameda_files = Run_State.dataset_files(os.path.join(gdb, "ALAMEDA_Parcels"))
+    assert alameda_files
+    assert all(os.path.basename(file_path).startswith("a" + format(table_ids["alameda_parcels"], "08x") + ".") for file_path in alameda_files)
+
+
+def test_opening_the_gdb_does_not_change_the_version(gdb):
+    dataset = os.path.join(gdb, "ALAMEDA_Parcels")
+    version = current_version(dataset)
+
+    # Lock files created by ArcGIS when the geodatabase and the feature class are opened.
+    table_id = format(Run_State.file_gdb_table_ids(gdb)["alameda_parcels"], "08x")
+    time.sleep(0.01)
+    for lock_file in ["_gdb.WORKSTATION.1234.5678.sr.lock", "a" + table_id + ".WORKSTATION.1234.5678.sr.lock", "a" + table_id + ".WORKSTATION.1234.5678.rd.lock"]:
+        with open(os.path.join(gdb, lock_file), "w") as f:
+            f.write("lock")
+
+    assert current_version(dataset) == version
+
+
+def test_editing_another_dataset_does_not_change_the_version(gdb):
+    dataset = os.path.join(gdb, "ALAMEDA_Parcels")
+    version = current_version(dataset)
+
+    time.sleep(0.01)
+    edit_layer(gdb, "BUTTE_Parcels")
+
+    assert current_version(dataset) == version
+
+
+def test_editing_the_dataset_changes_the_version(gdb):
+    dataset = os.path.join(gdb, "ALAMEDA_Parcels")
+    version = current_version(dataset)
+
+    time.sleep(0.01)
+    edit_layer(gdb, "ALAMEDA_Parcels")
+
+    assert current_version(dataset) != version
+
+
+def test_field_names_are_read_from_the_table_header(gdb):
+    table_path = os.path.join(gdb, table_files_prefix(gdb, "ALAMEDA_Parcels") + "gdbtable")
+
+    assert Run_State.file_gdb_table_field_names(table_path) == test_layer_fields
+    assert Run_State.file_gdb_table_field_names(os.path.join(gdb, "a00000001.gdbtable")) == ["ID", "Name", "FileFormat"]
+
+
+def test_table_id_that_does_not_match_the_fields_falls_back_to_describe(gdb, arcpy):
+    dataset = os.path.join(gdb, "ALAMEDA_Parcels")
+    assert current_version(dataset).split("|")[1].startswith("modified:")
+
+    # E.g., the catalog was misread and the id belongs to another table.
+    arcpy.ListFields.side_effect = lambda dataset: list_fields(["OBJECTID", "Shape", "fips_apn", "Shape_Length", "Shape_Area"])
+
+    assert current_version(dataset).split("|")[1].startswith("count:3;")
+
+
+def test_table_id_without_a_table_file_falls_back_to_describe(gdb):
+    dataset = os.path.join(gdb, "ALAMEDA_Parcels")
+    os.remove(os.path.join(gdb, table_files_prefix(gdb, "ALAMEDA_Parcels") + "gdbtable"))
+
+    assert current_version(dataset).split("|")[1].startswith("count:3;")
+
+
+def test_shapefile_lock_files_are_ignored(tmp_path):
+    for extension in [".shp", ".shx", ".dbf", ".shp.WORKSTATION.1234.5678.sr.lock"]:
+        (tmp_path / ("zoning" + extension)).write_text("x")
+
+    files = Run_State.dataset_files(str(tmp_path / "zoning.shp"))
+
+    assert sorted(os.path.basename(file_path) for file_path in files) == ["zoning.dbf", "zoning.shp", "zoning.shx"]
+
+
+def test_completed_steps_are_skipped_only_while_their_inputs_are_the_same(tmp_path):
+    run_state = Run_State.RunState(str(tmp_path / "run_state.sqlite"))
+    step_fingerprints = {"requirement:9.3": "a", "requirement:2.1": "b", "exemptions": "c"}
+    run_state.set_journal("run", "alameda", ["requirement:9.3", "requirement:2.1"], "completed", step_fingerprints)
+    run_state.set_journal("run", "alameda", ["exemptions"], "started", step_fingerprints)
+
+    assert run_state.get_journal("run", "alameda", step_fingerprints) == {"requirement:9.3": "completed", "requirement:2.1": "completed", "exemptions": "started"}
+
+    # A new version of the wildfire hazard dataset: 9.3 is run again (and the exemptions, which were interrupted).
+    changed_fingerprints = dict(step_fingerprints, **{"requirement:9.3": "d", "exemptions": "e"})
+    assert run_state.get_journal("run", "alameda", changed_fingerprints) == {"requirement:2.1": "completed", "exemptions": "started"}
+    run_state.close()
+
+
+def test_steps_journaled_before_fingerprints_are_run_again(tmp_path):
+    database = str(tmp_path / "run_state.sqlite")
+    connection = sqlite3.connect(database)
+    connection.execute("CREATE TABLE journal (run_id TEXT, county TEXT, step TEXT, status TEXT, updated TEXT, PRIMARY KEY (run_id, county, step))")
+    connection.execute("INSERT INTO journal VALUES ('run', 'alameda', 'requirement:9.3', 'completed', '')")
+    connection.commit()
+    connection.close()
+
+    run_state = Run_State.RunState(database)
+    assert run_state.get_journal("run", "alameda", {"requirement:9.3": "a"}) == {}
+    run_state.close()
+
+
+def make_test_gdbs():
+    """ Writes the test geodatabases in tests/data (requires pyogrio). Run with: python tests/test_run_state.py """
+
+    import numpy as np
+    import pyogrio.raw
+    import shapely
+
+    def write_layer(gdb, layer, number_of_features, append=False):
+        geometries = shapely.to_wkb(np.array([shapely.box(i, 0, i + 1, 1) for i in range(number_of_features)]))
+        pyogrio.raw.write(gdb, geometries, [np.arange(number_of_features, dtype=np.int32)], ["value"], layer=layer, driver="OpenFileGDB",
+                          geometry_type="Polygon", crs="EPSG:3310", append=append)
+
+    os.makedirs(data_folder, exist_ok=True)
+    for gdb in (test_gdb, edited_test_gdb):
+        if os.path.exists(gdb):
+            shutil.rmtree(gdb)
+        write_layer(gdb, "ALAMEDA_Parcels", 3)
+        write_layer(gdb, "BUTTE_Parcels", 3)
+
+    write_layer(edited_test_gdb, "ALAMEDA_Parcels", 2, append=True)
+    write_layer(edited_test_gdb, "BUTTE_Parcels", 2, append=True)
+
+
+if __name__ == "__main__":
+    make_test_gdbs()
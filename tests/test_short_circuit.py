@@ -0,0 +1,90 @@
+import numpy as np
+
+
+def test_fresh_county_short_circuits_9_5_using_requirements_calculated_in_the_same_run(statewide, monkeypatch):
+    # A county processed for the first time: none of the requirement fields exist yet.
+    monkeypatch.setattr(statewide, "output_parcels_fc", "Outputs_for_DataBasin.gdb/ALAMEDA_Parcels", raising=False)
+    monkeypatch.setattr(statewide, "existing_output_fields", ["OBJECTID", "Shape", "fips_apn"], raising=False)
+    monkeypatch.setattr(statewide, "short_circuit_requirements_enabled", True)
+    monkeypatch.setattr(statewide, "use_centroid_engine", True)
+
+    # 9.5 is used by 21159.24 (with 2.1) and 21155.1 (with 2.5). Parcel 1 has 2.1 = 0 and 2.5 = 0, so both exemptions
+    # are already 0 and 9.5 can't change them. Parcels 2 and 3 still need 9.5.
+    oids = np.array([1, 2, 3])
+    calculated_values = {"2.1": np.array([0, 1, 0], dtype=np.int16), "2.5": np.array([0, 0, 1], dtype=np.int16)}
+    table = {}
+
+    def calc_centroid_requirements(self, output_parcels_fc, fields_to_calc):
+        for requirement_id, field in fields_to_calc.items():
+            table[field] = calculated_values[requirement_id]
+
+    # Fields added for the requirements with no data in this county are <null>.
+    def read_columns(input_table, fields, where_clause=None):
+        return oids, dict((field, table.get(field, np.full(len(oids), statewide.Exemption_Engine.null_value, dtype=np.int16))) for field in fields)
+
+    calculated_oids = {}
+
+    def do_command(self, requirement_id, *args):
+        calculated_oids[requirement_id] = self.oids_to_calculate
+
+    monkeypatch.setattr(statewide.RequirementFunctions, "calc_centroid_requirements", calc_centroid_requirements)
+    monkeypatch.setattr(statewide.RequirementFunctions, "do_command", do_command)
+    monkeypatch.setattr(statewide.Array_IO, "read_columns", read_columns)
+
+    statewide.calculate_requirements(["9.5", "2.1", "2.5"])
+
+    assert statewide.requirements["2.1"] in statewide.existing_output_fields
+    assert calculated_oids["9.5"].tolist() == [2, 3]
+
+
+def test_skipping_9_5_never_changes_an_exemption(statewide):
+    # Every combination of 1/0/<null> for the other requirements in the exemptions that use 9.5 (3^n parcels, in chunks
+    # of the last 10 requirements). Wherever requirements_that_can_change_exemptions says 9.5 isn't needed, every
+    # exemption (and the count) must be the same whether 9.5 is 1, 0, or <null>.
+    Exemption_Engine = statewide.Exemption_Engine
+    requirement_id = "9.5"
+
+    other_ids = []
+    for requirement_ids in statewide.exemptions.values():
+        groups = [requirement if type(requirement) == list else [requirement] for requirement in requirement_ids]
+        if any(requirement_id in group for group in groups):
+            for group in groups:
+                for or_id in group:
+                    if or_id != requirement_id and or_id not in other_ids:
+                        other_ids.append(or_id)
+    assert len(other_ids) <= 16
+
+    plan = Exemption_Engine.compile_exemption_plan(statewide.exemptions, statewide.requirements)
+    plan_fields = Exemption_Engine.plan_requirement_fields(plan)
+    tri_state = np.array([1, 0, Exemption_Engine.null_value], dtype=np.int16)
+
+    chunk_digits = min(10, len(other_ids))
+    chunk_size = 3 ** chunk_digits
+    digits = (np.arange(chunk_size)[:, None] // 3 ** np.arange(chunk_digits)) % 3
+    skipped = 0
+
+    for chunk in range(3 ** (len(other_ids) - chunk_digits)):
+        high_digits = (chunk // 3 ** np.arange(len(other_ids) - chunk_digits)) % 3
+        columns = dict((field, np.ones(chunk_size, dtype=np.int16)) for field in plan_fields)
+        for i, or_id in enumerate(other_ids):
+            if i < chunk_digits:
+                columns[statewide.requirements[or_id]] = tri_state[digits[:, i]]
+            else:
+                columns[statewide.requirements[or_id]] = np.full(chunk_size, tri_state[high_digits[i - chunk_digits]], dtype=np.int16)
+
+        known_columns = dict((statewide.requirements[or_id], columns[statewide.requirements[or_id]]) for or_id in other_ids)
+        needed = Exemption_Engine.requirements_that_can_change_exemptions(statewide.exemptions, statewide.requirements, requirement_id, known_columns, chunk_size)
+        skip = ~needed
+        skipped += int(skip.sum())
+
+        results = []
+        for value in tri_state:
+            columns[statewide.requirements[requirement_id]] = np.full(chunk_size, value, dtype=np.int16)
+            results.append(Exemption_Engine.evaluate_exemption_plan(plan, columns))
+
+        for field in results[0]:
+            assert np.array_equal(results[0][field][skip], results[1][field][skip]), field
+            assert np.array_equal(results[0][field][skip], results[2][field][skip]), field
+
+    # The test only means something if 9.5 is skipped for some parcels.
+    assert skipped > 0
@@ -0,0 +1,46 @@
+import numpy as np
+import shapely
+
+import Spatial_Engines
+
+
+def brute_force_counts(polygons, raster, x_origin, y_origin, cell_size):
+    rows, columns = np.nonzero(raster)
+    x = x_origin + (columns + 0.5) * cell_size
+    y = y_origin - (rows + 0.5) * cell_size
+    return np.array([0 if polygon is None else int(np.count_nonzero(shapely.contains_xy(polygon, x, y))) for polygon in polygons])
+
+
+def test_count_raster_cells_reads_one_window_per_tile():
+    random = np.random.RandomState(0)
+    raster = random.uniform(0, 1, (600, 800)) > 0.5
+    x_origin, y_origin, cell_size = 1000.0, 5000.0, 1.0
+
+    # 40 x 40 cell parcels on a grid, plus parcels larger than the halo, an empty parcel and one outside the raster.
+    parcels = [shapely.box(x_origin + x, y_origin - y - 40, x_origin + x + 40, y_origin - y) for x in range(0, 760, 40) for y in range(0, 560, 40)]
+    parcels += [shapely.box(x_origin + 10, y_origin - 590, x_origin + 700, y_origin - 400), None, shapely.box(0, 0, 10, 10)]
+    parcels = np.array(parcels, dtype=object)
+
+    window_size = 512
+    reads = []
+
+    def read_window(column, row, columns, rows):
+        reads.append((columns, rows))
+        return raster[row:row + rows, column:column + columns]
+
+    counts = Spatial_Engines.count_raster_cells_in_polygons(parcels, read_window, x_origin, y_origin, cell_size, raster.shape[1], raster.shape[0], window_size)
+
+    assert np.array_equal(counts, brute_force_counts(parcels, raster, x_origin, y_origin, cell_size))
+    assert max(max(read) for read in reads) <= window_size
+
+    # Tiles of 448 cells (window_size - window_size / 8): 2 x 2, plus 2 x 1 blocks for the large parcel.
+    assert len(reads) <= 2 * 2 + 2
+
+
+def test_count_raster_cells_with_only_oversized_polygons():
+    raster = np.ones((100, 100), dtype=bool)
+    parcels = np.array([shapely.box(0, 0, 90, 90), None], dtype=object)
+
+    counts = Spatial_Engines.count_raster_cells_in_polygons(parcels, lambda column, row, columns, rows: raster[row:row + rows, column:column + columns], 0.0, 100.0, 1.0, 100, 100, 64)
+
+    assert counts.tolist() == [8100, 0]
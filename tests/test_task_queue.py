@@ -0,0 +1,129 @@
+import pytest
+
+import Task_Queue
+
+
+@pytest.fixture
+def task_queue(tmp_path, monkeypatch):
+    # Failed tasks can be claimed again right away.
+    monkeypatch.setattr(Task_Queue, "default_retry_delay_seconds", 0)
+    task_queue = Task_Queue.TaskQueue(str(tmp_path / "task_queue.sqlite"))
+    yield task_queue
+    task_queue.close()
+
+
+def statuses(task_queue):
+    return dict((name, status) for name, status in task_queue.connection.execute("SELECT name, status FROM tasks"))
+
+
+def test_only_one_task_in_an_exclusive_group_runs_at_a_time(task_queue):
+    task_queue.add_run("run", [
+        {"name": "alameda/requirements:centroid", "kind": "requirement", "exclusive_group": "county:alameda"},
+        {"name": "alameda/requirement:9.5", "kind": "requirement", "exclusive_group": "county:alameda"},
+        {"name": "butte/requirement:9.5", "kind": "requirement", "exclusive_group": "county:butte"},
+    ])
+
+    first = task_queue.claim("worker 1")
+    second = task_queue.claim("worker 2")
+    assert first["name"] == "alameda/requirements:centroid"
+    assert second["name"] == "butte/requirement:9.5"
+    assert task_queue.claim("worker 3") is None
+
+    assert task_queue.complete(first["id"], "worker 1")
+    assert task_queue.claim("worker 3")["name"] == "alameda/requirement:9.5"
+
+
+def test_a_task_is_not_claimed_until_its_dependencies_complete(task_queue):
+    task_queue.add_run("run", [
+        {"name": "alameda/requirements:centroid", "kind": "requirement"},
+        {"name": "alameda/requirement:9.3", "kind": "requirement"},
+        {"name": "alameda/exemptions", "kind": "exemptions", "depends_on": ["alameda/requirements:centroid", "alameda/requirement:9.3"]},
+    ])
+
+    first = task_queue.claim("worker 1")
+    second = task_queue.claim("worker 2")
+    assert task_queue.claim("worker 3") is None
+
+    task_queue.complete(first["id"], "worker 1")
+    assert task_queue.claim("worker 3") is None
+
+    task_queue.complete(second["id"], "worker 2")
+    assert task_queue.claim("worker 3")["name"] == "alameda/exemptions"
+
+
+def test_an_expired_lease_returns_the_task_to_the_queue(task_queue):
+    task_queue.add_run("run", [{"name": "alameda/exemptions", "kind": "exemptions"}])
+
+    # The worker stops sending heartbeats (the lease has already expired).
+    task = task_queue.claim("worker 1", lease_seconds=-1)
+    assert statuses(task_queue) == {"alameda/exemptions": "running"}
+
+    claimed_again = task_queue.claim("worker 2")
+    assert claimed_again["id"] == task["id"]
+    assert claimed_again["attempts"] == 2
+    assert task_queue.connection.execute("SELECT lease_owner FROM tasks").fetchone()[0] == "worker 2"
+
+
+def test_a_worker_that_lost_its_lease_cannot_complete_the_task(task_queue):
+    task_queue.add_run("run", [{"name": "alameda/exemptions", "kind": "exemptions"}])
+
+    task = task_queue.claim("worker 1", lease_seconds=-1)
+    task_queue.claim("worker 2")
+
+    assert not task_queue.complete(task["id"], "worker 1", True)
+    assert not task_queue.heartbeat(task["id"], "worker 1")
+    assert task_queue.fail(task["id"], "worker 1", "error") is None
+    assert statuses(task_queue) == {"alameda/exemptions": "running"}
+
+    assert task_queue.complete(task["id"], "worker 2", True)
+    assert task_queue.results("run", "exemptions") == [True]
+
+
+def test_a_task_out_of_attempts_fails_and_its_dependents_are_skipped(task_queue):
+    task_queue.add_run("run", [
+        {"name": "alameda/requirement:9.5", "kind": "requirement"},
+        {"name": "alameda/exemptions", "kind": "exemptions", "depends_on": ["alameda/requirement:9.5"]},
+        {"name": "alameda/dev_tables", "kind": "dev_tables", "depends_on": ["alameda/exemptions"]},
+        {"name": "butte/exemptions", "kind": "exemptions"},
+    ], max_attempts=2)
+
+    task = task_queue.claim("worker 1")
+    assert task_queue.fail(task["id"], "worker 1", "error 1") == "pending"
+    task = task_queue.claim("worker 1")
+    assert task["name"] == "alameda/requirement:9.5"
+    assert task_queue.fail(task["id"], "worker 1", "error 2") == "failed"
+
+    assert statuses(task_queue) == {"alameda/requirement:9.5": "failed", "alameda/exemptions": "skipped", "alameda/dev_tables": "skipped", "butte/exemptions": "pending"}
+    assert [(name, status) for run_id, name, status, attempts, error in task_queue.unsuccessful_tasks("run")] == [
+        ("alameda/requirement:9.5", "failed"), ("alameda/exemptions", "skipped"), ("alameda/dev_tables", "skipped")]
+    assert task_queue.claim("worker 1")["name"] == "butte/exemptions"
+
+
+def test_retry_returns_failed_and_skipped_tasks_to_the_queue(task_queue):
+    task_queue.add_run("run", [
+        {"name": "alameda/requirement:9.5", "kind": "requirement"},
+        {"name": "alameda/exemptions", "kind": "exemptions", "depends_on": ["alameda/requirement:9.5"]},
+    ], max_attempts=1)
+
+    task = task_queue.claim("worker 1")
+    task_queue.fail(task["id"], "worker 1", "error")
+    assert task_queue.is_finished("run")
+
+    task_queue.retry("run")
+    assert statuses(task_queue) == {"alameda/requirement:9.5": "pending", "alameda/exemptions": "pending"}
+
+    task = task_queue.claim("worker 1")
+    assert task["name"] == "alameda/requirement:9.5"
+    assert task["attempts"] == 1
+    task_queue.complete(task["id"], "worker 1")
+    assert task_queue.claim("worker 1")["name"] == "alameda/exemptions"
+
+
+def test_a_run_that_is_already_in_the_queue_is_not_added_again(task_queue):
+    assert task_queue.add_run("run 1", [{"name": "alameda/exemptions", "kind": "exemptions"}])
+    assert not task_queue.add_run("run 1", [{"name": "butte/exemptions", "kind": "exemptions"}])
+    assert task_queue.add_run("run 2", [{"name": "butte/exemptions", "kind": "exemptions"}])
+    assert task_queue.run_ids() == ["run 1", "run 2"]
+
+    task_queue.delete_run("run 1")
+    assert task_queue.run_ids() == ["run 2"]
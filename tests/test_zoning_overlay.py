@@ -0,0 +1,70 @@
+import numpy as np
+import shapely
+
+import Zoning_Overlay
+
+
+def tabulate(parcels, zoning, codes, threshold=0):
+    parcel_ids = np.arange(1, len(parcels) + 1)
+    ids, result_codes, percents = Zoning_Overlay.tabulate_tile(parcel_ids, np.array(parcels, dtype=object), np.array(zoning, dtype=object), np.array(codes, dtype=object), threshold)
+    return sorted(zip(ids.tolist(), result_codes.tolist(), percents.tolist()))
+
+
+def test_covered_parcels_skip_the_intersection(monkeypatch):
+    def intersection_areas(parcels, zoning):
+        raise AssertionError("covered parcels should not be intersected")
+
+    monkeypatch.setattr(Zoning_Overlay, "intersection_areas", intersection_areas)
+
+    parcels = [shapely.box(0, 0, 10, 10), shapely.box(20, 0, 30, 10)]
+    zoning = [shapely.box(-5, -5, 15, 15), shapely.box(15, -5, 35, 15)]
+
+    assert tabulate(parcels, zoning, ["R1", "C2"]) == [(1, "R1", 100.0), (2, "C2", 100.0)]
+
+
+def test_overlapping_polygons_with_the_same_code_are_unioned():
+    parcels = [shapely.box(0, 0, 10, 10)]
+    # Two R1 polygons cover 0-6 and 4-10 (120% if summed, 100% as a union), a C2 polygon covers 0-2 and an R1 polygon
+    # next to the parcel only touches it.
+    zoning = [shapely.box(0, 0, 6, 10), shapely.box(4, 0, 10, 10), shapely.box(0, 0, 2, 10), shapely.box(10, 0, 20, 10)]
+
+    assert tabulate(parcels, zoning, ["R1", "R1", "C2", "R1"]) == [(1, "C2", 20.0), (1, "R1", 100.0)]
+
+
+def test_percents_are_rounded_before_the_threshold():
+    # 1000 square unit parcels.
+    parcels = [shapely.box(0, 0, 100, 10), shapely.box(0, 20, 100, 30), shapely.box(0, 40, 100, 50)]
+    zoning = [
+        shapely.box(0, 0, 12.34, 10),   # 12.34% -> 12.3
+        shapely.box(0, 20, 4.96, 30),   # 4.96% -> 5.0 (>= 5)
+        shapely.box(0, 40, 4.94, 50),   # 4.94% -> 4.9 (< 5)
+    ]
+
+    assert tabulate(parcels, zoning, ["A", "B", "C"], threshold=5) == [(1, "A", 12.3), (2, "B", 5.0)]
+
+
+def test_parcels_with_no_area_get_no_results():
+    parcels = [shapely.Polygon([(0, 0), (5, 0), (10, 0)]), shapely.Polygon([(0, 5), (20, 5), (30, 5)]), shapely.box(0, 0, 10, 10)]
+    # The first collapsed parcel is covered by the zoning polygon, the second crosses its edge.
+    zoning = [shapely.box(-1, -1, 11, 11)]
+
+    assert tabulate(parcels, zoning, ["R1"]) == [(3, "R1", 100.0)]
+
+
+def test_overlay_reads_parcel_batches_as_tiles_are_sent():
+    zoning = [shapely.box(0, 0, 1000, 100)]
+    read = []
+
+    def parcel_batches():
+        for batch in range(20):
+            read.append(batch)
+            yield np.array([batch]), np.array([shapely.box(batch * 50, 0, batch * 50 + 10, 10)], dtype=object)
+
+    results = Zoning_Overlay.overlay(parcel_batches(), zoning, ["R1"], 0, tile_size=50, workers=2)
+    first = next(results)
+    max_pending = 2 * Zoning_Overlay.max_pending_tiles_per_worker
+    assert len(read) <= max_pending + 1
+
+    results = [first] + list(results)
+    assert sorted(int(ids[0]) for ids, codes, percents in results) == list(range(20))
+    assert all(percents.tolist() == [100.0] for ids, codes, percents in results)